@@ -0,0 +1,137 @@
+import os # for checking the output file
+import sys # for stdin/stdout
+import json # input and output are JSON lines
+import time # for timing each prompt
+import argparse # for command line options
+import threading # output lines are written from the worker threads
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import normalise_prompt
+from debugging import get_logger, fields
+
+log = get_logger("batch")
+
+def read_prompts(f):
+    # YIELDS (id, prompt) FOR EVERY NON-EMPTY LINE: PLAIN TEXT, OR A JSON OBJECT WITH "prompt" AND AN OPTIONAL "id"
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            item = json.loads(line)
+            prompt = item["prompt"]
+            yield str(item.get("id") or normalise_prompt(prompt)), prompt
+        else:
+            yield normalise_prompt(line), line # the same prompt twice only runs once
+
+def completed_ids(path):
+    # RETURNS THE IDS THAT ALREADY HAVE A SUCCESSFUL RESULT IN AN EARLIER OUTPUT FILE, SO A RERUN CAN SKIP THEM
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError: # half-written line from an interrupted run
+                continue
+            if result.get("status") == "ok":
+                done.add(result["id"])
+    return done
+
+class ResultWriter: # appends one JSON line per finished prompt, flushed straight away so an interruption loses nothing finished
+    def __init__(self, f):
+        self.f = f
+        self._lock = threading.Lock()
+        self.ok = 0
+        self.failed = 0
+
+    def write(self, result):
+        line = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self.f.write(line + "\n")
+            self.f.flush()
+            if result["status"] == "ok":
+                self.ok += 1
+            else:
+                self.failed += 1
+
+def run_batch(prompts, writer, concurrency=4, skip=(), fresh=False, streaming=True, size=None):
+    # RUNS generate_playlist FOR EVERY (id, prompt), AT MOST concurrency AT A TIME, WRITING EACH RESULT AS IT FINISHES
+    # clients, caches and the embedding model are process-wide, so every prompt shares them, and concurrent
+    # prompts' embeddings are batched together by the embedding service
+    from pipeline import generate_playlist
+    from semantic_ranker import get_model, encode_texts, EMBEDDING_SOCKET
+    if EMBEDDING_SOCKET:
+        encode_texts(["warmup"]) # the model lives in the shared embedding service, check it answers before starting
+    else:
+        get_model() # load once, up front
+
+    slots = threading.BoundedSemaphore(concurrency) # bounds queued work as well as running work, so huge inputs stream through
+    skipped = 0
+
+    def _run(prompt_id, prompt):
+        start = time.perf_counter()
+        try:
+            tracks = generate_playlist(prompt, streaming=streaming, session_id="batch", fresh=fresh, size=size)
+            writer.write({"id": prompt_id, "prompt": prompt, "status": "ok",
+                          "seconds": round(time.perf_counter() - start, 3), "tracks": tracks})
+        except Exception as e:
+            log.error("Prompt failed", extra=fields(id=prompt_id, error=e))
+            writer.write({"id": prompt_id, "prompt": prompt, "status": "error",
+                          "seconds": round(time.perf_counter() - start, 3), "error": f"{type(e).__name__}: {e}"})
+        finally:
+            slots.release()
+
+    seen = set(skip)
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        try:
+            for prompt_id, prompt in prompts:
+                if prompt_id in seen: # finished in an earlier run, or repeated in this one
+                    skipped += 1
+                    continue
+                seen.add(prompt_id)
+                slots.acquire()
+                ex.submit(_run, prompt_id, prompt)
+        except KeyboardInterrupt: # stop taking new prompts, let the running ones finish and be written
+            log.warning("Interrupted, waiting for running prompts to finish (rerun with the same --output to resume)")
+    log.info("Batch finished", extra=fields(ok=writer.ok, failed=writer.failed, skipped=skipped))
+    return writer.ok, writer.failed, skipped
+
+def main(argv=None):
+    # COMMAND LINE: python batch.py prompts.txt --output playlists.jsonl --concurrency 8
+    parser = argparse.ArgumentParser(description="Generate playlists for a file of prompts, writing one JSON line per prompt.")
+    parser.add_argument("input", nargs="?", default="-", help="prompts file, one per line (plain text or {\"id\", \"prompt\"} JSON), - for stdin")
+    parser.add_argument("--output", "-o", default=None, help="JSONL file to append results to; rerunning with the same file skips finished prompts (default stdout)")
+    parser.add_argument("--concurrency", "-c", type=int, default=4, help="prompts running at the same time")
+    parser.add_argument("--fresh", action="store_true", help="skip the result caches and ask the LLM again for every prompt")
+    parser.add_argument("--no-streaming", action="store_true", help="use the batch pipeline instead of the streaming one")
+    parser.add_argument("--size", type=int, default=None, help="tracks per playlist (default RANK_TOP_K)")
+    args = parser.parse_args(argv)
+
+    skip = completed_ids(args.output) if args.output else set()
+    if skip:
+        log.info("Resuming", extra=fields(already_done=len(skip)))
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout
+    if args.output:
+        out = open(args.output, "a", encoding="utf-8")
+        if out.tell() and not _ends_with_newline(args.output): # an interrupted run may have left half a line
+            out.write("\n")
+    try:
+        _, failed, _ = run_batch(read_prompts(source), ResultWriter(out), args.concurrency, skip, args.fresh, not args.no_streaming, args.size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+if __name__ == "__main__":
+    sys.exit(main())
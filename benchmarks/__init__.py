@@ -0,0 +1 @@
+# benchmarks and local stand-ins for the external APIs, run with "python -m benchmarks.<name>" from the repo root
@@ -0,0 +1,127 @@
+import gc # so freed pools are really gone before memory is read
+import copy # the old flow deep-copies the pool
+import time # for timing
+import pickle # the old flow's session/cache serialisation
+import argparse # for command line options
+import tracemalloc # for per-request memory
+import numpy as np
+
+from benchmarks.fake_data import fake_track
+from candidates import CandidateTable
+from ranking import rank
+from semantic_ranker import artist_ids
+
+class Counts: # track records copied or built during one request
+    def __init__(self):
+        self.deepcopied = 0 # track dicts copied by copy.deepcopy
+        self.built = 0 # track dicts built from a table
+
+def resolved_pool(n, dim, rng):
+    # RETURNS (tracks, embeddings) SHAPED LIKE THE OUTPUT OF stream_resolve_tracks, EVERY STRING ITS OWN OBJECT AS IF PARSED FROM JSON
+    tracks = []
+    for i in range(n):
+        t = fake_track(i % 5000)
+        tracks.append({
+            "artists": ", ".join(t["artists"]), "track": t["name"], "description": t["description"], "ID": t["id"],
+            "spotify_url": f"https://open.spotify.com/track/{t['id']}", "uri": f"spotify:track:{t['id']}",
+            "album_cover": f"https://i.scdn.co/image/{t['id']}{i:08d}", "album_name": t["album"],
+        })
+    return tracks, rng.standard_normal((n, dim)).astype(np.float32)
+
+def _deepcopy(obj, counts):
+    counts.deepcopied += len(obj) if isinstance(obj, list) else 1
+    return copy.deepcopy(obj)
+
+def old_request(tracks, embeddings, query, k, counts, cache):
+    # WHAT THE PIPELINE USED TO DO ON A PROMPT CACHE MISS: COPY THE POOL, RANK BY MUTATING THE DICTS,
+    # DEEP-COPY THE POOL INTO THE PROMPT CACHE AND THE PLAYLIST OUT OF THE RESULT CACHE
+    pool = _deepcopy(tracks, counts) # ranking adds scores to the tracks, keep a clean copy of the pool
+    vectors = np.vstack([query[None, :], embeddings])
+    indices, scores = rank(vectors[0], vectors[1:], k=k, artist_ids=artist_ids([t["artists"] for t in tracks]))
+    top = []
+    for i, score in zip(indices, scores):
+        tracks[i]["similarity_score"] = float(score)
+        top.append(tracks[i])
+    cache["pool"] = (_deepcopy(pool, counts), np.asarray(embeddings, dtype=np.float32))
+    cache["result"] = top
+    return _deepcopy(top, counts)
+
+def old_hit(query, k, counts, cache):
+    # WHAT A PROMPT CACHE HIT USED TO DO: DEEP-COPY THE STORED POOL OUT, THEN RANK IT
+    tracks, embeddings = cache["pool"]
+    tracks = _deepcopy(tracks, counts)
+    vectors = np.vstack([query[None, :], embeddings])
+    indices, scores = rank(vectors[0], vectors[1:], k=k, artist_ids=artist_ids([t["artists"] for t in tracks]))
+    top = []
+    for i, score in zip(indices, scores):
+        tracks[i]["similarity_score"] = float(score)
+        top.append(tracks[i])
+    return top
+
+def new_request(tracks, embeddings, query, k, counts, cache):
+    # THE CURRENT FLOW: ONE COLUMNAR TABLE SHARED BY THE PROMPT CACHE, RANKED INTO A VIEW, ONLY THE TOP k BUILT AS DICTS
+    table = CandidateTable.from_tracks(tracks, embeddings)
+    indices, scores = rank(query, table.embeddings, k=k, artist_ids=artist_ids(table.columns["artists"]))
+    top = table.take(indices, scores)
+    cache["pool"] = table
+    cache["result"] = top.to_dicts()
+    counts.built += len(top)
+    return _deepcopy(cache["result"], counts)
+
+def new_hit(query, k, counts, cache):
+    table = cache["pool"]
+    indices, scores = rank(query, table.embeddings, k=k, artist_ids=artist_ids(table.columns["artists"]))
+    top = table.take(indices, scores).to_dicts()
+    counts.built += len(top)
+    return top
+
+def measure(flow, hit, n, dim, k, rng):
+    # RETURNS (peak MB during the request, MB still held by the caches afterwards, counts on a miss, counts on a hit, ms per miss)
+    query = rng.standard_normal(dim).astype(np.float32)
+    gc.collect()
+    tracemalloc.start()
+    tracks, embeddings = resolved_pool(n, dim, rng) # the resolution stages' output is part of the request
+    counts, cache = Counts(), {}
+    start = time.perf_counter()
+    flow(tracks, embeddings, query, k, counts, cache)
+    elapsed = time.perf_counter() - start
+    del tracks, embeddings # only what the caches hold outlives the request
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    hit_counts = Counts()
+    hit(query, k, hit_counts, cache)
+    return peak / 2**20, held / 2**20, counts, hit_counts, elapsed * 1000, cache
+
+def serialisation(old_pool, table):
+    # RETURNS ((old bytes, old ms), (new bytes, new ms)) FOR A DUMP AND LOAD OF THE POOL
+    results = []
+    for dump, load, pool in ((pickle.dumps, pickle.loads, old_pool), (CandidateTable.to_bytes, CandidateTable.from_bytes, table)):
+        start = time.perf_counter()
+        data = dump(pool)
+        load(data)
+        results.append((len(data), (time.perf_counter() - start) * 1000))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare per-track dict pools with the columnar candidate table: memory, copies and serialisation per request.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[35, 1000, 10000], help="candidates per request")
+    parser.add_argument("--dim", type=int, default=384, help="embedding size (bge-small is 384)")
+    parser.add_argument("--k", type=int, default=20, help="playlist length")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    for n in args.sizes:
+        old_peak, old_held, old_counts, old_hit_counts, old_ms, old_cache = measure(old_request, old_hit, n, args.dim, args.k, rng)
+        new_peak, new_held, new_counts, new_hit_counts, new_ms, new_cache = measure(new_request, new_hit, n, args.dim, args.k, rng)
+        (old_bytes, old_ser), (new_bytes, new_ser) = serialisation(old_cache["pool"], new_cache["pool"])
+        print(f"\n[RESULT] {n} candidates, k={args.k}")
+        print(f"[RESULT]   dicts : peak {old_peak:7.2f} MB  held {old_held:7.2f} MB  miss {old_ms:7.2f} ms  "
+              f"track copies per miss {old_counts.deepcopied:>6}  per prompt-cache hit {old_hit_counts.deepcopied:>6}  "
+              f"serialised {old_bytes / 2**20:6.2f} MB in {old_ser:6.2f} ms")
+        print(f"[RESULT]   table : peak {new_peak:7.2f} MB  held {new_held:7.2f} MB  miss {new_ms:7.2f} ms  "
+              f"track copies per miss {new_counts.deepcopied + new_counts.built:>6}  per prompt-cache hit {new_hit_counts.built:>6}  "
+              f"serialised {new_bytes / 2**20:6.2f} MB in {new_ser:6.2f} ms")
+
+if __name__ == "__main__":
+    main()
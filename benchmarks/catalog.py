@@ -0,0 +1,70 @@
+import time # for timing
+import random # for spelling variants
+import argparse # for command line options
+import tempfile # throwaway catalog file
+import os
+import statistics # for medians
+
+from benchmarks.fake_data import fake_track, CATALOGUE_SIZE
+
+def slim(t):
+    # RETURNS A FAKE CATALOGUE ENTRY IN THE SLIM SHAPE spotify_client STORES
+    return {"name": t["name"], "artists": ", ".join(t["artists"]), "spotify_url": f"https://open.spotify.com/track/{t['id']}",
+            "uri": f"spotify:track:{t['id']}", "album_cover": None, "album_name": t["album"]}
+
+def variant(t, kind, rng):
+    # RETURNS (artists, title) THE WAY AN LLM MIGHT SPELL A KNOWN TRACK
+    artists, title = ", ".join(t["artists"]), t["name"]
+    if kind == "exact":
+        return artists, title
+    if kind == "case":
+        return artists.upper(), title.lower() + "!"
+    if kind == "feat":
+        return t["artists"][0], f"{title} (feat. Someone Else)"
+    if kind == "typo": # one dropped letter in the title
+        i = rng.randrange(len(title) - 1)
+        return artists, title[:i] + title[i + 1:]
+    raise ValueError(kind)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the local catalog's resolution rate, accuracy and lookup latency.")
+    parser.add_argument("--tracks", type=int, default=2000, help="tracks in the catalog")
+    parser.add_argument("--lookups", type=int, default=2000, help="lookups per spelling kind")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from catalog import TrackCatalog
+    rng = random.Random(args.seed)
+    cat = TrackCatalog(os.path.join(tempfile.mkdtemp(), "catalog.sqlite3"))
+    known = rng.sample(range(CATALOGUE_SIZE), args.tracks)
+    start = time.perf_counter()
+    for i in known:
+        cat.add(fake_track(i)["id"], slim(fake_track(i)))
+    print(f"[RESULT] Built catalog of {args.tracks} tracks in {time.perf_counter() - start:.2f}s")
+
+    unknown = [i for i in range(CATALOGUE_SIZE) if i not in set(known)]
+    for kind in ("exact", "case", "feat", "typo", "unknown"):
+        correct = wrong = missed = 0
+        timings = []
+        for _ in range(args.lookups):
+            if kind == "unknown": # a track the catalog has never seen should go to Spotify
+                t = fake_track(rng.choice(unknown))
+                artists, title = ", ".join(t["artists"]), t["name"]
+            else:
+                t = fake_track(rng.choice(known))
+                artists, title = variant(t, kind, rng)
+            begin = time.perf_counter()
+            match = cat.resolve(artists, title)
+            timings.append(time.perf_counter() - begin)
+            if match is None:
+                missed += 1
+            elif match[0] == t["id"]:
+                correct += 1
+            else:
+                wrong += 1
+        print(f"[RESULT] {kind:<8} resolved locally {correct / args.lookups:6.1%}  wrong {wrong / args.lookups:5.1%}  "
+              f"sent to Spotify {missed / args.lookups:6.1%}  median lookup {statistics.median(timings) * 1e6:7.1f} us")
+    print(f"[RESULT] {cat.stats()}")
+
+if __name__ == "__main__":
+    main()
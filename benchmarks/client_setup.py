@@ -0,0 +1,68 @@
+import os # for pointing the clients at the local servers
+import time # for timing
+import argparse # for command line options
+import tempfile # throwaway cache folder
+import statistics # for medians
+
+from benchmarks.fake_groq import FakeGroqServer
+from benchmarks.fake_spotify import FakeSpotifyServer
+
+def per_request_spotify_old():
+    # WHAT EVERY REQUEST USED TO DO: RELOAD .env, NEW CREDENTIALS MANAGER (FRESH TOKEN), NEW SESSION, COLD CONNECTION
+    import spotipy
+    from dotenv import load_dotenv
+    from spotipy.oauth2 import SpotifyClientCredentials
+    from spotipy.cache_handler import MemoryCacheHandler
+
+    load_dotenv()
+    auth_manager = SpotifyClientCredentials(client_id=os.getenv("CLIENT_ID"), client_secret=os.getenv("CLIENT_SECRET"),
+                                            cache_handler=MemoryCacheHandler())
+    auth_manager.OAUTH_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL")
+    sp = spotipy.Spotify(auth_manager=auth_manager)
+    sp.prefix = os.getenv("SPOTIFY_API_URL")
+    return sp
+
+def per_request_groq_old():
+    from groq import Groq
+    from dotenv import load_dotenv
+    load_dotenv()
+    return Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+def time_requests(get_spotify, get_groq, requests):
+    # RETURNS THE MEDIAN TIME OF "SET UP CLIENTS + ONE SEARCH + ONE CHAT CALL"
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        sp = get_spotify()
+        sp.search(q=f"Artist Song {i}", limit=1, type="track", market="US")
+        gr = get_groq()
+        gr.chat.completions.create(model="fake", messages=[{"role": "user", "content": "EXACTLY 1 tracks"}])
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare per-request client setup cost: new clients per run vs shared pooled clients.")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--token-latency", type=float, default=0.1, help="simulated accounts.spotify.com round trip")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp())
+    with FakeSpotifyServer(latency=0.0, token_latency=args.token_latency) as spotify, \
+         FakeGroqServer(first_token_latency=0.0, chunk_delay=0.0) as groq:
+        os.environ.update(spotify.environ())
+        os.environ.update({"GROQ_API_KEY": "fake", "GROQ_BASE_URL": groq.url})
+
+        from spotify_client import get_spotify_client
+        from groq_client import get_groq_client
+
+        time_requests(get_spotify_client, get_groq_client, 1) # first request pays the one-off setup
+        time.sleep(0.2) # let the background token refresh finish
+        pooled = time_requests(get_spotify_client, get_groq_client, args.requests)
+        fresh = time_requests(per_request_spotify_old, per_request_groq_old, args.requests)
+
+    print(f"[RESULT] new clients per request: {fresh * 1000:.1f} ms median per request")
+    print(f"[RESULT] shared pooled clients:   {pooled * 1000:.1f} ms median per request")
+    print(f"[RESULT] per-request setup cost removed: {(fresh - pooled) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
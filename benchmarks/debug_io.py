@@ -0,0 +1,91 @@
+import os # for the artifact folder
+import sys # results go to stdout while logs are discarded
+import json
+import time # for timing
+import argparse # for command line options
+import tempfile # throwaway artifact folder
+import statistics # for medians
+import contextlib # for sending stdout to /dev/null
+
+from benchmarks.fake_data import fake_track
+
+def pipeline_track(t):
+    # RETURNS A FAKE CATALOGUE ENTRY SHAPED LIKE A RESOLVED PIPELINE TRACK
+    return {"artists": ", ".join(t["artists"]), "track": t["name"], "description": t["description"], "ID": t["id"],
+            "spotify_url": f"https://open.spotify.com/track/{t['id']}", "uri": f"spotify:track:{t['id']}",
+            "album_cover": None, "album_name": t["album"]}
+
+def request_old(tracks, folder, out):
+    # WHAT EVERY REQUEST USED TO DO: PRETTY-PRINT WHOLE DATASETS, LOG EVERY TRACK AND WRITE 4 JSON FILES BEFORE CARRYING ON
+    def save(output, filename):
+        print(f"[INFO] Writing JSON output to {filename}", file=out)
+        with open(os.path.join(folder, filename), "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+
+    data = {"tracks": tracks}
+    print(json.dumps(data, indent=2), file=out) # LLM result
+    save(data, "initial_candidate_tracks.json")
+    for t in tracks: # search and fetch workers
+        print(f"\n[STEP] SEARCHING SPOTIFY FOR TRACK: {t['track']} BY {t['artists']}", file=out)
+        print(f"[INFO] Searching for: {t['track']} by {t['artists']}...", file=out)
+        print("[INFO] Found 1 result(s). Extracting track ID...", file=out)
+        print(f"\n[RESULT] Track search completed successfully, obtained ID: {t['ID']}", file=out)
+        print("[INFO] Adding ID to JSON...", file=out)
+    print(json.dumps(data, indent=2), file=out)
+    save(data, "candidate_tracks_with_ids.json")
+    for t in tracks:
+        print(f"[INFO] Retrieved data for track {t['ID']}!", file=out)
+        print("[INFO] Updating Track data from Spotify...", file=out)
+        print(f"[INFO] Updated {t['artists']} - {t['track']}", file=out)
+    save(data, "final_candidate_tracks.json")
+    print(json.dumps(tracks[:20], indent=2), file=out) # ranked tracks
+    save(tracks[:20], "ranked_tracks.json")
+
+def request_new(tracks, debugging):
+    # WHAT A REQUEST DOES NOW: A FEW INFO LINES, PER-TRACK LINES ONLY AT DEBUG, ARTIFACTS QUEUED (OR SKIPPED)
+    log = debugging.get_logger("benchmark")
+    fields = debugging.fields
+    debugging.new_request()
+    data = {"tracks": tracks}
+    log.info("Streamed tracks", extra=fields(tracks=len(tracks), invalid=0))
+    debugging.save(data, "initial_candidate_tracks.json")
+    for t in tracks:
+        log.debug("Search cache hit", extra=fields(track=t["track"], artists=t["artists"], id=t["ID"]))
+        log.debug("Updated track data from Spotify", extra=fields(track=t["track"], artists=t["artists"]))
+    log.info("Resolved tracks", extra=fields(found=len(tracks), total=len(tracks)))
+    debugging.save(data, "final_candidate_tracks.json")
+    log.info("Successfully ranked tracks", extra=fields(candidates=len(tracks), picked=20))
+    debugging.save(tracks[:20], "ranked_tracks.json")
+
+def timed(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the per-request logging and debug-dump cost before and after structured logging.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[35, 500, 2000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    import debugging
+    folder = tempfile.mkdtemp()
+    debugging.artifact_writer.folder = folder
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+        debugging._handler.setStream(devnull) # measure the formatting, not the terminal
+        for size in args.sizes:
+            tracks = [pipeline_track(fake_track(i)) for i in range(size)]
+            old = timed(lambda: request_old(tracks, folder, devnull), args.repeats)
+            debugging.DEBUG_ARTIFACTS = False
+            new = timed(lambda: request_new(tracks, debugging), args.repeats)
+            debugging.DEBUG_ARTIFACTS = True
+            queued = timed(lambda: request_new(tracks, debugging), args.repeats)
+            debugging.artifact_writer.flush()
+            print(f"[RESULT] {size:>5} tracks: old {old * 1000:8.2f} ms/request, new {new * 1000:6.3f} ms/request, "
+                  f"new with DEBUG_ARTIFACTS=1 {queued * 1000:7.2f} ms/request on the request thread", file=sys.stdout)
+
+if __name__ == "__main__":
+    main()
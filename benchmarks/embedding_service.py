@@ -0,0 +1,86 @@
+import os # for the socket path
+import sys # for launching the remote service
+import time # for timing
+import argparse # for command line options
+import tempfile # for the socket path
+import threading # simulated concurrent users
+import subprocess # the remote service runs in its own process
+import numpy as np
+
+from benchmarks.fake_data import fake_track
+
+def request_texts(user, i, size):
+    # RETURNS THE TEXTS ONE PIPELINE RUN WOULD ENCODE (QUERY + CANDIDATES), UNIQUE PER REQUEST SO NOTHING IS CACHED
+    texts = [f"Songs that match the vibe of request {user}-{i}"]
+    for j in range(size):
+        t = fake_track((user * 7919 + i * 104729 + j) % 5000)
+        texts.append(f"{t['name']} by {', '.join(t['artists'])} - {t['description']} ({user}-{i}-{j})")
+    return texts
+
+def run_load(encode, users, requests_per_user, size):
+    # RUNS users THREADS THAT EACH MAKE requests_per_user ENCODE CALLS, RETURNS (throughput texts/s, p50, p95 latency)
+    latencies = []
+    lock = threading.Lock()
+
+    def user(u):
+        for i in range(requests_per_user):
+            texts = request_texts(u, i, size)
+            start = time.perf_counter()
+            encode(texts)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(u,)) for u in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    texts = users * requests_per_user * (size + 1)
+    return texts / elapsed, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare per-call model.encode with the micro-batching embedding service under concurrent users.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=5, help="encode calls per user")
+    parser.add_argument("--size", type=int, default=35, help="candidate descriptions per call")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--remote", action="store_true", help="also benchmark the service running in a separate process over a unix socket")
+    args = parser.parse_args(argv)
+
+    from semantic_ranker import get_model
+    from embedding_service import EmbeddingService, RemoteEmbeddingClient
+    model = get_model()
+    service = EmbeddingService(lambda texts: model.encode(texts, convert_to_numpy=True, batch_size=args.max_batch_size),
+                               max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    modes = {
+        "per-call": lambda texts: model.encode(texts, convert_to_numpy=True), # what every session did before
+        "batched": service.encode,
+    }
+
+    remote = None
+    if args.remote:
+        socket_path = os.path.join(tempfile.mkdtemp(), "embeddings.sock")
+        remote = subprocess.Popen([sys.executable, "embedding_service.py", "serve", "--socket", socket_path,
+                                   "--max-batch-size", str(args.max_batch_size), "--max-wait-ms", str(args.max_wait_ms)])
+        while not os.path.exists(socket_path): # wait for the model to load and the socket to appear
+            if remote.poll() is not None:
+                raise SystemExit("[ERROR] Remote embedding service failed to start")
+            time.sleep(0.1)
+        modes["remote"] = RemoteEmbeddingClient(socket_path).encode
+
+    try:
+        modes["per-call"](request_texts(0, 0, args.size)) # warm up
+        for users in args.users:
+            for name, encode in modes.items():
+                throughput, p50, p95 = run_load(encode, users, args.requests, args.size)
+                print(f"[RESULT] users={users:<3} {name:>8}: {throughput:8.0f} texts/s, p50 {p50 * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms")
+        print(f"[RESULT] batcher stats: {service.stats()}")
+    finally:
+        if remote:
+            remote.terminate()
+
+if __name__ == "__main__":
+    main()
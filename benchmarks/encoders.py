@@ -0,0 +1,112 @@
+import os # for the child processes' settings
+import sys # for running scenarios in child processes
+import json # scenario config and results go through the command line and stdout
+import time # for timing
+import argparse # for command line options
+import tempfile # embeddings are handed back to the parent as .npy files
+import subprocess # each backend loads in a fresh process, so import time and memory start from zero
+import numpy as np
+
+from benchmarks.fake_data import fake_track
+
+MAX_DRIFT = {"onnx": 1e-4, "onnx-int8": 0.02} # largest 1 - cosine(backend, torch) allowed per text
+
+def track_texts(count):
+    # RETURNS count TEXTS FORMATTED LIKE semantic_ranker.track_text
+    return [f"{t['name']} by {', '.join(t['artists'])} - {t['description']}" for t in map(fake_track, range(count))]
+
+def rss_mb():
+    # RETURNS THE CURRENT RESIDENT MEMORY OF THIS PROCESS
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def run_scenario(config):
+    # LOADS ONE BACKEND, TIMES ENCODING AND SAVES THE EMBEDDINGS FOR THE PARITY CHECK
+    before = rss_mb()
+    start = time.perf_counter()
+    from encoders import load_encoder
+    model = load_encoder(config["model"], config["backend"], config["threads"])
+    load = time.perf_counter() - start
+    loaded = rss_mb()
+
+    texts = track_texts(config["texts"])
+    model.encode(texts[:config["batch_size"]], convert_to_numpy=True, batch_size=config["batch_size"]) # warm up
+    start = time.perf_counter()
+    vectors = model.encode(texts, convert_to_numpy=True, batch_size=config["batch_size"])
+    encode = time.perf_counter() - start
+    single = []
+    for text in texts[:50]: # one prompt at a time, like the query embedding of a request
+        t = time.perf_counter()
+        model.encode([text], convert_to_numpy=True, batch_size=1)
+        single.append(time.perf_counter() - t)
+    np.save(config["output"], np.asarray(vectors, dtype=np.float32))
+    return {"load_s": load, "load_mb": loaded - before, "rss_mb": rss_mb(), "texts_per_s": len(texts) / encode,
+            "single_ms": float(np.median(single) * 1000)}
+
+def launch(config, env=None):
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.encoders", "--scenario", json.dumps(config)],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Scenario failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def parity(reference, vectors, k=20, queries=20):
+    # RETURNS (mean drift, max drift, share of the top k kept) OF ONE BACKEND'S EMBEDDINGS AGAINST THE REFERENCE ONES
+    a = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    b = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    drift = 1 - (a * b).sum(axis=1)
+    overlap = []
+    for q in range(queries): # rank the other texts against text q, as if it were the prompt
+        top_a = set(np.argsort(-(a @ a[q]))[1:k + 1])
+        top_b = set(np.argsort(-(b @ b[q]))[1:k + 1])
+        overlap.append(len(top_a & top_b) / k)
+    return float(drift.mean()), float(drift.max()), float(np.mean(overlap))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the embedding backends: load time, memory, encode throughput and drift from the torch model.")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5"))
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"], help="torch comes first, it is the reference for drift")
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}), help="intra-op thread counts to try")
+    parser.add_argument("--texts", type=int, default=1000, help="track texts encoded per run")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--scenario", default=None, help=argparse.SUPPRESS) # used internally to run one backend
+    args = parser.parse_args(argv)
+
+    if args.scenario:
+        print(json.dumps(run_scenario(json.loads(args.scenario))))
+        return 0
+
+    env = {**os.environ, "CACHE_DIR": os.getenv("CACHE_DIR", tempfile.mkdtemp(prefix="playlist-encoders-")), "LOG_LEVEL": "WARNING"}
+    folder = tempfile.mkdtemp(prefix="playlist-encoders-out-")
+    for backend in args.backends: # exporting is a one-off, so it's timed apart from loading
+        if backend != "torch":
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", f"from encoders import export_onnx; export_onnx({args.model!r}, quantized={backend == 'onnx-int8'})"],
+                           env=env, check=True, capture_output=True)
+            print(f"[RESULT] {backend}: export {time.perf_counter() - start:.1f}s (once per model, cached under CACHE_DIR/onnx)")
+
+    print(f"\n[RESULT] {args.model}, {args.texts} texts, batch {args.batch_size}")
+    vectors, failed = {}, False
+    for backend in args.backends:
+        for threads in args.threads:
+            output = os.path.join(folder, f"{backend}-{threads}.npy")
+            r = launch({"model": args.model, "backend": backend, "threads": threads, "texts": args.texts,
+                        "batch_size": args.batch_size, "output": output}, env)
+            vectors.setdefault(backend, np.load(output))
+            print(f"[RESULT] {backend:<9} threads={threads}: load {r['load_s']:5.2f}s  +{r['load_mb']:5.0f} MB (RSS {r['rss_mb']:5.0f} MB)  "
+                  f"{r['texts_per_s']:7.1f} texts/s  single text {r['single_ms']:6.2f} ms")
+
+    if "torch" in vectors:
+        print()
+        for backend, v in vectors.items():
+            if backend == "torch":
+                continue
+            mean, worst, overlap = parity(vectors["torch"], v)
+            ok = worst <= MAX_DRIFT.get(backend, 0)
+            failed |= not ok
+            print(f"[RESULT] {backend:<9} drift from torch: mean {mean:.2e}  max {worst:.2e} (limit {MAX_DRIFT.get(backend, 0):.0e}) "
+                  f"{'ok' if ok else 'TOO HIGH'}  top-20 overlap {overlap:.1%}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
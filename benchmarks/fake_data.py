@@ -0,0 +1,59 @@
+import random # for the synthetic catalogue and latency sampling
+import hashlib # for stable per-prompt seeds
+
+# words used to build synthetic track names and descriptions
+_WORDS = (
+    "midnight neon velvet golden broken electric summer winter city ocean river fire ghost dream "
+    "heart shadow silver wild quiet loud lonely endless faded bright slow rush drive dance cry "
+    "letters highway rooftop satellite paper diamond thunder echo mirror garden"
+).split()
+_MOODS = (
+    "A moody late-night anthem|A euphoric festival banger|A slow-burning heartbreak ballad|"
+    "A hazy lo-fi daydream|A swaggering trap flex|A bittersweet indie singalong|A cinematic synth-pop confession"
+).split("|")
+_THEMES = (
+    "about chasing city lights|about letting go of an old love|about feeling invincible|"
+    "about quiet mornings after chaos|about growing up too fast|about driving with nowhere to be"
+).split("|")
+
+CATALOGUE_SIZE = 5000 # number of distinct fake tracks
+
+def fake_track(i):
+    # RETURNS THE SYNTHETIC CATALOGUE ENTRY WITH INDEX i (THE SAME ON EVERY RUN)
+    rng = random.Random(i)
+    return {
+        "id": f"fake{i:018d}"[:22], # Spotify IDs are 22 characters
+        "artists": [f"Artist {rng.randrange(CATALOGUE_SIZE // 10)}"] + ([f"Artist {rng.randrange(CATALOGUE_SIZE // 10)}"] if rng.random() < 0.2 else []),
+        "name": " ".join(rng.choice(_WORDS).title() for _ in range(rng.randint(1, 3))) + f" {i}",
+        "album": f"Album {i // 10}",
+        "description": f"{rng.choice(_MOODS)} {rng.choice(_THEMES)}.",
+    }
+
+def prompt_seed(text):
+    # RETURNS A STABLE INTEGER SEED FOR A PROMPT
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+
+def sample_latency(spec, rng):
+    # RETURNS ONE LATENCY IN SECONDS FROM A SPEC:
+    #   0.2                      -> constant
+    #   ("uniform", lo, hi)      -> uniform between lo and hi
+    #   ("lognormal", median, s) -> lognormal with the given median and sigma (long tail, like real APIs)
+    #   ("choice", [a, b, ...])  -> one of the values
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    kind = spec[0]
+    if kind == "uniform":
+        return rng.uniform(spec[1], spec[2])
+    if kind == "lognormal":
+        import math
+        return rng.lognormvariate(math.log(spec[1]), spec[2])
+    if kind == "choice":
+        return rng.choice(spec[1])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+def parse_latency(text):
+    # PARSES A COMMAND LINE LATENCY SPEC, E.G. "0.2", "uniform:0.1,0.5" OR "lognormal:0.2,0.6"
+    if ":" not in text:
+        return float(text)
+    kind, args = text.split(":", 1)
+    return (kind, *[float(a) for a in args.split(",")])
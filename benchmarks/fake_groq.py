@@ -0,0 +1,144 @@
+import re # for reading the requested track count from the prompt
+import json # for request and response bodies
+import time # for simulated latency
+import random # for picking tracks and errors
+import threading # the server runs on a background thread
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from benchmarks.fake_data import fake_track, prompt_seed, sample_latency, CATALOGUE_SIZE
+
+class FakeGroqServer: # local stand-in for Groq's OpenAI-compatible chat completions endpoint, streaming and non-streaming
+    def __init__(self, first_token_latency=0.3, chunk_delay=0.01, chunk_chars=24, error_rate=0.0, malformed_rate=0.0,
+                 rate_limit_rate=0.0, models=None, seed=0):
+        # latencies can be a number or a spec understood by fake_data.sample_latency
+        self.defaults = {
+            "first_token_latency": first_token_latency, # time before the first token (or the whole response)
+            "chunk_delay": chunk_delay, # time between streamed chunks, so generation time grows with output length
+            "chunk_chars": chunk_chars, # characters per streamed chunk (roughly a few tokens)
+            "error_rate": error_rate, # fraction of requests that fail with a 500
+            "malformed_rate": malformed_rate, # fraction of responses that are not valid JSON for the schema
+            "rate_limit_rate": rate_limit_rate, # fraction of requests rejected with a 429
+        }
+        self.models = models or {} # per-model overrides of the defaults, e.g. {"slow-model": {"first_token_latency": 3}}
+        self.rng = random.Random(seed)
+        self.calls = {} # model -> number of requests
+        self._lock = threading.Lock()
+        self._server = None
+
+    def settings(self, model):
+        return {**self.defaults, **self.models.get(model, {})}
+
+    def completion_text(self, body):
+        # BUILDS THE JSON THE MODEL WOULD RETURN FOR A REQUEST
+        messages = body.get("messages", [])
+        prompt = "\n".join(m.get("content", "") for m in messages)
+        match = re.search(r"EXACTLY (\d+) tracks", prompt)
+        count = int(match.group(1)) if match else 35
+        rng = random.Random(prompt_seed(prompt + str(body.get("temperature"))))
+        picks = rng.sample(range(CATALOGUE_SIZE), min(count, CATALOGUE_SIZE))
+        tracks = []
+        for i in picks:
+            t = fake_track(i)
+            tracks.append({"artists": ", ".join(t["artists"]), "track": t["name"], "description": t["description"]})
+        return json.dumps({"tracks": tracks}, indent=2)
+
+    def start(self):
+        # STARTS THE SERVER ON A FREE LOCAL PORT AND RETURNS ITS BASE URL
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real API
+            disable_nagle_algorithm = True # send small responses straight away instead of waiting on delayed ACKs
+
+            def log_message(self, *args): # keep benchmark output quiet
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": "not found"}})
+                model = body.get("model", "")
+                s = fake.settings(model)
+                with fake._lock:
+                    fake.calls[model] = fake.calls.get(model, 0) + 1
+                    roll = fake.rng.random()
+                    first_latency = sample_latency(s["first_token_latency"], fake.rng)
+                    chunk_delay = sample_latency(s["chunk_delay"], fake.rng)
+
+                if roll < s["rate_limit_rate"]:
+                    return self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"Retry-After": "1"})
+                if roll < s["rate_limit_rate"] + s["error_rate"]:
+                    time.sleep(first_latency)
+                    return self._send_json(500, {"error": {"message": "simulated server error"}})
+
+                text = fake.completion_text(body)
+                if roll < s["rate_limit_rate"] + s["error_rate"] + s["malformed_rate"]:
+                    text = text[: len(text) // 2] # truncated JSON, like a model that stopped early
+                chunks = [text[i:i + s["chunk_chars"]] for i in range(0, len(text), s["chunk_chars"])]
+                created = int(time.time())
+                time.sleep(first_latency)
+
+                if not body.get("stream"):
+                    time.sleep(chunk_delay * len(chunks)) # non-streaming calls still pay for every generated token
+                    return self._send_json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": len(chunks), "total_tokens": len(chunks)},
+                    })
+
+                self.send_response(200) # server-sent events, one chunk at a time
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send_event(payload):
+                    data = f"data: {payload}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+
+                try:
+                    for i, chunk in enumerate(chunks):
+                        if i:
+                            time.sleep(chunk_delay)
+                        send_event(json.dumps({
+                            "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                            "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}],
+                        }))
+                    send_event(json.dumps({
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    }))
+                    send_event("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n") # end of chunked body
+                except (BrokenPipeError, ConnectionResetError): # the client stopped reading, e.g. a cancelled hedge
+                    self.close_connection = True
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,231 @@
+import re # for routing and reading track numbers out of search queries
+import math # for whole-second Retry-After values
+import json # for response bodies
+import time # for simulated latency
+import random # for latency sampling
+import threading # the server runs on a background thread
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from benchmarks.fake_data import fake_track, sample_latency, CATALOGUE_SIZE
+
+class FakeSpotifyServer: # local stand-in for the Spotify accounts and Web API endpoints the app uses
+    def __init__(self, latency=0.05, token_latency=0.1, miss_rate=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 rate_limit=None, burst=None, retry_after=1, latencies=None, stall_rate=0.0, stall=8.0, lost_response_rate=0.0, seed=0):
+        # latencies can be a number or a spec understood by fake_data.sample_latency
+        self.latency = {"default": latency, **(latencies or {})} # per-endpoint latency, e.g. {"search": ..., "track": ...}
+        self.token_latency = token_latency # time to issue an access token (a round trip to accounts.spotify.com)
+        self.miss_rate = miss_rate # fraction of searches that find nothing
+        self.error_rate = error_rate # fraction of API requests that fail with a 503
+        self.rate_limit_rate = rate_limit_rate # fraction of API requests rejected with a 429 at random
+        self.rate_limit = rate_limit # requests per second the app is allowed, beyond which requests get a 429 (None for no limit)
+        self.burst = burst or (rate_limit or 0) * 2 # requests that can go over the rate in a short burst
+        self.retry_after = retry_after # seconds sent in Retry-After with random 429s
+        self.stall_rate = stall_rate # fraction of API requests that hang for stall seconds (past the client's read timeout by default)
+        self.stall = stall
+        self.lost_response_rate = lost_response_rate # fraction of playlist adds that are applied but answered with a 503, so a retry repeats them
+        self.rng = random.Random(seed)
+        self.calls = {} # endpoint -> number of requests (including rejected ones)
+        self.rejected = {} # status -> number of requests answered with an error
+        self.playlists = {} # playlist id -> {"name", "description", "items"}
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _count(self, endpoint):
+        # RECORDS A CALL AND RETURNS (latency, error status or None, Retry-After or None, random roll)
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            spec = self.latency.get(endpoint, self.latency["default"])
+            delay, roll = sample_latency(spec, self.rng), self.rng.random()
+            if self.rng.random() < self.stall_rate:
+                delay = self.stall
+            status, retry_after = None, None
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_limit)
+                self._last_refill = now
+                if self._tokens < 1:
+                    status, retry_after = 429, math.ceil((1 - self._tokens) / self.rate_limit)
+                else:
+                    self._tokens -= 1
+            if status is None and roll < self.rate_limit_rate:
+                status, retry_after = 429, self.retry_after
+            elif status is None and roll < self.rate_limit_rate + self.error_rate:
+                status = 503
+            if status:
+                self.rejected[status] = self.rejected.get(status, 0) + 1
+            return delay, status, retry_after, self.rng.random()
+
+    def _error(self, status, retry_after):
+        headers = {"Retry-After": str(retry_after)} if retry_after else {}
+        message = "API rate limit exceeded" if status == 429 else "Service unavailable"
+        return status, {"error": {"status": status, "message": message}}, headers
+
+    def track_object(self, i):
+        # RETURNS A GET TRACK RESPONSE FOR CATALOGUE ENTRY i
+        t = fake_track(i)
+        return {
+            "id": t["id"],
+            "name": t["name"],
+            "uri": f"spotify:track:{t['id']}",
+            "artists": [{"name": a} for a in t["artists"]],
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{t['id']}"},
+            "album": {"name": t["album"], "images": [{"url": f"https://i.scdn.co/image/{t['id']}", "width": 640}]},
+        }
+
+    def handle(self, method, path, query, body):
+        # ROUTES A REQUEST AND RETURNS (status, payload, headers)
+        if path.endswith("/api/token"):
+            time.sleep(sample_latency(self.token_latency, self.rng))
+            self._count("token")
+            return 200, {"access_token": "fake-token", "token_type": "Bearer", "expires_in": 3600}, {}
+
+        if method == "GET" and path.endswith("/search"):
+            delay, status, retry_after, roll = self._count("search")
+            if status == 429: # rejected straight away, like the real API
+                return self._error(status, retry_after)
+            time.sleep(delay)
+            if status:
+                return self._error(status, retry_after)
+            numbers = re.findall(r"\d+", query.get("q", [""])[0])
+            items = []
+            if numbers and roll >= self.miss_rate and int(numbers[-1]) < CATALOGUE_SIZE: # fake track names end with their index
+                items = [self.track_object(int(numbers[-1]))]
+            return 200, {"tracks": {"items": items, "total": len(items)}}, {}
+
+        match = re.search(r"/tracks/fake0*(\d+)$", path)
+        if method == "GET" and match:
+            delay, status, retry_after, _ = self._count("track")
+            if status == 429:
+                return self._error(status, retry_after)
+            time.sleep(delay)
+            if status:
+                return self._error(status, retry_after)
+            return 200, self.track_object(int(match.group(1))), {}
+
+        if method == "GET" and path.endswith("/me"):
+            return 200, {"id": "fake-user", "display_name": "Fake User"}, {}
+
+        if method == "POST" and path.endswith("/me/playlists"):
+            delay, status, retry_after, _ = self._count("playlist_create")
+            time.sleep(delay)
+            if status:
+                return self._error(status, retry_after)
+            with self._lock:
+                playlist_id = f"fakeplaylist{len(self.playlists):010d}"
+                self.playlists[playlist_id] = {"name": body.get("name"), "description": body.get("description"), "items": []}
+            return 201, {"id": playlist_id, "name": body.get("name"),
+                         "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"}}, {}
+
+        match = re.search(r"/playlists/(\w+)/(?:items|tracks)$", path)
+        if match and match.group(1) in self.playlists:
+            playlist = self.playlists[match.group(1)]
+            if method == "GET":
+                delay, status, retry_after, _ = self._count("playlist_items")
+                time.sleep(delay)
+                if status:
+                    return self._error(status, retry_after)
+                offset, limit = int(query.get("offset", ["0"])[0]), int(query.get("limit", ["100"])[0])
+                items = [{"track": {"uri": uri}} for uri in playlist["items"][offset:offset + limit]]
+                return 200, {"items": items, "total": len(playlist["items"]), "offset": offset, "limit": limit}, {}
+            if method == "POST":
+                delay, status, retry_after, roll = self._count("playlist_add")
+                time.sleep(delay)
+                if status:
+                    return self._error(status, retry_after)
+                uris = body if isinstance(body, list) else body.get("uris", [])
+                if len(uris) > 100: # the real API rejects more than 100 items per request
+                    return 400, {"error": {"status": 400, "message": "Too many ids requested"}}, {}
+                with self._lock:
+                    playlist["items"].extend(uris)
+                if roll < self.lost_response_rate:
+                    return self._error(503, None)
+                return 201, {"snapshot_id": f"snapshot{len(playlist['items'])}"}, {}
+            if method == "PUT" and "range_start" in body: # reorder a block of items
+                self._count("playlist_reorder")
+                start, length, before = body["range_start"], body.get("range_length", 1), body["insert_before"]
+                with self._lock:
+                    items = playlist["items"]
+                    block = items[start:start + length]
+                    del items[start:start + length]
+                    at = before - length if before > start else before
+                    items[at:at] = block
+                return 200, {"snapshot_id": f"snapshot{len(playlist['items'])}"}, {}
+            if method == "DELETE": # remove items at given positions
+                self._count("playlist_remove")
+                with self._lock:
+                    items = playlist["items"]
+                    positions = sorted((p for t in body.get("items", body.get("tracks", [])) for p in t.get("positions", [])), reverse=True)
+                    for p in positions:
+                        del items[p]
+                return 200, {"snapshot_id": f"snapshot{len(playlist['items'])}"}, {}
+
+        return 404, {"error": {"status": 404, "message": "Not found."}}, {}
+
+    def start(self):
+        # STARTS THE SERVER ON A FREE LOCAL PORT AND RETURNS ITS BASE URL
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real API
+            disable_nagle_algorithm = True # send small responses straight away instead of waiting on delayed ACKs
+
+            def log_message(self, *args): # keep benchmark output quiet
+                pass
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw and raw[:1] in b"{[" else {}
+                except ValueError:
+                    body = {}
+                status, payload, headers = fake.handle(method, url.path, parse_qs(url.query), body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def environ(self):
+        # RETURNS THE ENVIRONMENT VARIABLES THAT POINT spotify_client AT THIS SERVER
+        return {"SPOTIFY_API_URL": self.url + "/v1/", "SPOTIFY_TOKEN_URL": self.url + "/api/token",
+                "CLIENT_ID": "fake-client", "CLIENT_SECRET": "fake-secret"}
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
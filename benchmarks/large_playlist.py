@@ -0,0 +1,60 @@
+import os # for pointing the app at the fake servers
+import time # for timing
+import argparse # for command line options
+import resource # for peak memory
+import tempfile # each run gets an empty cache folder
+
+from benchmarks.fake_groq import FakeGroqServer
+from benchmarks.fake_spotify import FakeSpotifyServer
+from benchmarks.fake_data import parse_latency
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and save large playlists against the local Groq and Spotify stand-ins.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000], help="playlist sizes to generate")
+    parser.add_argument("--prompt", default="late night drive")
+    parser.add_argument("--round-concurrency", type=int, default=8, help="LLM rounds in flight at once")
+    parser.add_argument("--groq-first-token", type=parse_latency, default=("lognormal", 0.3, 0.3))
+    parser.add_argument("--groq-chunk-delay", type=parse_latency, default=0.003)
+    parser.add_argument("--spotify-latency", type=parse_latency, default=("lognormal", 0.05, 0.5))
+    parser.add_argument("--spotify-rate-limit", type=float, default=500, help="the app's own Spotify rate limit (the fake has none)")
+    parser.add_argument("--lost-response-rate", type=float, default=0.1, help="playlist adds that are applied but answered with a 503")
+    args = parser.parse_args(argv)
+
+    spotify = FakeSpotifyServer(latency=args.spotify_latency, miss_rate=0.05, lost_response_rate=args.lost_response_rate)
+    groq = FakeGroqServer(first_token_latency=args.groq_first_token, chunk_delay=args.groq_chunk_delay)
+    with spotify, groq:
+        os.environ.update({**spotify.environ(), "GROQ_API_KEY": "fake", "GROQ_BASE_URL": groq.url,
+                           "CACHE_DIR": tempfile.mkdtemp(prefix="playlist-large-"), "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+                           "SPOTIFY_RATE_LIMIT": str(args.spotify_rate_limit), "SPOTIFY_BURST": str(int(args.spotify_rate_limit)),
+                           "LLM_ROUND_CONCURRENCY": str(args.round_concurrency)})
+        import pipeline
+        from semantic_ranker import get_model
+        from spotify_client import get_spotify_client, write_playlist_items
+        from spotify_scheduler import scheduled
+
+        get_model() # startup cost, not part of a request
+        sp = scheduled(get_spotify_client())
+        for size in args.sizes:
+            groq_before, spotify_before = sum(groq.calls.values()), dict(spotify.calls)
+            start = time.perf_counter()
+            tracks = pipeline.generate_playlist(f"{args.prompt} {size}", size=size, fresh=True)
+            generated = time.perf_counter() - start
+            llm_calls = sum(groq.calls.values()) - groq_before
+            searches = spotify.calls.get("search", 0) - spotify_before.get("search", 0)
+
+            uris = [t["uri"] for t in tracks if t.get("uri")]
+            playlist = sp.current_user_playlist_create(name=f"Large {size}", public=False, collaborative=False, description="")
+            start = time.perf_counter()
+            added = write_playlist_items(sp, playlist["id"], uris)
+            written = time.perf_counter() - start
+            stored = spotify.playlists[playlist["id"]]["items"]
+            write_calls = {k: spotify.calls[k] - spotify_before.get(k, 0) for k in spotify.calls
+                           if k.startswith("playlist_") and spotify.calls[k] != spotify_before.get(k, 0)}
+
+            print(f"\n[RESULT] size={size}: {len(tracks)} tracks ({len(set(uris))} unique) in {generated:.1f}s  "
+                  f"LLM calls {llm_calls}  searches {searches}  peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+            print(f"[RESULT] size={size}: wrote {added} tracks in {written:.2f}s  calls {write_calls}  "
+                  f"playlist {'matches' if stored == list(dict.fromkeys(uris)) else 'DOES NOT match'} the ranked order")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os # for the scenario processes' settings
+import sys # for running scenarios in child processes
+import json # scenario config and results go through the command line and stdout
+import time # for timing
+import argparse # for command line options
+import tempfile # each scenario gets an empty cache folder
+import subprocess # each scenario runs in a fresh process, so model stats and latency windows start from zero
+import numpy as np
+
+from benchmarks.fake_groq import FakeGroqServer
+
+PRIMARY = "moonshotai/kimi-k2-instruct-0905"
+ROSTER = [PRIMARY, "openai/gpt-oss-120b", "llama-3.3-70b-versatile"]
+MODELS = { # the preferred model has a long latency tail and sometimes stops early, the last backup is mostly malformed
+    PRIMARY: {"first_token_latency": ("lognormal", 0.4, 0.9), "malformed_rate": 0.1, "error_rate": 0.05},
+    "openai/gpt-oss-120b": {"first_token_latency": ("lognormal", 0.5, 0.3)},
+    "llama-3.3-70b-versatile": {"first_token_latency": 0.2, "malformed_rate": 0.7},
+}
+
+def run_scenario(config):
+    # RUNS IN THE SCENARIO PROCESS: MAKES config["calls"] LLM CALLS ONE AFTER ANOTHER AND RETURNS THE MEASUREMENTS
+    import groq_client
+
+    client = groq_client.get_groq_client()
+    first, complete, sizes, failures = [], [], [], []
+    for i in range(config["calls"]):
+        prompt = f"{config['prompt']} {i}"
+        start = time.perf_counter()
+        try:
+            if config["stream"]:
+                tracks = []
+                for track in groq_client.stream_candidate_tracks(client, prompt):
+                    if not tracks:
+                        first.append(time.perf_counter() - start)
+                    tracks.append(track)
+            else:
+                tracks = groq_client.prompt_llm_for_dataset(client, prompt)["tracks"]
+                first.append(time.perf_counter() - start)
+        except Exception as e:
+            failures.append(f"{type(e).__name__}: {e}"[:120])
+            continue
+        complete.append(time.perf_counter() - start)
+        sizes.append(len(tracks))
+    return {"first": first, "complete": complete, "sizes": sizes, "failures": failures, "stats": groq_client.get_llm_stats()}
+
+def launch(config, env):
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.llm_roster", "--scenario", json.dumps(config)],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Scenario failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def print_result(name, r, calls):
+    p = lambda values, q: np.percentile(values, q) if values else float("nan")
+    print(f"[RESULT] {name:<14} failed {len(r['failures']):>3}/{calls}  first track p50 {p(r['first'], 50):5.2f}s "
+          f"p95 {p(r['first'], 95):5.2f}s p99 {p(r['first'], 99):5.2f}s  complete p50 {p(r['complete'], 50):5.2f}s "
+          f"p95 {p(r['complete'], 95):5.2f}s  tracks per call {np.mean(r['sizes']) if r['sizes'] else 0:.1f}")
+    stats = r["stats"]
+    print(f"[RESULT]   {stats['calls']} raced calls, {stats['hedges']} hedged")
+    for model, m in stats["models"].items():
+        validity = "-" if m["validity"] is None else f"{m['validity']:.0%}"
+        print(f"[RESULT]   {model:<36} attempts={m['attempts']:<4} wins={m['wins']:<4} valid={m['valid']:<4} invalid={m['invalid']:<3} "
+              f"errors={m['errors']:<3} cancelled={m['cancelled']:<3} recent validity={validity}")
+    for failure in r["failures"][:3]:
+        print(f"[RESULT]   failure: {failure}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare one pinned LLM model with the hedged model roster against a fake Groq server with slow and malformed models.")
+    parser.add_argument("--calls", type=int, default=40, help="LLM calls per scenario")
+    parser.add_argument("--prompt", default="chill late night drive")
+    parser.add_argument("--mode", choices=["stream", "complete", "both"], default="both")
+    parser.add_argument("--chunk-delay", type=float, default=0.002)
+    parser.add_argument("--scenario", default=None, help=argparse.SUPPRESS) # used internally to run one scenario
+    args = parser.parse_args(argv)
+
+    if args.scenario:
+        print(json.dumps(run_scenario(json.loads(args.scenario))))
+        return
+
+    with FakeGroqServer(chunk_delay=args.chunk_delay, models=MODELS) as server:
+        base = {**os.environ, "GROQ_API_KEY": "fake", "GROQ_BASE_URL": server.url, "LOG_LEVEL": "ERROR"}
+        for stream in ([True, False] if args.mode == "both" else [args.mode == "stream"]):
+            print(f"\n[RESULT] {'streaming' if stream else 'non-streaming'}, {args.calls} calls")
+            for name, models, hedge in (("pinned", [PRIMARY], "0"), ("roster", ROSTER, "0"), ("roster+hedge", ROSTER, "1")):
+                env = {**base, "CACHE_DIR": tempfile.mkdtemp(prefix="playlist-roster-"), "LLM_MODELS": ",".join(models), "LLM_HEDGE": hedge}
+                before = dict(server.calls)
+                r = launch({"calls": args.calls, "prompt": args.prompt, "stream": stream}, env)
+                print_result(name, r, args.calls)
+                sent = {m: server.calls.get(m, 0) - before.get(m, 0) for m in server.calls}
+                print(f"[RESULT]   requests sent {sum(sent.values())} ({sent})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import time # for timing
+import argparse # for command line options
+import numpy as np
+
+from groq import Groq
+from benchmarks.fake_groq import FakeGroqServer
+from benchmarks.fake_data import parse_latency
+
+MOODS = "rainy sunny late-night heartbroken euphoric nostalgic angry dreamy summer winter gym study".split()
+
+def run(client, user_input, shards, stream):
+    # GETS THE CANDIDATES FOR ONE PROMPT AND RETURNS (tracks, time to first track, time to last track)
+    from groq_client import prompt_llm_for_dataset, stream_candidate_tracks, stream_sharded_candidate_tracks
+
+    start = time.perf_counter()
+    first_track = None
+    if shards > 1:
+        candidates = stream_sharded_candidate_tracks(client, user_input, shards=shards, stream=stream)
+    elif stream:
+        candidates = stream_candidate_tracks(client, user_input)
+    else:
+        candidates = prompt_llm_for_dataset(client, user_input)["tracks"]
+    tracks = []
+    for t in candidates:
+        if first_track is None:
+            first_track = time.perf_counter() - start
+        tracks.append(t)
+    return tracks, first_track, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare one LLM call for the whole track list with several concurrent shards, on a local fake Groq server.")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 3, 5], help="shard counts to compare, 1 is the single-call path")
+    parser.add_argument("--prompts", type=int, default=20, help="prompts timed per configuration")
+    parser.add_argument("--first-token-latency", type=parse_latency, default=("lognormal", 0.4, 0.5))
+    parser.add_argument("--chunk-delay", type=parse_latency, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls the fake fails, to see partial results")
+    parser.add_argument("--no-stream", action="store_true", help="use non-streaming structured output calls")
+    args = parser.parse_args(argv)
+
+    prompts = [f"{MOODS[i % len(MOODS)]} {MOODS[(i * 7 + 3) % len(MOODS)]} songs {i}" for i in range(args.prompts)]
+    with FakeGroqServer(first_token_latency=args.first_token_latency, chunk_delay=args.chunk_delay,
+                        error_rate=args.error_rate) as server:
+        client = Groq(api_key="fake", base_url=server.url, max_retries=0)
+        print(f"\n[RESULT] {args.prompts} prompts per row, {'non-streaming' if args.no_stream else 'streaming'} calls")
+        for shards in args.shards:
+            firsts, lasts, counts, failures = [], [], [], 0
+            for prompt in prompts:
+                try:
+                    tracks, first, last = run(client, prompt, shards, not args.no_stream)
+                except Exception:
+                    failures += 1
+                    continue
+                firsts.append(first)
+                lasts.append(last)
+                counts.append(len(tracks))
+            if not lasts:
+                print(f"[RESULT] shards={shards}: every prompt failed")
+                continue
+            f50, f95 = np.percentile(firsts, [50, 95])
+            l50, l95, l99 = np.percentile(lasts, [50, 95, 99])
+            print(f"[RESULT] shards={shards}: first track p50 {f50:.2f}s p95 {f95:.2f}s  "
+                  f"all tracks p50 {l50:.2f}s p95 {l95:.2f}s p99 {l99:.2f}s  "
+                  f"tracks {np.mean(counts):.1f} (min {min(counts)})  failed prompts {failures}")
+
+if __name__ == "__main__":
+    main()
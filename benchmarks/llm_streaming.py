@@ -0,0 +1,70 @@
+import os # for the cache folder
+import time # for timing
+import argparse # for command line options
+import tempfile # searches use a throwaway cache
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from groq import Groq
+from benchmarks.fake_groq import FakeGroqServer
+from benchmarks.fake_data import parse_latency
+
+class SleepySpotify: # minimal Spotify stand-in whose search takes a fixed time
+    def __init__(self, search_latency):
+        self.search_latency = search_latency
+
+    def search(self, q, limit, type, market):
+        time.sleep(self.search_latency)
+        return {"tracks": {"items": [{"id": f"id-{abs(hash(q)) % 10**8}"}]}}
+
+def run(client, user_input, sp, streaming):
+    # GETS CANDIDATES AND SEARCHES THEM, RETURNING THE TRACKS AND TIMINGS
+    from groq_client import prompt_llm_for_dataset, stream_candidate_tracks
+    from spotify_client import search_track
+
+    start = time.perf_counter()
+    first_track = None
+    tracks = []
+    with ThreadPoolExecutor(max_workers=10) as ex:
+        futures = []
+        if streaming:
+            candidates = stream_candidate_tracks(client, user_input) # searches start while the model is still writing
+        else:
+            candidates = prompt_llm_for_dataset(client, user_input)["tracks"] # searches start after the whole response
+        for t in candidates:
+            if first_track is None:
+                first_track = time.perf_counter() - start
+            tracks.append(t)
+            futures.append(ex.submit(search_track, sp, t["artists"], t["track"]))
+        llm_done = time.perf_counter() - start
+        wait(futures)
+    return tracks, {"first_track_s": first_track, "llm_done_s": llm_done, "searches_done_s": time.perf_counter() - start}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate streamed LLM parsing against a local fake Groq server and time it.")
+    parser.add_argument("--first-token-latency", type=parse_latency, default=0.5)
+    parser.add_argument("--chunk-delay", type=parse_latency, default=0.01)
+    parser.add_argument("--chunk-chars", type=int, default=24)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--prompt", default="chill late night drive")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp()) # don't let the search cache hide the search time
+    with FakeGroqServer(first_token_latency=args.first_token_latency, chunk_delay=args.chunk_delay,
+                        chunk_chars=args.chunk_chars) as server:
+        client = Groq(api_key="fake", base_url=server.url)
+        import spotify_client
+
+        spotify_client.search_cache.clear()
+        full, full_times = run(client, args.prompt, SleepySpotify(args.search_latency), streaming=False)
+        spotify_client.search_cache.clear()
+        streamed, stream_times = run(client, args.prompt, SleepySpotify(args.search_latency), streaming=True)
+
+    if streamed != full: # the streamed parse must give exactly the same tracks as parsing the whole response
+        raise SystemExit(f"[ERROR] Streamed tracks differ from the full response ({len(streamed)} vs {len(full)})")
+    print(f"\n[RESULT] Streamed parse matches full response ({len(streamed)} tracks)")
+    for name, times in (("full", full_times), ("streamed", stream_times)):
+        print(f"[RESULT] {name:>8}: first track {times['first_track_s']:.2f}s, LLM done {times['llm_done_s']:.2f}s, "
+              f"all searches done {times['searches_done_s']:.2f}s")
+
+if __name__ == "__main__":
+    main()
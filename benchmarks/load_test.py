@@ -0,0 +1,208 @@
+import os # for pointing the app at the fake servers
+import sys # for launching scenario processes
+import json # results are saved as JSON
+import time # for timing
+import random # for picking prompts
+import argparse # for command line options
+import resource # for peak memory
+import tempfile # each scenario gets an empty cache folder
+import threading # one thread per simulated session
+import subprocess # each scenario runs in a fresh process, so caches, metrics and peak memory start from zero
+import numpy as np
+
+from benchmarks.fake_data import parse_latency
+from benchmarks.fake_groq import FakeGroqServer
+from benchmarks.fake_spotify import FakeSpotifyServer
+
+MOODS = "rainy sunny late-night heartbroken euphoric nostalgic angry dreamy summer winter gym study road-trip party".split()
+
+def make_prompts(sessions, requests, pool, seed):
+    # RETURNS ONE LIST OF PROMPTS PER SESSION; WITH pool SET, PROMPTS REPEAT (SO CACHES AND COALESCING GET USED)
+    rng = random.Random(seed)
+    if pool:
+        choices = [f"{rng.choice(MOODS)} {rng.choice(MOODS)} songs #{i}" for i in range(pool)]
+        return [[rng.choice(choices) for _ in range(requests)] for _ in range(sessions)]
+    return [[f"{rng.choice(MOODS)} {rng.choice(MOODS)} songs #{s}-{i}" for i in range(requests)] for s in range(sessions)]
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+def run_scenario(config):
+    # RUNS IN THE SCENARIO PROCESS: DRIVES generate_playlist FROM config["sessions"] THREADS AND RETURNS THE MEASUREMENTS
+    import tracing
+    import deadline
+    import pipeline
+    import semantic_ranker
+    import spotify_scheduler
+    import groq_client
+    from groq_client import get_groq_client
+    from spotify_client import get_spotify_client
+
+    semantic_ranker.get_model() # model load and client setup are startup costs, not per-request ones
+    get_groq_client()
+    get_spotify_client()
+
+    prompts = make_prompts(config["sessions"], config["requests"], config["prompt_pool"], config["seed"])
+    latencies, errors, sizes, resolved = [], [], [], []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(config["sessions"])
+
+    def session(i):
+        start_gate.wait()
+        for prompt in prompts[i]:
+            start = time.perf_counter()
+            try:
+                tracks = pipeline.generate_playlist(prompt, streaming=config["streaming"], stream_llm=config["stream_llm"], session_id=f"session-{i}")
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    sizes.append(len(tracks))
+                    resolved.append(sum(1 for t in tracks if t.get("uri"))) # tracks Spotify filled in, partial results have fewer
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(config["sessions"])]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "elapsed_s": elapsed,
+        "completed": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_s": percentiles(latencies),
+        "max_latency_s": max(latencies, default=0.0),
+        "mean_tracks": float(np.mean(sizes)) if sizes else 0.0,
+        "mean_resolved": float(np.mean(resolved)) if resolved else 0.0,
+        "stages": tracing.get_stage_metrics(),
+        "scheduler": spotify_scheduler.get_scheduler_metrics(),
+        "deadline": deadline.get_deadline_stats(),
+        "llm_models": groq_client.get_llm_stats(),
+        "vector_index": semantic_ranker.get_index_stats(),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # kilobytes on Linux
+    }
+
+def launch(config, env):
+    # RUNS ONE SCENARIO IN A CHILD PROCESS AND RETURNS ITS MEASUREMENTS
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.load_test", "--scenario", json.dumps(config)],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Scenario failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def diff_calls(before, after):
+    return {k: after.get(k, 0) - before.get(k, 0) for k in after if after.get(k, 0) - before.get(k, 0)}
+
+def print_result(r):
+    lat = r["latency_s"]
+    print(f"[RESULT] sessions={r['sessions']:<3} {r['completed']:>4} ok {r['errors']:>3} failed  "
+          f"{r['throughput_rps']:6.2f} req/s  latency p50 {lat['p50']:.2f}s p95 {lat['p95']:.2f}s p99 {lat['p99']:.2f}s  "
+          f"peak RSS {r['peak_rss_mb']:.0f} MB")
+    if "mean_tracks" in r:
+        print(f"           max latency {r['max_latency_s']:.2f}s  tracks per playlist {r['mean_tracks']:.1f} "
+              f"({r['mean_resolved']:.1f} with Spotify data)")
+    for stage, s in sorted(r["stages"].items()):
+        print(f"           {stage:<16} n={s['count']:<5} p50 {s['p50'] * 1000:8.1f} ms  p95 {s['p95'] * 1000:8.1f} ms  "
+              f"p99 {s['p99'] * 1000:8.1f} ms  errors {s['errors']}")
+    print(f"           spotify calls {r['spotify_calls']} rejected {r['spotify_rejected']}  groq calls {r['groq_calls']}")
+    if "deadline" in r:
+        d = r["deadline"]
+        print(f"           hedges {d['hedges']} won {d['hedge_wins']}  calls cut off by the deadline {d['deadline_exceeded']}")
+    for model, m in r.get("llm_models", {}).get("models", {}).items():
+        print(f"           {model:<36} attempts {m['attempts']:<4} wins {m['wins']:<4} invalid {m['invalid']:<3} "
+              f"errors {m['errors']:<3} cancelled {m['cancelled']}")
+
+def compare(results, baseline_path):
+    # PRINTS THROUGHPUT AND LATENCY CHANGES AGAINST AN EARLIER RESULTS FILE
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["sessions"]: r for r in json.load(f)["scenarios"]}
+    print(f"\n[COMPARE] against {baseline_path}")
+    for r in results:
+        old = baseline.get(r["sessions"])
+        if not old:
+            continue
+        def change(new, before):
+            return f"{(new - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"[COMPARE] sessions={r['sessions']:<3} throughput {change(r['throughput_rps'], old['throughput_rps'])}  "
+              f"p95 {change(r['latency_s']['p95'], old['latency_s']['p95'])}  "
+              f"peak RSS {change(r['peak_rss_mb'], old['peak_rss_mb'])}")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test generate_playlist against local Groq and Spotify stand-ins.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16], help="concurrent sessions, one scenario each")
+    parser.add_argument("--requests", type=int, default=3, help="playlists generated by each session")
+    parser.add_argument("--prompt-pool", type=int, default=0, help="draw prompts from this many distinct ones (0 for all unique)")
+    parser.add_argument("--no-streaming", action="store_true", help="use the batch pipeline instead of the streaming one")
+    parser.add_argument("--no-stream-llm", action="store_true", help="wait for the whole LLM response before searching")
+    parser.add_argument("--spotify-latency", type=parse_latency, default=("lognormal", 0.08, 0.5))
+    parser.add_argument("--spotify-miss-rate", type=float, default=0.05)
+    parser.add_argument("--spotify-error-rate", type=float, default=0.0)
+    parser.add_argument("--spotify-429-rate", type=float, default=0.0)
+    parser.add_argument("--spotify-rate-limit", type=float, default=None, help="requests per second before the fake returns 429s")
+    parser.add_argument("--spotify-stall-rate", type=float, default=0.0, help="fraction of Spotify calls that hang for --spotify-stall seconds")
+    parser.add_argument("--spotify-stall", type=float, default=8.0)
+    parser.add_argument("--groq-first-token", type=parse_latency, default=("lognormal", 0.4, 0.3))
+    parser.add_argument("--groq-chunk-delay", type=parse_latency, default=0.01)
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    parser.add_argument("--groq-429-rate", type=float, default=0.0)
+    parser.add_argument("--groq-malformed-rate", type=float, default=0.0)
+    parser.add_argument("--no-prompt-cache", action="store_true", help="turn off the semantic prompt cache, so every unique prompt runs the full pipeline")
+    parser.add_argument("--app-env", nargs="*", default=[], metavar="KEY=VALUE", help="extra settings for the app, e.g. SPOTIFY_RATE_LIMIT=50")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="results file (default benchmarks/results/load_<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--scenario", default=None, help=argparse.SUPPRESS) # used internally to run one scenario
+    args = parser.parse_args(argv)
+
+    if args.scenario:
+        print(json.dumps(run_scenario(json.loads(args.scenario))))
+        return
+
+    spotify = FakeSpotifyServer(latency=args.spotify_latency, miss_rate=args.spotify_miss_rate, error_rate=args.spotify_error_rate,
+                                rate_limit_rate=args.spotify_429_rate, rate_limit=args.spotify_rate_limit,
+                                stall_rate=args.spotify_stall_rate, stall=args.spotify_stall, seed=args.seed)
+    groq = FakeGroqServer(first_token_latency=args.groq_first_token, chunk_delay=args.groq_chunk_delay, error_rate=args.groq_error_rate,
+                          rate_limit_rate=args.groq_429_rate, malformed_rate=args.groq_malformed_rate, seed=args.seed)
+    results = []
+    with spotify, groq:
+        for sessions in args.sessions:
+            config = {"sessions": sessions, "requests": args.requests, "prompt_pool": args.prompt_pool, "seed": args.seed,
+                      "streaming": not args.no_streaming, "stream_llm": not args.no_stream_llm}
+            env = {**os.environ, **spotify.environ(), "GROQ_API_KEY": "fake", "GROQ_BASE_URL": groq.url,
+                   "CACHE_DIR": tempfile.mkdtemp(prefix="playlist-load-"), "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+                   **dict(setting.split("=", 1) for setting in args.app_env)}
+            if args.no_prompt_cache:
+                env["PROMPT_CACHE_THRESHOLD"] = "2" # cosine similarity never gets above 1
+            spotify_before, rejected_before, groq_before = dict(spotify.calls), dict(spotify.rejected), dict(groq.calls)
+            result = {**config, **launch(config, env)}
+            result["spotify_calls"] = diff_calls(spotify_before, spotify.calls)
+            result["spotify_rejected"] = diff_calls(rejected_before, spotify.rejected)
+            result["groq_calls"] = sum(diff_calls(groq_before, groq.calls).values())
+            results.append(result)
+            print_result(result)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "results", f"load_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"time": time.time(), "commit": git_commit(), "args": {k: v for k, v in vars(args).items() if k != "scenario"},
+                   "scenarios": results}, f, indent=2)
+    print(f"[INFO] Saved results to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
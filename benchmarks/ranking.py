@@ -0,0 +1,67 @@
+import time # for timing
+import argparse # for command line options
+import statistics # for medians
+import numpy as np
+
+from ranking import rank, normalise_rows
+
+def rank_old(query_vector, vectors, tracks, n=20):
+    # WHAT get_most_similar_tracks USED TO DO: cos_sim, FULL argsort, THEN A PYTHON LOOP OVER EVERY CANDIDATE
+    import torch
+    from sentence_transformers import util
+    embeddings = torch.from_numpy(np.vstack([query_vector, vectors]))
+    similarities = util.cos_sim(embeddings[0], embeddings[1:])
+    ranked = []
+    for i in similarities[0].argsort(descending=True):
+        track = tracks[i]
+        track["similarity_score"] = float(similarities[0][i])
+        ranked.append(track)
+    return ranked[:n]
+
+def make_pool(size, dim, duplicate_rate, rng):
+    # RETURNS (query, vectors, tracks), WITH SOME CANDIDATES BEING SLIGHTLY PERTURBED COPIES OF OTHERS (LIKE REMIXES)
+    vectors = rng.standard_normal((size, dim)).astype(np.float32)
+    copies = rng.random(size) < duplicate_rate
+    sources = rng.integers(0, size, size)
+    vectors[copies] = vectors[sources[copies]] + 0.05 * rng.standard_normal((int(copies.sum()), dim)).astype(np.float32)
+    query = vectors[:50].mean(axis=0) # a prompt close to a cluster of candidates, so duplicates compete for the top
+    tracks = [{"track": f"Song {i}", "artists": f"Artist {i % 97}"} for i in range(size)]
+    return query, vectors, tracks
+
+def duplicates_in(indices, vectors, threshold=0.95):
+    # RETURNS HOW MANY PICKED PAIRS ARE NEAR-DUPLICATES OF EACH OTHER
+    picked = normalise_rows(vectors[indices])
+    sims = picked @ picked.T
+    return int((np.triu(sims, 1) >= threshold).sum())
+
+def timed(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the old full-sort ranker with partial top-k + MMR.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[35, 1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--diversity", type=float, default=0.2)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        query, vectors, tracks = make_pool(size, args.dim, args.duplicate_rate, rng)
+        old_time, old = timed(lambda: rank_old(query, vectors, tracks, args.k), args.repeats)
+        old_indices = np.asarray([int(t["track"].split()[-1]) for t in old])
+        plain_time, (plain, _) = timed(lambda: rank(query, vectors, args.k, diversity=0, duplicate_threshold=1), args.repeats)
+        mmr_time, (mmr, _) = timed(lambda: rank(query, vectors, args.k, diversity=args.diversity), args.repeats)
+        assert list(plain) == list(old_indices), "top-k selection should match the full sort"
+        print(f"[RESULT] {size:>7} candidates: old {old_time * 1000:8.2f} ms ({duplicates_in(old_indices, vectors)} duplicate pairs), "
+              f"top-k {plain_time * 1000:7.2f} ms, top-k + MMR {mmr_time * 1000:7.2f} ms ({duplicates_in(mmr, vectors)} duplicate pairs)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os # for pointing the app at the fake servers
+import time # for timing
+import argparse # for command line options
+import tempfile # each run gets an empty cache folder
+import numpy as np
+
+from benchmarks.fake_groq import FakeGroqServer
+from benchmarks.fake_spotify import FakeSpotifyServer
+from benchmarks.fake_data import parse_latency
+
+REFINEMENTS = ["same but more upbeat", "more acoustic", "less sad", "add some 80s synth", "slower", "more female vocals",
+               "no rap", "darker", "for a road trip", "more danceable"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time prompt refinements that re-rank the session's pool against re-running the pipeline.")
+    parser.add_argument("--prompt", default="rainy day songs")
+    parser.add_argument("--refinements", type=int, default=50, help="refinements timed")
+    parser.add_argument("--min-ratio", type=float, default=None, help="REFINE_MIN_RATIO, raise above 1 to make every refinement fetch")
+    parser.add_argument("--groq-first-token", type=parse_latency, default=("lognormal", 0.4, 0.5))
+    parser.add_argument("--groq-chunk-delay", type=parse_latency, default=0.01)
+    parser.add_argument("--spotify-latency", type=parse_latency, default=("lognormal", 0.08, 0.5))
+    args = parser.parse_args(argv)
+
+    spotify = FakeSpotifyServer(latency=args.spotify_latency, miss_rate=0.05)
+    groq = FakeGroqServer(first_token_latency=args.groq_first_token, chunk_delay=args.groq_chunk_delay)
+    with spotify, groq:
+        os.environ.update({**spotify.environ(), "GROQ_API_KEY": "fake", "GROQ_BASE_URL": groq.url,
+                           "CACHE_DIR": tempfile.mkdtemp(prefix="playlist-refine-"), "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+                           "CATALOG_ENABLED": "0"}) # every full run searches Spotify, like a new prompt would
+        if args.min_ratio is not None:
+            os.environ["REFINE_MIN_RATIO"] = str(args.min_ratio)
+        import pipeline
+        from candidates import SessionPool
+        from semantic_ranker import get_model
+
+        get_model() # startup cost, not part of a request
+        pool = SessionPool()
+        start = time.perf_counter()
+        pipeline.generate_playlist(args.prompt, fresh=True, pool=pool)
+        print(f"\n[RESULT] first playlist: {time.perf_counter() - start:.2f}s, pool of {len(pool.table)} candidates")
+
+        full, refined, actions = [], [], {}
+        calls_before = (sum(groq.calls.values()), sum(spotify.calls.values()))
+        for i in range(args.refinements):
+            refinement = f"{REFINEMENTS[i % len(REFINEMENTS)]} {i}"
+            start = time.perf_counter()
+            pipeline.refine_playlist(refinement, pool)
+            refined.append(time.perf_counter() - start)
+            actions[pool.last_action] = actions.get(pool.last_action, 0) + 1
+        groq_calls, spotify_calls = sum(groq.calls.values()) - calls_before[0], sum(spotify.calls.values()) - calls_before[1]
+        for i in range(min(5, args.refinements)): # what a refinement cost before: the whole pipeline for the new prompt
+            start = time.perf_counter()
+            pipeline.generate_playlist(f"{args.prompt}, {REFINEMENTS[i]} full {i}", fresh=True)
+            full.append(time.perf_counter() - start)
+
+        r50, r95, r99 = np.percentile(refined, [50, 95, 99]) * 1000
+        print(f"[RESULT] refinement: p50 {r50:.1f} ms  p95 {r95:.1f} ms  p99 {r99:.1f} ms  {actions}  "
+              f"calls during refinements: Groq {groq_calls}, Spotify {spotify_calls}")
+        print(f"[RESULT] full pipeline rerun: p50 {np.median(full) * 1000:.0f} ms  (pool now {len(pool.table)} candidates)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os # for paths and environment variables
+import sys # for the python executable
+import json # for reading results back from the child processes
+import argparse # for command line options
+import tempfile # each run gets a cold cache folder
+import statistics # for medians
+import subprocess # each run is a fresh process, so imports are cold
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # repo root
+
+# code run in a fresh python process for each measurement
+CHILD = r"""
+import sys, json, time
+t0 = time.perf_counter()
+sys.path.insert(0, REPO)
+if MODE == "eager":
+    import semantic_ranker # old behaviour: the model is loaded before the page can render
+    semantic_ranker.get_model()
+
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(REPO + "/main.py", default_timeout=600)
+app.run() # runs main.py headlessly, same as a streamlit worker serving the first page
+render = time.perf_counter() - t0
+
+import semantic_ranker
+tracks = {"tracks": [
+    {"artists": "Frank Ocean", "track": "Nights", "description": "A shape-shifting R&B odyssey about late-night overthinking."},
+    {"artists": "Future", "track": "Stick Talk", "description": "A menacing trap banger dripping with confidence."},
+    {"artists": "SZA", "track": "Nobody Gets Me", "description": "A raw alt-R&B ballad pleading for one last lover to stay."},
+]}
+semantic_ranker.get_most_similar_tracks("chill late night drive", tracks)
+ranking = time.perf_counter() - t0
+print("BENCHMARK_RESULT " + json.dumps({"first_render": render, "first_ranking": ranking}))
+"""
+
+def run_once(mode):
+    # RUNS ONE COLD START IN A NEW PROCESS AND RETURNS ITS TIMINGS
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, CACHE_DIR=os.path.join(tmp, "cache")) # empty embedding cache, so the first ranking really encodes
+        code = f"REPO = {REPO!r}\nMODE = {mode!r}\n" + CHILD
+        out = subprocess.run([sys.executable, "-c", code], cwd=tmp, env=env, capture_output=True, text=True)
+    for line in out.stdout.splitlines():
+        if line.startswith("BENCHMARK_RESULT "):
+            return json.loads(line.split(" ", 1)[1])
+    raise RuntimeError(f"Startup benchmark run failed:\n{out.stderr[-2000:]}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure time-to-first-render and time-to-first-ranking for a cold start.")
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per mode")
+    parser.add_argument("--output", help="optional path to write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for mode in ("eager", "lazy"): # eager = model loaded before render (old), lazy = background warm-up (new)
+        runs = [run_once(mode) for _ in range(args.runs)]
+        results[mode] = {
+            "first_render_s": statistics.median(r["first_render"] for r in runs),
+            "first_ranking_s": statistics.median(r["first_ranking"] for r in runs),
+        }
+        print(f"[RESULT] {mode:>5}: first render {results[mode]['first_render_s']:.2f}s, "
+              f"first ranking {results[mode]['first_ranking_s']:.2f}s (median of {args.runs})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
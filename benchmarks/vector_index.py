@@ -0,0 +1,117 @@
+import os # for the index settings
+import time # for timing
+import argparse # for command line options
+import tempfile # each size gets its own index folder
+import numpy as np
+
+from candidates import CandidateTable
+
+class FakeEmbeddings: # unit vectors shaped like sentence embeddings: genres, moods within a genre, and few real degrees of freedom
+    # random isotropic vectors have no neighbours worth finding, which no index can speed up; real text embeddings sit near
+    # a low-dimensional surface, so points are made in a small latent space and projected up to the embedding size
+    def __init__(self, dim, topics, rng, genres=50, latent=32, noise=0.05):
+        self.rng = rng
+        self.noise = noise
+        genre_centres = rng.standard_normal((genres, latent))
+        self.topics = genre_centres[np.arange(topics) % genres] + 0.6 * rng.standard_normal((topics, latent))
+        self.projection = np.linalg.qr(rng.standard_normal((dim, latent)))[0].T.astype(np.float32) # (latent, dim), orthonormal rows
+
+    def sample(self, n):
+        latent = self.topics[self.rng.integers(0, len(self.topics), n)] + 0.5 * self.rng.standard_normal((n, self.topics.shape[1]))
+        vectors = latent.astype(np.float32) @ self.projection
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors += self.noise * self.rng.standard_normal(vectors.shape).astype(np.float32) / np.sqrt(vectors.shape[1])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def fake_table(start, vectors):
+    # RETURNS A RESOLVED, EMBEDDED CandidateTable FOR ROWS start.. OF THE BENCHMARK DATA
+    tracks = [{"artists": f"Artist {i % 5000}", "track": f"Track {i}", "description": "A fake track.", "ID": f"fake{i:018d}",
+               "spotify_url": f"https://open.spotify.com/track/fake{i:018d}"} for i in range(start, start + len(vectors))]
+    return CandidateTable.from_tracks(tracks, vectors)
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def timed_queries(search, queries):
+    # RETURNS (results, per-query seconds)
+    results, times = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(search(q)[0])
+        times.append(time.perf_counter() - start)
+    return results, np.array(times)
+
+def recall(found, truth):
+    return float(np.mean([len(set(f.tolist()) & set(t.tolist())) / len(t) for f, t in zip(found, truth)]))
+
+def run(n, args, rng):
+    from vector_index import VectorIndex
+
+    folder = tempfile.mkdtemp(prefix="playlist-index-")
+    data = FakeEmbeddings(args.dim, args.topics, rng)
+    index = VectorIndex(folder, "benchmark")
+    start = time.perf_counter()
+    for chunk in range(0, n, args.chunk):
+        index.add(fake_table(chunk, data.sample(min(args.chunk, n - chunk))))
+    added = time.perf_counter() - start
+    start = time.perf_counter()
+    lists = index.train()
+    trained = time.perf_counter() - start
+    print(f"\n[RESULT] {n} vectors, dim {args.dim}: added in {added:.1f}s ({n / added:,.0f}/s), trained {lists} lists in {trained:.1f}s")
+
+    # a fresh process opens the index by memory-mapping it, nothing is read until a query touches it
+    before = rss_mb()
+    start = time.perf_counter()
+    index = VectorIndex(folder, "benchmark")
+    len(index)
+    opened = time.perf_counter() - start
+    print(f"[RESULT]   open: {opened * 1000:.1f} ms, +{rss_mb() - before:.0f} MB RSS (vectors.f32 is {n * args.dim * 4 / 2**20:,.0f} MB on disk)")
+
+    queries = data.sample(args.queries) # new points from the same distribution, like a prompt about music we already have
+
+    truth, exact_times = timed_queries(lambda q: index.search(q, args.k, exact=True), queries)
+    print(f"[RESULT]   brute force       : p50 {np.median(exact_times) * 1000:8.2f} ms  p95 {np.percentile(exact_times, 95) * 1000:8.2f} ms  recall@{args.k} 100.0%")
+    for nprobe in args.nprobe:
+        index.searches = index.scanned = 0
+        found, times = timed_queries(lambda q: index.search(q, args.k, nprobe=nprobe), queries)
+        print(f"[RESULT]   ivf nprobe={nprobe:<4}: p50 {np.median(times) * 1000:8.2f} ms  p95 {np.percentile(times, 95) * 1000:8.2f} ms  "
+              f"recall@{args.k} {recall(found, truth):6.1%}  scanned {index.scanned / index.searches / n:6.2%} of rows  "
+              f"speed-up {np.median(exact_times) / np.median(times):5.1f}x")
+
+    # incremental inserts: a request's worth of resolved tracks at a time, searched from the tail until the lists are rebuilt
+    added_times = []
+    for batch in range(args.insert_batches):
+        vectors = data.sample(35)
+        start = time.perf_counter()
+        index.add(fake_table(n + batch * 35, vectors))
+        added_times.append(time.perf_counter() - start)
+    found, times = timed_queries(lambda q: index.search(q, args.k, nprobe=args.nprobe[len(args.nprobe) // 2]), queries)
+    truth, _ = timed_queries(lambda q: index.search(q, args.k, exact=True), queries)
+    print(f"[RESULT]   insert 35 tracks  : p50 {np.median(added_times) * 1000:8.2f} ms  p95 {np.percentile(added_times, 95) * 1000:8.2f} ms; "
+          f"after {args.insert_batches} inserts nprobe={args.nprobe[len(args.nprobe) // 2]} p50 {np.median(times) * 1000:.2f} ms "
+          f"recall@{args.k} {recall(found, truth):.1%} (tail {index.stats()['tail']} rows)")
+
+    start = time.perf_counter()
+    table = index.lookup(queries[0], args.k)
+    print(f"[RESULT]   lookup of {len(table)} tracks with their data and embeddings: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query latency and recall of the IVF vector index against brute force.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384, help="embedding size (bge-small is 384)")
+    parser.add_argument("--topics", type=int, default=2000, help="clusters in the fake embeddings")
+    parser.add_argument("--k", type=int, default=100, help="neighbours per query (catalog mode asks for 5 per playlist track)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--insert-batches", type=int, default=50)
+    parser.add_argument("--chunk", type=int, default=50_000, help="rows per add while building")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("VECTOR_INDEX_MIN_TRAIN", str(10**12)) # the benchmark trains once the data is in, not while adding
+    rng = np.random.default_rng(0)
+    for n in args.sizes:
+        run(n, args, rng)
+
+if __name__ == "__main__":
+    main()
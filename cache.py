@@ -0,0 +1,260 @@
+import os # for cache paths
+import re # for normalising keys
+import json # for storing values as text
+import time # for TTL timestamps
+import sqlite3 # on-disk key/value store, ships with python
+import threading # for making the cache safe to share between streamlit sessions
+import unicodedata # for stripping accents when normalising keys
+from collections import OrderedDict # for the in-memory LRU
+from concurrent.futures import Future # for sharing one result between concurrent callers
+
+MISSING = object() # sentinel returned on a cache miss, so a cached None ("no result") can be told apart from "not cached"
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".playlist_cache") # folder that holds every on-disk cache (not ".cache", which spotipy uses for token files)
+
+class PersistentCache: # key/value cache backed by a SQLite file, with TTL expiry and size-bounded eviction
+    def __init__(self, path, ttl, max_entries, negative_ttl=None):
+        self.path = path # location of the SQLite file
+        self.ttl = ttl # seconds a normal entry stays valid
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl # seconds a cached None stays valid (usually shorter)
+        self.max_entries = max_entries # maximum number of rows kept before the least recently used ones are evicted
+        self.hits = 0 # number of lookups answered from the cache
+        self.misses = 0 # number of lookups that had to go to the API
+        self.evictions = 0 # number of rows removed to stay under max_entries
+        self._lock = threading.Lock() # one connection shared by every thread, so access is serialised
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True) # make sure the cache folder exists
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30) # allow worker threads to use the connection
+        self._conn.execute("PRAGMA journal_mode=WAL") # lets several processes read while one writes
+        self._conn.execute("PRAGMA synchronous=NORMAL") # we can afford to lose the last few writes on a crash, it's a cache
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        # RETURNS THE CACHED VALUE FOR A KEY, OR MISSING IF IT IS NOT CACHED OR HAS EXPIRED
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now: # not cached, or cached but stale
+                self.misses += 1
+                return MISSING
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)) # mark as recently used for eviction
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def get_many(self, keys):
+        # RETURNS A DICT OF KEY -> VALUE FOR EVERY KEY THAT IS CACHED AND STILL VALID
+        keys = list(dict.fromkeys(keys)) # drop duplicates but keep order
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500): # SQLite limits the number of query parameters, so go in chunks
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE expires_at >= ? AND key IN ({placeholders})",
+                    [now] + chunk
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = json.loads(value)
+            if found:
+                self._conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, k) for k in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        # STORES A VALUE (None IS ALLOWED, AND IS CACHED FOR negative_ttl SECONDS)
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        # STORES SEVERAL VALUES IN ONE TRANSACTION AND EVICTS OLD ROWS IF THE CACHE IS TOO BIG
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            ttl = self.negative_ttl if value is None else self.ttl
+            rows.append((key, json.dumps(value, ensure_ascii=False), now + ttl, now))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows)
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        # REMOVES EXPIRED ROWS, THEN THE LEAST RECENTLY USED ROWS, UNTIL THE CACHE FITS IN max_entries
+        size = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if size <= self.max_entries:
+            return
+        removed = self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,)).rowcount # expired rows go first
+        overflow = size - removed - self.max_entries
+        if overflow > 0:
+            removed += self._conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            ).rowcount
+        self.evictions += removed
+
+    def clear(self):
+        # EMPTIES THE CACHE AND RESETS THE COUNTERS
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        # RETURNS HIT/MISS COUNTERS SO WE CAN SEE HOW MANY API ROUND-TRIPS THE CACHE SAVES
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, # each hit is one API call we did not make
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": size,
+        }
+
+class SingleFlight: # makes concurrent calls with the same key share one computation
+    def __init__(self):
+        self._calls = {} # key -> Future of the call in progress
+        self._lock = threading.Lock()
+        self.shared = 0 # callers that waited on someone else's computation instead of starting their own
+
+    def do(self, key, fn, *args, **kwargs):
+        # RUNS fn ONCE PER KEY AT A TIME; CALLERS THAT ARRIVE WHILE IT'S RUNNING GET THE SAME RESULT (OR EXCEPTION)
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+# regexes used to normalise artist and track names
+_FEAT_IN_BRACKETS = re.compile(r"[\(\[][^\)\]]*\b(feat|ft|featuring|with)\b[^\)\]]*[\)\]]") # e.g. "(feat. Rihanna)" or "[with SZA]"
+_FEAT_TRAILING = re.compile(r"\s+\b(feat|ft|featuring)\b\.?\s.*$") # e.g. "Song feat. Rihanna"
+_ARTIST_SEPARATORS = re.compile(r"\s*(?:,|&|\band\b|\bx\b|\bfeat\b\.?|\bft\b\.?|\bfeaturing\b|\bwith\b)\s*")
+_NON_WORD = re.compile(r"[^\w\s]") # punctuation
+_SPACES = re.compile(r"\s+")
+
+def _fold(text):
+    # LOWERCASES, STRIPS ACCENTS AND PUNCTUATION, AND COLLAPSES WHITESPACE
+    text = unicodedata.normalize("NFKD", text) # split accented characters into letter + accent
+    text = "".join(c for c in text if not unicodedata.combining(c)) # then drop the accents, e.g. "Beyoncé" -> "Beyonce"
+    text = text.lower().replace("'", "").replace("’", "") # "We're" and "We’re" -> "were"
+    text = _NON_WORD.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+def normalise_track_key(artists, track):
+    # BUILDS A CASE/PUNCTUATION/FEAT.-INSENSITIVE KEY FOR AN ARTIST + TITLE PAIR
+    title = _FEAT_IN_BRACKETS.sub(" ", track.lower()) # drop "(feat. X)" from the title
+    title = _FEAT_TRAILING.sub("", title) # and "feat. X" at the end of the title
+    names = _ARTIST_SEPARATORS.split(artists.lower()) # split "A, B & C feat. D" into single artists
+    names = sorted({_fold(n) for n in names if _fold(n)}) # artist order doesn't matter to the key
+    return f"{' '.join(names)}|{_fold(title)}"
+
+class LRUCache: # small thread-safe in-memory cache that drops the least recently used entry when full, with optional TTL
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl # seconds an entry stays valid, None = forever
+        self._data = OrderedDict() # key -> (expires_at, value), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] is not None and entry[0] < time.time(): # stale
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key) # mark as most recently used
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl if self.ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries: # evict the oldest entries
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+class TieredCache: # in-memory LRU in front of a PersistentCache, so hot keys never touch the disk
+    def __init__(self, store, memory_entries):
+        self.store = store # the on-disk PersistentCache
+        self.memory = LRUCache(memory_entries)
+        self.memory_hits = 0 # lookups answered from memory
+        self.disk_hits = 0 # lookups answered from the on-disk store
+        self.misses = 0 # lookups that had to go to the API
+
+    def get_many(self, keys):
+        # RETURNS A DICT OF KEY -> VALUE FOR EVERY KEY FOUND IN MEMORY OR ON DISK
+        found = {}
+        remaining = []
+        for key in keys:
+            value = self.memory.get(key)
+            if value is MISSING:
+                remaining.append(key)
+            else:
+                found[key] = value
+        self.memory_hits += len(found)
+
+        from_disk = self.store.get_many(remaining) # only go to disk for keys not held in memory
+        for key, value in from_disk.items():
+            self.memory.set(key, value) # promote to memory for next time
+        found.update(from_disk)
+        self.disk_hits += len(from_disk)
+        self.misses += len(set(remaining)) - len(from_disk)
+        return found
+
+    def set_many(self, items):
+        # STORES VALUES IN BOTH TIERS
+        for key, value in items.items():
+            self.memory.set(key, value)
+        self.store.set_many(items)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_size": len(self.memory),
+            "disk_size": self.store.stats()["size"],
+        }
+
+def normalise_prompt(text):
+    # NORMALISES A USER PROMPT SO "Chill  late-night drive!" AND "chill late night drive" SHARE A KEY
+    return _fold(text) # punctuation such as "-" becomes a space
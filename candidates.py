@@ -0,0 +1,140 @@
+import sys # for interning repeated strings
+import pickle # for compact serialisation
+import numpy as np
+
+FIELDS = ("artists", "track", "description", "ID", "spotify_url", "uri", "album_cover", "album_name") # per-track columns
+INTERNED = ("artists", "album_name") # columns whose values repeat across tracks, so each distinct string is stored once
+
+class CandidateTable: # a resolved candidate pool stored column by column, with its embedding matrix attached
+    # tables are never changed after they are built, so caches and sessions can share one without copying it;
+    # rankings are CandidateViews (the table plus row indices), and dicts are only built for the tracks that are shown
+    __slots__ = ("columns", "embeddings")
+
+    def __init__(self, columns, embeddings=None):
+        self.columns = columns # field -> list of values, one per row
+        self.embeddings = None if embeddings is None else np.asarray(embeddings, dtype=np.float32) # (rows, dim) or None
+
+    @classmethod
+    def from_tracks(cls, tracks, embeddings=None):
+        # BUILDS A TABLE FROM A LIST OF TRACK DICTS (FIELDS A TRACK DOESN'T HAVE ARE STORED AS None)
+        columns = {field: [t.get(field) for t in tracks] for field in FIELDS}
+        for field in INTERNED:
+            columns[field] = [sys.intern(v) if isinstance(v, str) else v for v in columns[field]]
+        if embeddings is not None and len(embeddings) != len(tracks):
+            raise ValueError(f"{len(tracks)} tracks but {len(embeddings)} embeddings")
+        return cls(columns, embeddings)
+
+    def __len__(self):
+        return len(self.columns["track"])
+
+    def row(self, i):
+        # RETURNS ROW i AS A NEW TRACK DICT, WITHOUT THE FIELDS THAT ARE None
+        return {field: values[i] for field, values in self.columns.items() if values[i] is not None}
+
+    def to_dicts(self):
+        return [self.row(i) for i in range(len(self))]
+
+    def texts(self, fmt):
+        # RETURNS fmt(track dict) FOR EVERY ROW, E.G. THE TEXT EMBEDDED FOR EACH TRACK
+        return [fmt(self.row(i)) for i in range(len(self))]
+
+    def with_embeddings(self, embeddings):
+        # RETURNS A TABLE SHARING THESE COLUMNS WITH A NEW EMBEDDING MATRIX
+        if len(embeddings) != len(self):
+            raise ValueError(f"{len(self)} rows but {len(embeddings)} embeddings")
+        return CandidateTable(self.columns, embeddings)
+
+    def merge(self, other, max_rows):
+        # RETURNS A TABLE OF THIS TABLE'S ROWS FOLLOWED BY other'S ROWS THAT AREN'T IN IT (BY TRACK ID), AT MOST max_rows
+        seen = set(self.columns["ID"])
+        keep = [i for i, track_id in enumerate(other.columns["ID"]) if track_id not in seen][:max(0, max_rows - len(self))]
+        columns = {field: self.columns[field][:max_rows] + [other.columns[field][i] for i in keep] for field in FIELDS}
+        embeddings = np.vstack([self.embeddings[:max_rows], other.embeddings[keep]])
+        return CandidateTable(columns, embeddings)
+
+    def take(self, indices, scores=None):
+        # RETURNS A VIEW OF THE GIVEN ROWS (E.G. THE TOP k) WITHOUT COPYING ANY COLUMN
+        return CandidateView(self, indices, scores)
+
+    def nbytes(self):
+        # RETURNS THE APPROXIMATE MEMORY HELD BY THE TABLE: LIST SLOTS, EACH DISTINCT STRING ONCE, AND THE EMBEDDINGS
+        seen = set()
+        size = sum(sys.getsizeof(values) for values in self.columns.values())
+        for values in self.columns.values():
+            for v in values:
+                if v is not None and id(v) not in seen:
+                    seen.add(id(v))
+                    size += sys.getsizeof(v)
+        return size + (self.embeddings.nbytes if self.embeddings is not None else 0)
+
+    def to_bytes(self):
+        # SERIALISES THE TABLE: COLUMNS AS PLAIN LISTS, EMBEDDINGS AS RAW float32 BYTES
+        emb = None if self.embeddings is None else (self.embeddings.shape, self.embeddings.tobytes())
+        return pickle.dumps((self.columns, emb), protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def from_bytes(cls, data):
+        columns, emb = pickle.loads(data)
+        for field in INTERNED: # interning isn't kept by pickle
+            columns[field] = [sys.intern(v) if isinstance(v, str) else v for v in columns[field]]
+        embeddings = None if emb is None else np.frombuffer(emb[1], dtype=np.float32).reshape(emb[0])
+        return cls(columns, embeddings)
+
+    def __getstate__(self):
+        return self.to_bytes()
+
+    def __setstate__(self, state):
+        table = CandidateTable.from_bytes(state)
+        self.columns, self.embeddings = table.columns, table.embeddings
+
+class CandidateView: # some rows of a CandidateTable, in a given order, with optional scores
+    __slots__ = ("table", "indices", "scores")
+
+    def __init__(self, table, indices, scores=None):
+        self.table = table
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.scores = None if scores is None else np.asarray(scores, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        # AN INT GIVES A TRACK DICT, A SLICE GIVES A SMALLER VIEW (E.G. view[:10])
+        if isinstance(key, slice):
+            return CandidateView(self.table, self.indices[key], None if self.scores is None else self.scores[key])
+        track = self.table.row(int(self.indices[key]))
+        if self.scores is not None:
+            track["similarity_score"] = float(self.scores[key])
+        return track
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def to_dicts(self):
+        # RETURNS THE VIEWED ROWS AS TRACK DICTS, WITH similarity_score WHEN THE VIEW HAS SCORES
+        return list(self)
+
+    @property
+    def embeddings(self):
+        # RETURNS THE VIEWED ROWS' EMBEDDINGS (A COPY, ONLY MADE WHEN ASKED FOR)
+        return None if self.table.embeddings is None else self.table.embeddings[self.indices]
+
+class SessionPool: # the candidate table behind a session's playlist, kept so a refined prompt can be re-ranked without the pipeline
+    __slots__ = ("prompt", "table", "query_vector", "size", "baseline", "last_action")
+
+    def __init__(self):
+        self.prompt = None # prompt the pool was built (or last refined) for
+        self.table = None # CandidateTable with embeddings, None until a playlist has been generated
+        self.query_vector = None # unit-length query the current playlist was ranked against
+        self.size = None # playlist length
+        self.baseline = None # mean similarity of the generated playlist to its own prompt, what a refinement is measured against
+        self.last_action = None # "reranked" or "fetched", for the UI
+
+    def set(self, prompt, table, query_vector, size, baseline):
+        self.prompt, self.table, self.size, self.baseline = prompt, table, size, baseline
+        vector = np.asarray(query_vector, dtype=np.float32)
+        self.query_vector = vector / (np.linalg.norm(vector) or 1.0)
+
+    def merge(self, table, max_rows):
+        # RETURNS A TABLE OF table'S ROWS FOLLOWED BY THE POOL'S ROWS THAT AREN'T IN IT (BY TRACK ID), AT MOST max_rows
+        return table.merge(self.table, max_rows)
@@ -0,0 +1,220 @@
+import os # for configuration from environment variables
+import re # for comparing numbers in titles
+import sys # for the command line entry point
+import json # for import/export
+import time # for timestamps
+import sqlite3 # catalog and full-text index live in one SQLite file
+import argparse # for the import/export commands
+import threading # one connection shared by every session
+
+from cache import CACHE_DIR, normalise_track_key
+from debugging import get_logger, fields
+
+log = get_logger("catalog")
+
+MIN_CONFIDENCE = float(os.getenv("CATALOG_MIN_CONFIDENCE", 0.7)) # fuzzy matches below this go to Spotify search instead
+FUZZY_CANDIDATES = 20 # rows fetched from the full-text index and scored per fuzzy lookup
+
+def trigrams(text):
+    # RETURNS THE SET OF 3-CHARACTER SLICES OF text, PADDED SO SHORT WORDS AND WORD EDGES COUNT
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+_NUMBERS = re.compile(r"\d+")
+
+def similarity(a, b):
+    # RETURNS THE TRIGRAM JACCARD SIMILARITY OF TWO NORMALISED STRINGS, FROM 0 TO 1
+    ta, tb = trigrams(a), trigrams(b)
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+class TrackCatalog: # local catalog of every track we have resolved, with the LLM spellings that mapped to it
+    # tables:
+    #   tracks      - one row per Spotify track: id, canonical name, artists, album, uri, url, cover
+    #   aliases     - normalised "artists|title" key -> track id, for every spelling that resolved to the track
+    #   track_index - FTS5 trigram index over the artists and title of every canonical name and alias
+    def __init__(self, path, min_confidence=MIN_CONFIDENCE):
+        self.path = path
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.exact_hits = 0 # lookups answered by an alias
+        self.fuzzy_hits = 0 # lookups answered by a close enough indexed name
+        self.low_confidence = 0 # lookups whose best match wasn't close enough
+        self.misses = 0 # lookups with nothing similar in the catalog
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "id TEXT PRIMARY KEY, name TEXT, artists TEXT, album_name TEXT, uri TEXT, spotify_url TEXT, album_cover TEXT, "
+            "added_at REAL, updated_at REAL);"
+            "CREATE TABLE IF NOT EXISTS aliases (key TEXT PRIMARY KEY, track_id TEXT, hits INTEGER DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS aliases_track ON aliases (track_id);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS track_index USING fts5(key UNINDEXED, track_id UNINDEXED, artists, title, tokenize='trigram');"
+        )
+        self._conn.commit()
+
+    def resolve(self, artists, track):
+        # RETURNS (track id, confidence) FOR AN LLM SUGGESTION, OR None IF SPOTIFY SHOULD BE SEARCHED
+        key = normalise_track_key(artists, track)
+        with self._lock:
+            row = self._conn.execute("SELECT track_id FROM aliases WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.exact_hits += 1
+                return row[0], 1.0
+            match = self._fuzzy(key)
+            if match is None:
+                self.misses += 1
+                return None
+            track_id, confidence = match
+            if confidence < self.min_confidence:
+                self.low_confidence += 1
+                log.debug("Catalog match too far off, searching Spotify", extra=fields(key=key, id=track_id, confidence=round(confidence, 3)))
+                return None
+            self.fuzzy_hits += 1
+            log.debug("Catalog fuzzy match", extra=fields(key=key, id=track_id, confidence=round(confidence, 3)))
+            self._add_alias(key, track_id) # next time this spelling is an exact hit
+            self._conn.commit()
+            return track_id, confidence
+
+    def _fuzzy(self, key):
+        # RETURNS (track id, confidence) OF THE BEST INDEXED NAME FOR key, OR None
+        artists, title = key.split("|", 1)
+        terms = " OR ".join(f'"{g}"' for g in trigrams(title) if len(g.strip()) == 3) # padding trigrams aren't in the index
+        if not terms:
+            return None
+        rows = self._conn.execute( # titles are more distinctive than artists, so candidates come from the title alone
+            "SELECT track_id, artists, title FROM track_index WHERE track_index MATCH ? ORDER BY rank LIMIT ?",
+            (f"title : ({terms})", FUZZY_CANDIDATES),
+        ).fetchall()
+        best = None
+        numbers = _NUMBERS.findall(title)
+        for track_id, row_artists, row_title in rows:
+            if _NUMBERS.findall(row_title) != numbers: # "Part 1" is never "Part 2", however similar the rest is
+                continue
+            confidence = min(similarity(title, row_title), similarity(artists, row_artists)) # both must be close
+            if best is None or confidence > best[1]:
+                best = (track_id, confidence)
+        return best
+
+    def _add_alias(self, key, track_id):
+        cur = self._conn.execute("INSERT OR IGNORE INTO aliases (key, track_id) VALUES (?, ?)", (key, track_id))
+        if cur.rowcount: # new spelling, index it for fuzzy lookups too
+            artists, title = key.split("|", 1)
+            self._conn.execute("INSERT INTO track_index (key, track_id, artists, title) VALUES (?, ?, ?, ?)",
+                               (key, track_id, artists, title))
+
+    def add(self, track_id, data, aliases=()):
+        # STORES A RESOLVED TRACK (SLIM SPOTIFY DATA) AND THE (artists, track) SPELLINGS THAT MAPPED TO IT
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tracks (id, name, artists, album_name, uri, spotify_url, album_cover, added_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET name = excluded.name, artists = excluded.artists, "
+                "album_name = excluded.album_name, uri = excluded.uri, spotify_url = excluded.spotify_url, "
+                "album_cover = excluded.album_cover, updated_at = excluded.updated_at",
+                (track_id, data["name"], data["artists"], data.get("album_name"), data.get("uri"),
+                 data.get("spotify_url"), data.get("album_cover"), now, now),
+            )
+            for artists, track in [(data["artists"], data["name"]), *aliases]: # the canonical name is an alias too
+                self._add_alias(normalise_track_key(artists, track), track_id)
+            self._conn.commit()
+
+    def get(self, track_id):
+        # RETURNS THE SLIM DATA OF A CATALOG TRACK, OR None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, artists, spotify_url, uri, album_cover, album_name FROM tracks WHERE id = ?", (track_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("name", "artists", "spotify_url", "uri", "album_cover", "album_name"), row))
+
+    def export(self, f):
+        # WRITES ONE JSON LINE PER TRACK, WITH ITS ALIAS KEYS, AND RETURNS THE NUMBER OF TRACKS
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, artists, album_name, uri, spotify_url, album_cover FROM tracks ORDER BY added_at"
+            ).fetchall()
+            aliases = {}
+            for key, track_id in self._conn.execute("SELECT key, track_id FROM aliases"):
+                aliases.setdefault(track_id, []).append(key)
+        for track_id, name, artists, album_name, uri, spotify_url, album_cover in rows:
+            f.write(json.dumps({"id": track_id, "name": name, "artists": artists, "album_name": album_name, "uri": uri,
+                                "spotify_url": spotify_url, "album_cover": album_cover,
+                                "aliases": aliases.get(track_id, [])}, ensure_ascii=False) + "\n")
+        log.info("Exported catalog tracks", extra=fields(tracks=len(rows)))
+        return len(rows)
+
+    def import_(self, f):
+        # LOADS TRACKS WRITTEN BY export (E.G. FROM ANOTHER DEPLOYMENT) AND RETURNS THE NUMBER OF TRACKS
+        count = 0
+        now = time.time()
+        with self._lock:
+            for line in f:
+                if not line.strip():
+                    continue
+                t = json.loads(line)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tracks (id, name, artists, album_name, uri, spotify_url, album_cover, added_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE((SELECT added_at FROM tracks WHERE id = ?), ?), ?)",
+                    (t["id"], t["name"], t["artists"], t.get("album_name"), t.get("uri"), t.get("spotify_url"),
+                     t.get("album_cover"), t["id"], now, now),
+                )
+                for key in t.get("aliases") or [normalise_track_key(t["artists"], t["name"])]:
+                    self._add_alias(key, t["id"])
+                count += 1
+            self._conn.commit()
+        log.info("Imported catalog tracks", extra=fields(tracks=count))
+        return count
+
+    def stats(self):
+        lookups = self.exact_hits + self.fuzzy_hits + self.low_confidence + self.misses
+        with self._lock:
+            tracks = self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            aliases = self._conn.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+        return {
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "low_confidence": self.low_confidence,
+            "misses": self.misses,
+            "local_resolution_rate": (self.exact_hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+            "tracks": tracks,
+            "aliases": aliases,
+        }
+
+# one catalog for the whole process (and every process using the same cache folder)
+catalog = TrackCatalog(os.path.join(CACHE_DIR, "catalog.sqlite3")) if os.getenv("CATALOG_ENABLED", "1") == "1" else None
+
+# method that reports how many candidates the catalog resolved without a Spotify search
+def get_catalog_stats():
+    return catalog.stats() if catalog else {}
+
+def main(argv=None):
+    # COMMAND LINE: python catalog.py export catalog.jsonl / python catalog.py import catalog.jsonl / python catalog.py stats
+    parser = argparse.ArgumentParser(description="Maintain the local track catalog.")
+    parser.add_argument("command", choices=["export", "import", "stats"])
+    parser.add_argument("file", nargs="?", default="-", help="JSONL file for export/import, - for stdout/stdin")
+    parser.add_argument("--path", default=os.path.join(CACHE_DIR, "catalog.sqlite3"))
+    args = parser.parse_args(argv)
+
+    cat = TrackCatalog(args.path)
+    if args.command == "stats":
+        print(json.dumps(cat.stats(), indent=2))
+        return
+    if args.command == "export":
+        f = sys.stdout if args.file == "-" else open(args.file, "w", encoding="utf-8")
+        count = cat.export(f)
+    else:
+        f = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+        count = cat.import_(f)
+    if f not in (sys.stdout, sys.stdin):
+        f.close()
+    print(f"[RESULT] {args.command.capitalize()}ed {count} tracks", file=sys.stderr)
+
+if __name__ == "__main__":
+    sys.exit(main())
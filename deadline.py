@@ -0,0 +1,176 @@
+import os # for configuration from environment variables
+import time # deadlines are monotonic times
+import threading # each attempt of a hedged call runs on its own thread
+import contextvars # carries the current request's deadline into every stage
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+from debugging import get_logger, fields, in_context
+from tracing import metrics
+
+log = get_logger("deadline")
+
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 30)) # seconds a request may take end to end, 0 for no limit
+LARGE_PLAYLIST_DEADLINE = float(os.getenv("LARGE_PLAYLIST_DEADLINE", 300)) # most seconds a large playlist's scaled-up deadline may reach
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1" # send a second copy of a slow Spotify call
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", 0.95)) # a call is slow once it has taken longer than this share of recent calls
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.2)) # never hedge sooner than this, in seconds
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 1.0)) # hedge delay until there are enough timings to go on
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", 0.1)) # at most this share of calls get a hedge, so a slow Spotify isn't sent twice the load
+HEDGE_MIN_SAMPLES = 20 # timings needed before the quantile is trusted
+HEDGE_DELAY_REFRESH = 1.0 # seconds between recomputing a stage's hedge delay
+
+class DeadlineExceeded(TimeoutError): # the current request's budget for a stage ran out
+    pass
+
+class Deadline: # one request's time budget, split into a cumulative cut-off per stage
+    # stage -> share of the budget that may have gone by when the stage has to be done; stages of the streaming
+    # pipeline overlap, so these are cut-offs from the start of the request rather than separate slices
+    SPLIT = {
+        "llm": 0.5,
+        "search": 0.75,
+        "fetch": 0.85,
+        "rank": 1.0, # embedding and ranking are never cut short, ranking works on whatever resolved by then
+    }
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = time.monotonic()
+
+    def remaining(self, stage):
+        # RETURNS THE SECONDS LEFT BEFORE stage HAS TO BE DONE (CAN BE NEGATIVE)
+        return self.start + self.seconds * self.SPLIT.get(stage, 1.0) - time.monotonic()
+
+    def expired(self, stage):
+        return self.remaining(stage) <= 0
+
+class HedgeStats: # process-wide counts of hedged calls and deadline cut-offs
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0 # second attempts sent
+        self.hedge_wins = 0 # second attempts that answered first
+        self.cancelled = 0 # attempts abandoned because the other one won or the deadline passed
+        self.deadline_exceeded = 0 # calls that ran out of budget
+
+    def add(self, **counts):
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def may_hedge(self):
+        with self._lock:
+            if self.hedges >= HEDGE_MAX_RATIO * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def snapshot(self):
+        with self._lock:
+            return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                    "cancelled": self.cancelled, "deadline_exceeded": self.deadline_exceeded}
+
+stats = HedgeStats()
+current_deadline = contextvars.ContextVar("deadline", default=None) # deadline of the request this thread is working on
+_cancelled = contextvars.ContextVar("cancelled", default=None) # set on an attempt of a hedged call nobody is waiting for any more
+_delays = {} # stage -> (computed at, hedge delay)
+
+# method that gives the current request a deadline, seconds=0 for none
+def start_deadline(seconds=None):
+    seconds = REQUEST_DEADLINE if seconds is None else seconds
+    deadline = Deadline(seconds) if seconds > 0 else None
+    current_deadline.set(deadline)
+    return deadline
+
+# method that returns the seconds left for a stage of the current request, or None if it has no deadline
+def remaining(stage):
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline.remaining(stage)
+
+# method that checks whether a stage of the current request is out of time
+def expired(stage):
+    deadline = current_deadline.get()
+    return deadline is not None and deadline.expired(stage)
+
+# method that tells a scheduled call whether its caller has given up on it, so it can be dropped before it is sent
+def cancelled():
+    event = _cancelled.get()
+    return event is not None and event.is_set()
+
+# method that returns how long a call of a stage may run before it gets a hedge
+def hedge_delay(stage):
+    now = time.monotonic()
+    cached = _delays.get(stage)
+    if cached and now - cached[0] < HEDGE_DELAY_REFRESH:
+        return cached[1]
+    q = metrics.quantile(f"{stage}_call", HEDGE_QUANTILE, min_count=HEDGE_MIN_SAMPLES)
+    delay = HEDGE_DEFAULT_DELAY if q is None else max(HEDGE_MIN_DELAY, q)
+    _delays[stage] = (now, delay)
+    return delay
+
+def _attempt(stage, fn, args, kwargs):
+    # STARTS fn ON ITS OWN THREAD AND RETURNS (future, cancel event)
+    future, cancel = Future(), threading.Event()
+
+    def _run():
+        _cancelled.set(cancel)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            metrics.observe(f"{stage}_call", time.perf_counter() - start, error=True)
+            future.set_exception(e)
+        else:
+            metrics.observe(f"{stage}_call", time.perf_counter() - start)
+            future.set_result(result)
+
+    # a plain daemon thread rather than a pool, so a hung call never holds up anyone else's
+    threading.Thread(target=in_context(_run), name=f"{stage}-attempt", daemon=True).start()
+    return future, cancel
+
+# method that runs a Spotify call within the current request's budget for stage, hedging it if it is slow
+def hedged(stage, fn, *args, **kwargs):
+    # RETURNS THE FIRST SUCCESSFUL RESULT OF fn(*args, **kwargs); IF IT TAKES LONGER THAN THE STAGE'S HEDGE DELAY
+    # A SECOND ATTEMPT IS SENT AND WHICHEVER ANSWERS FIRST WINS; RAISES DeadlineExceeded WHEN THE BUDGET RUNS OUT
+    # (THE ABANDONED ATTEMPTS CAN'T BE INTERRUPTED, BUT ANY STILL WAITING FOR THE SCHEDULER ARE DROPPED UNSENT)
+    stats.add(calls=1)
+    left = remaining(stage)
+    if left is not None and left <= 0:
+        stats.add(deadline_exceeded=1)
+        raise DeadlineExceeded(f"No time left for {stage}")
+
+    first, cancel = _attempt(stage, fn, args, kwargs)
+    attempts = {first: cancel} # future -> cancel event
+    pending = {first}
+    delay = hedge_delay(stage) if HEDGE_ENABLED else None
+    error = None
+    while pending:
+        left = remaining(stage)
+        timeout = left if delay is None else (delay if left is None else min(delay, left))
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    attempts[other].set()
+                stats.add(cancelled=len(pending), hedge_wins=int(future is not first))
+                return future.result()
+            error = future.exception()
+        if done:
+            continue
+        if delay is not None and (left is None or left > delay): # slow, not out of time: send a second copy
+            delay = None # only one hedge per call
+            if stats.may_hedge():
+                future, cancel = _attempt(stage, fn, args, kwargs)
+                attempts[future] = cancel
+                pending.add(future)
+                log.debug("Hedging slow call", extra=fields(stage=stage))
+            continue
+        if left is not None and left <= timeout: # out of time
+            for future in pending:
+                attempts[future].set()
+            stats.add(cancelled=len(pending), deadline_exceeded=1)
+            raise DeadlineExceeded(f"{stage} call didn't finish within the request deadline")
+    raise error
+
+# method that reports hedges sent and won, and calls cut off by the deadline
+def get_deadline_stats():
+    return stats.snapshot()
@@ -1,9 +1,112 @@
+import os # for configuration from environment variables
+import sys # logs go to stderr
+import copy # artifacts are snapshotted before the request carries on changing them
 import json
-# method to save json file
+import time # for log timestamps
+import queue # artifacts waiting to be written
+import uuid # for request ids
+import logging
+import threading # artifacts are written on a background thread
+import contextvars # carries the request id into log lines and artifact paths
+
+from cache import CACHE_DIR
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper() # DEBUG shows per-track detail
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text") # "json" for one JSON object per line
+DEBUG_ARTIFACTS = os.getenv("DEBUG_ARTIFACTS", "0") == "1" # write the intermediate track lists of every request to disk
+ARTIFACTS_DIR = os.getenv("DEBUG_ARTIFACTS_DIR", os.path.join(CACHE_DIR, "artifacts")) # one sub folder per request
+
+request_id = contextvars.ContextVar("request_id", default="-") # id of the request the current thread is working on
+
+class StructuredFormatter(logging.Formatter): # "time level logger [request] message key=value ..." or a JSON object per line
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        if LOG_FORMAT == "json":
+            entry = {"time": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                     "request_id": record.request_id, "message": record.getMessage(), **fields}
+            if record.exc_info:
+                entry["exception"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} {record.name} [{record.request_id}] {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class _RequestIdFilter(logging.Filter): # stamps every record with the current request id
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+_root = logging.getLogger("playlist") # every module logs under playlist.<module>
+if not _root.handlers: # streamlit re-imports on reruns, only add the handler once
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(StructuredFormatter())
+    _handler.addFilter(_RequestIdFilter())
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False # keep our lines out of streamlit's own logging
+
+# method that returns the logger for a module
+def get_logger(name):
+    return _root.getChild(name)
+
+# method that builds the extra= argument for structured fields, e.g. log.info("Resolved tracks", extra=fields(found=3, total=4))
+def fields(**kwargs):
+    return {"fields": kwargs}
+
+# method that starts a new request, so its log lines and artifacts can be told apart from other sessions'
+def new_request():
+    rid = uuid.uuid4().hex[:8]
+    request_id.set(rid)
+    return rid
+
+# method that runs fn in a copy of the caller's context, for work handed to other threads
+def in_context(fn):
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+class ArtifactWriter: # writes debug JSON files on a background thread, so requests never wait on disk
+    def __init__(self, folder):
+        self.folder = folder
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def write(self, rid, filename, output):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="artifact-writer", daemon=True)
+                self._worker.start()
+        self._queue.put((rid, filename, copy.deepcopy(output))) # snapshot, the pipeline keeps changing the tracks
+
+    def _run(self):
+        log = get_logger("debugging")
+        while True:
+            rid, filename, output = self._queue.get()
+            path = os.path.join(self.folder, rid, filename)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(output, f, indent=2, ensure_ascii=False)
+                self.written += 1
+                log.debug("Wrote debug artifact", extra=fields(path=path))
+            except Exception as e:
+                self.failed += 1
+                log.error("Failed to write debug artifact", extra=fields(path=path, error=e))
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        # WAITS UNTIL EVERY QUEUED ARTIFACT HAS BEEN WRITTEN
+        self._queue.join()
+
+artifact_writer = ArtifactWriter(ARTIFACTS_DIR)
+
+# method to save json file for debugging, a no-op unless DEBUG_ARTIFACTS=1
 def save(output, filename):
-    print(f"[INFO] Writing JSON output to {filename}")
-    try:
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(output, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"[ERROR] Failed to write JSON output to {filename}")
\ No newline at end of file
+    if DEBUG_ARTIFACTS:
+        artifact_writer.write(request_id.get(), filename, output)
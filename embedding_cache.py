@@ -0,0 +1,210 @@
+import os # for file paths and sizes
+import re # for normalising text
+import sys # for the command line entry point
+import json # for the metadata file
+import fcntl # for locking the files between processes
+import hashlib # for content-addressed keys
+import argparse # for the compaction command
+import threading # for sharing one cache between streamlit sessions
+import unicodedata # for normalising text
+import numpy as np # vectors are stored as a float32 matrix
+
+from cache import CACHE_DIR # shared cache folder
+from debugging import get_logger, fields
+
+log = get_logger("embedding_cache")
+
+_SPACES = re.compile(r"\s+")
+
+def normalise_text(text):
+    # NORMALISES TEXT BEFORE HASHING, SO WHITESPACE/UNICODE DIFFERENCES DON'T CAUSE A MISS
+    return _SPACES.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+def embedding_key(model_name, text):
+    # RETURNS THE CONTENT ADDRESS OF A TEXT FOR A GIVEN MODEL
+    return hashlib.sha256(f"{model_name}\0{normalise_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache: # content-addressed embedding store: append-only float32 file, memory-mapped, with an index file
+    # layout of the cache folder (one folder per model):
+    #   vectors.f32 - every embedding one after another as raw float32, row i starts at byte i * dim * 4
+    #   index.tsv   - one "key<TAB>row" line per embedding, appended after the vector is written
+    #   meta.json   - model name and embedding dimension
+    #   .lock       - file lock so several processes can append safely
+    def __init__(self, folder, model_name):
+        self.model_name = model_name
+        self.folder = os.path.join(folder, re.sub(r"[^\w.-]", "_", model_name)) # e.g. .cache/embeddings/BAAI_bge-small-en-v1.5
+        os.makedirs(self.folder, exist_ok=True)
+        self.vectors_path = os.path.join(self.folder, "vectors.f32")
+        self.index_path = os.path.join(self.folder, "index.tsv")
+        self.meta_path = os.path.join(self.folder, "meta.json")
+        self.lock_path = os.path.join(self.folder, ".lock")
+
+        self.hits = 0 # texts answered from the cache
+        self.misses = 0 # texts that had to be encoded
+        self.dim = None # embedding size, known after the first write
+        self._rows = {} # key -> row number in vectors.f32
+        self._index_offset = 0 # how far through index.tsv we have read
+        self._index_inode = None # changes when the files are compacted, which means we need to reload
+        self._mmap = None # memory map over vectors.f32
+        self._lock = threading.Lock()
+
+    def _file_lock(self, exclusive):
+        # RETURNS AN OPEN LOCK FILE HOLDING A SHARED OR EXCLUSIVE LOCK (CLOSE IT TO RELEASE)
+        f = open(self.lock_path, "a")
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return f
+
+    def _refresh(self):
+        # PICKS UP ENTRIES APPENDED BY OTHER PROCESSES (OR RELOADS EVERYTHING AFTER A COMPACTION)
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self.index_path):
+            return
+
+        inode = os.stat(self.index_path).st_ino
+        if inode != self._index_inode: # files were replaced by compaction, start again
+            self._rows = {}
+            self._index_offset = 0
+            self._mmap = None
+            self._index_inode = inode
+
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1 # only use complete lines
+        for line in data[:end].decode("utf-8").splitlines():
+            key, row = line.split("\t")
+            self._rows[key] = int(row)
+        self._index_offset += end
+
+    def _compacted(self):
+        # TRUE IF ANOTHER PROCESS HAS REPLACED THE FILES SINCE WE LAST READ THEM
+        try:
+            return os.stat(self.index_path).st_ino != self._index_inode
+        except FileNotFoundError:
+            return False
+
+    def _vectors(self, needed_rows):
+        # RETURNS A MEMORY MAP COVERING AT LEAST needed_rows ROWS, REMAPPING IF THE FILE HAS GROWN
+        if self._mmap is None or self._mmap.shape[0] < needed_rows:
+            rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._mmap
+
+    def lookup(self, keys):
+        # RETURNS A DICT OF KEY -> VECTOR FOR EVERY KEY ALREADY IN THE CACHE
+        with self._lock:
+            if any(k not in self._rows for k in keys) or self._compacted():
+                with self._file_lock(exclusive=False):
+                    self._refresh() # another process may have added them since we last looked
+            rows = {k: self._rows[k] for k in keys if k in self._rows}
+            if not rows:
+                return {}
+            mm = self._vectors(max(rows.values()) + 1)
+            return {k: np.array(mm[r]) for k, r in rows.items()} # copy out of the map
+
+    def add(self, items):
+        # APPENDS NEW KEY -> VECTOR PAIRS TO THE STORE
+        if not items:
+            return
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh() # skip anything another process wrote while we were encoding
+            new = {k: v for k, v in items.items() if k not in self._rows}
+            if not new:
+                return
+            matrix = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim}, f)
+
+            with open(self.vectors_path, "ab") as f: # vectors first, so an index line never points at missing data
+                start = f.tell() // (self.dim * 4)
+                if f.tell() != start * self.dim * 4: # a torn write left part of a row, drop it so new rows start on a row boundary
+                    log.warning("Dropping a partly written embedding", extra=fields(bytes=f.tell() - start * self.dim * 4))
+                    f.truncate(start * self.dim * 4)
+                f.write(matrix.tobytes())
+            lines = []
+            for i, key in enumerate(new):
+                self._rows[key] = start + i
+                lines.append(f"{key}\t{start + i}\n")
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+            self._index_inode = os.stat(self.index_path).st_ino
+            self._index_offset = os.path.getsize(self.index_path)
+
+    def encode(self, model, texts, **kwargs):
+        # RETURNS A (len(texts), dim) FLOAT32 MATRIX, ONLY SENDING UNSEEN TEXTS TO model.encode
+        keys = [embedding_key(self.model_name, t) for t in texts]
+        found = self.lookup(keys)
+
+        unseen = {} # key -> text, de-duplicated
+        for key, text in zip(keys, texts):
+            if key not in found:
+                unseen.setdefault(key, text)
+        self.hits += len(texts) - len(unseen)
+        self.misses += len(unseen)
+
+        if unseen:
+            log.debug("Embedding cache lookup", extra=fields(cached=len(texts) - len(unseen), to_encode=len(unseen)))
+            vectors = model.encode(list(unseen.values()), convert_to_numpy=True, **kwargs)
+            new = dict(zip(unseen, np.asarray(vectors, dtype=np.float32)))
+            self.add(new)
+            found.update(new)
+        return np.stack([found[k] for k in keys])
+
+    def compact(self, max_entries=None):
+        # REWRITES THE STORE WITHOUT DUPLICATE ROWS, KEEPING ONLY THE NEWEST max_entries EMBEDDINGS
+        with self._lock, self._file_lock(exclusive=True):
+            self._index_inode = None # force a full reload of the index
+            self._refresh()
+            if self.dim is None:
+                return 0, 0
+            keys = sorted(self._rows, key=self._rows.get) # oldest first
+            before = os.path.getsize(self.vectors_path) // (self.dim * 4)
+            if max_entries is not None:
+                keys = keys[-max_entries:] if max_entries > 0 else []
+
+            mm = self._vectors(before)
+            matrix = np.asarray(mm[[self._rows[k] for k in keys]], dtype=np.float32).reshape(len(keys), self.dim)
+            with open(self.vectors_path + ".tmp", "wb") as f:
+                f.write(matrix.tobytes())
+            with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write("".join(f"{k}\t{i}\n" for i, k in enumerate(keys)))
+            os.replace(self.vectors_path + ".tmp", self.vectors_path) # swap in atomically; other processes notice the new inode
+            os.replace(self.index_path + ".tmp", self.index_path)
+
+            self._index_inode = None
+            self._refresh()
+            return before, len(keys)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._rows),
+        }
+
+def main(argv=None):
+    # COMMAND LINE: python embedding_cache.py compact --max-entries 100000
+    parser = argparse.ArgumentParser(description="Maintain the on-disk embedding cache.")
+    parser.add_argument("command", choices=["compact", "stats"])
+    parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    parser.add_argument("--folder", default=os.path.join(CACHE_DIR, "embeddings"))
+    parser.add_argument("--max-entries", type=int, default=None, help="keep only the newest N embeddings")
+    args = parser.parse_args(argv)
+
+    cache = EmbeddingCache(args.folder, args.model)
+    if args.command == "compact":
+        before, after = cache.compact(args.max_entries)
+        print(f"[RESULT] Compacted embedding cache from {before} to {after} rows")
+    else:
+        with cache._file_lock(exclusive=False):
+            cache._refresh()
+        print(f"[RESULT] {len(cache._rows)} embeddings, dim={cache.dim}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import os # for configuration and socket paths
+import sys # for the command line entry point
+import json # request/response headers over the socket
+import time # for the batching window
+import queue # encode requests waiting for the batcher
+import socket # for the shared out-of-process service
+import struct # length-prefixed messages
+import argparse # for the serve command
+import threading # batcher and socket handler threads
+import socketserver
+from concurrent.futures import Future
+import numpy as np
+from debugging import get_logger, fields
+
+log = get_logger("embedding_service")
+
+class EmbeddingService: # collects encode requests from every session for a few ms and runs them through the model as one batch
+    def __init__(self, encode_fn, max_batch_size=64, max_wait_ms=5):
+        self.encode_fn = encode_fn # takes a list of texts and returns an (n, dim) array
+        self.max_batch_size = max_batch_size # most texts in one model call
+        self.max_wait = max_wait_ms / 1000 # how long the first request in a batch waits for others to join
+        self._requests = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        self.batches = 0 # model calls made
+        self.texts = 0 # texts encoded
+        self.requests = 0 # encode() calls served
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def encode(self, texts, **kwargs):
+        # RETURNS AN (len(texts), dim) FLOAT32 ARRAY; BLOCKS UNTIL THE BATCH THIS REQUEST JOINED HAS BEEN ENCODED
+        # kwargs are accepted so this can stand in for model.encode, the service always returns numpy
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        self._start()
+        future = Future()
+        self._requests.put((texts, future))
+        return future.result()
+
+    def _collect(self):
+        # WAITS FOR A REQUEST, THEN KEEPS COLLECTING UNTIL THE BATCH IS FULL OR max_wait HAS PASSED
+        batch = [self._requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [t for request_texts, _ in batch for t in request_texts]
+            try:
+                vectors = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            self.requests += len(batch)
+            start = 0
+            for request_texts, future in batch: # route each slice back to its caller
+                future.set_result(vectors[start:start + len(request_texts)])
+                start += len(request_texts)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 1) if self.batches else 0.0,
+        }
+
+def _send(sock, header, payload=b""):
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(struct.pack("!II", len(data), len(payload)) + data + payload)
+
+def _recv_exact(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(n)
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+def _recv(sock):
+    header_len, payload_len = struct.unpack("!II", _recv_exact(sock, 8))
+    return json.loads(_recv_exact(sock, header_len)), _recv_exact(sock, payload_len)
+
+class RemoteEmbeddingClient: # talks to an embedding service in another process over a local unix socket
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._local = threading.local() # one connection per thread
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def encode(self, texts, **kwargs):
+        texts = list(texts)
+        try:
+            sock = self._connection()
+            _send(sock, {"texts": texts})
+            header, payload = _recv(sock)
+        except (OSError, ConnectionError):
+            self._local.sock = None # reconnect on the next call
+            raise
+        if "error" in header:
+            raise RuntimeError(f"Embedding service error: {header['error']}")
+        return np.frombuffer(payload, dtype=np.float32).reshape(header["shape"])
+
+def serve(service, socket_path):
+    # SERVES service OVER A UNIX SOCKET UNTIL INTERRUPTED, SO SEVERAL STREAMLIT REPLICAS CAN SHARE ONE MODEL AND ONE BATCHER
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            while True:
+                try:
+                    header, _ = _recv(self.request)
+                except ConnectionError:
+                    return
+                try:
+                    vectors = service.encode(header["texts"])
+                    _send(self.request, {"shape": list(vectors.shape)}, vectors.tobytes())
+                except Exception as e:
+                    _send(self.request, {"error": str(e)})
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path) # stale socket from an earlier run
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    log.info("Embedding service listening", extra=fields(socket=socket_path))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+def main(argv=None):
+    # COMMAND LINE: python embedding_service.py serve --socket /tmp/playlist-embeddings.sock
+    parser = argparse.ArgumentParser(description="Run a shared micro-batching embedding service.")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SOCKET", "/tmp/playlist-embeddings.sock"))
+    parser.add_argument("--max-batch-size", type=int, default=int(os.getenv("EMBEDDING_MAX_BATCH", 64)))
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5)))
+    args = parser.parse_args(argv)
+
+    from encoders import load_encoder
+    from semantic_ranker import MODEL_NAME
+    model = load_encoder(MODEL_NAME) # loaded here directly: with EMBEDDING_SOCKET set, semantic_ranker would wait on this very service
+    service = EmbeddingService(lambda texts: model.encode(texts, convert_to_numpy=True, batch_size=args.max_batch_size),
+                               max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    serve(service, args.socket)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import os # for configuration from environment variables
+import re # for folder names
+import json # for the export metadata
+import fcntl # for locking the export between processes
+import shutil # for replacing a stale export
+import tempfile # exports are written next to their final folder, then moved into place
+import numpy as np
+
+from cache import CACHE_DIR
+from debugging import get_logger, fields
+
+log = get_logger("encoders")
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch") # torch, onnx or onnx-int8
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 0)) # intra-op threads for the model, 0 for the runtime's default
+ONNX_DIR = os.path.join(CACHE_DIR, "onnx") # exported models, one folder per model
+EXPORT_VERSION = 1 # bump when the export format changes, so old exports are redone
+
+# an encoder is anything with encode(texts, convert_to_numpy=True, batch_size=...) returning one float32 row per text,
+# the same call as SentenceTransformer.encode, so the embedding cache and the embedding service work with every backend
+
+class OnnxEncoder: # a sentence-transformers model exported to ONNX, run with ONNX Runtime (no torch import at run time)
+    def __init__(self, folder, quantized=False, threads=EMBEDDING_THREADS):
+        import onnxruntime as ort # optional dependency, only needed for the ONNX backends
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(folder, "export.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1 # one graph at a time, parallelism comes from the intra-op threads
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = "model_int8.onnx" if quantized else "model.onnx"
+        self.session = ort.InferenceSession(os.path.join(folder, model_file), options, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(folder, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.meta["max_length"])
+        self.tokenizer.enable_padding(pad_id=self.meta["pad_id"], pad_token=self.meta["pad_token"])
+
+    def get_sentence_embedding_dimension(self):
+        return self.meta["dimension"]
+
+    def encode(self, texts, convert_to_numpy=True, batch_size=32, **kwargs):
+        # RETURNS (len(texts), dim) float32 EMBEDDINGS, POOLED AND NORMALISED THE SAME WAY AS THE SENTENCE-TRANSFORMERS MODEL
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size=batch_size)[0]
+        order = np.argsort([-len(t) for t in texts], kind="stable") # similar lengths share a batch, so there's less padding
+        result = np.zeros((len(texts), self.meta["dimension"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([texts[i] for i in rows])
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": mask,
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            tokens = self.session.run(None, {name: value for name, value in feeds.items() if name in self.inputs})[0]
+            result[rows] = _pool(tokens, mask, self.meta["pooling"])
+        if self.meta["normalize"]:
+            result /= np.maximum(np.linalg.norm(result, axis=1, keepdims=True), 1e-12)
+        return result
+
+def _pool(tokens, mask, mode):
+    # RETURNS ONE VECTOR PER TEXT FROM ITS TOKEN EMBEDDINGS
+    if mode == "cls":
+        return tokens[:, 0]
+    weights = mask[:, :, None].astype(np.float32)
+    if mode == "mean":
+        return (tokens * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+    if mode == "max":
+        return np.where(weights > 0, tokens, -1e9).max(axis=1)
+    raise ValueError(f"Unsupported pooling mode for ONNX: {mode}")
+
+def export_folder(model_name):
+    return os.path.join(ONNX_DIR, re.sub(r"[^\w.-]", "_", model_name))
+
+# method that exports a sentence-transformers model to ONNX (and an int8 copy if asked), once, and returns the folder
+def export_onnx(model_name, quantized=False):
+    folder = export_folder(model_name)
+    if _exported(folder, quantized):
+        return folder
+    os.makedirs(ONNX_DIR, exist_ok=True)
+    with open(f"{folder}.lock", "a") as lock: # next to the folder, which is replaced by an export
+        fcntl.flock(lock, fcntl.LOCK_EX) # one process exports, the others wait and then find it done
+        if not _exported(folder, False):
+            _export(model_name, folder)
+        if quantized and not _exported(folder, True):
+            _quantize(folder)
+    return folder
+
+def _exported(folder, quantized):
+    # RETURNS WHETHER folder HOLDS A CURRENT EXPORT (WITH ITS int8 COPY IF quantized)
+    meta_path = os.path.join(folder, "export.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, encoding="utf-8") as f:
+        if json.load(f).get("version") != EXPORT_VERSION:
+            return False
+    return not quantized or os.path.exists(os.path.join(folder, "model_int8.onnx"))
+
+def _export(model_name, folder):
+    # WRITES model.onnx (TOKENS -> TOKEN EMBEDDINGS), tokenizer.json AND export.json (POOLING, NORMALISATION, LENGTHS)
+    # this is the only step that needs torch, later loads just read the folder
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    log.info("Exporting embedding model to ONNX...", extra=fields(model=model_name))
+    model = SentenceTransformer(model_name, device="cpu")
+    kinds = [type(module).__name__ for module in model]
+    if kinds[0] != "Transformer" or not set(kinds[1:]) <= {"Pooling", "Normalize"} or "Pooling" not in kinds:
+        raise ValueError(f"Can't export {model_name} to ONNX: modules {kinds}, only Transformer -> Pooling -> Normalize is supported")
+    pooling = model[kinds.index("Pooling")].get_config_dict()["pooling_mode"]
+    if pooling not in ("cls", "mean", "max"):
+        raise ValueError(f"Can't export {model_name} to ONNX: pooling mode {pooling}")
+
+    class _TokenEmbeddings(torch.nn.Module): # the transformer alone, returning its last hidden state
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.transformer(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).last_hidden_state
+
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    sample = model.tokenizer(["an example sentence", "another one"], return_tensors="pt", padding=True)
+    if "token_type_ids" not in sample:
+        sample["token_type_ids"] = torch.zeros_like(sample["input_ids"])
+
+    os.makedirs(ONNX_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=ONNX_DIR, prefix=".export-")
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(model[0].auto_model).eval(), tuple(sample[name] for name in names),
+            os.path.join(staging, "model.onnx"), input_names=names, output_names=["token_embeddings"],
+            dynamic_axes={name: {0: "batch", 1: "tokens"} for name in names + ["token_embeddings"]},
+            opset_version=17, dynamo=False,
+        )
+    model.tokenizer.save_pretrained(staging)
+    meta = {
+        "version": EXPORT_VERSION,
+        "model": model_name,
+        "pooling": pooling,
+        "normalize": "Normalize" in kinds,
+        "max_length": model.max_seq_length,
+        "pad_id": model.tokenizer.pad_token_id,
+        "pad_token": model.tokenizer.pad_token,
+        "dimension": model.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(staging, "export.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    if os.path.exists(folder): # a stale export, or one from an older version, is moved aside so the new one can take its place
+        stale = tempfile.mkdtemp(dir=ONNX_DIR, prefix=".stale-")
+        os.replace(folder, os.path.join(stale, "export"))
+        shutil.rmtree(stale, ignore_errors=True)
+    os.replace(staging, folder) # callers hold the export lock, so nobody sees a half-written folder
+    log.info("Exported embedding model to ONNX", extra=fields(model=model_name, folder=folder))
+
+def _quantize(folder):
+    # WRITES model_int8.onnx: DYNAMIC int8 QUANTIZATION OF THE WEIGHTS, ACTIVATIONS ARE QUANTIZED PER BATCH AT RUN TIME
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    log.info("Quantizing ONNX embedding model to int8...", extra=fields(folder=folder))
+    staging = os.path.join(folder, f".model_int8.{os.getpid()}.onnx")
+    quantize_dynamic(os.path.join(folder, "model.onnx"), staging, weight_type=QuantType.QInt8)
+    os.replace(staging, os.path.join(folder, "model_int8.onnx"))
+
+def _load_torch(model_name, threads):
+    from sentence_transformers import SentenceTransformer # imports torch, which is slow, so it stays off the import path
+    if threads: # cap torch's intra-op threads so it doesn't fight the request threads for cores
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name)
+
+def _load_onnx(model_name, threads):
+    return OnnxEncoder(export_onnx(model_name), threads=threads)
+
+def _load_onnx_int8(model_name, threads):
+    return OnnxEncoder(export_onnx(model_name, quantized=True), quantized=True, threads=threads)
+
+BACKENDS = { # backend name -> loader(model name, intra-op threads)
+    "torch": _load_torch,
+    "onnx": _load_onnx,
+    "onnx-int8": _load_onnx_int8,
+}
+
+# method that loads the embedding model with the chosen backend
+def load_encoder(model_name, backend=EMBEDDING_BACKEND, threads=EMBEDDING_THREADS):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](model_name, threads)
+
+# method that returns the name embeddings are cached under: backends that give the same vectors share a cache
+def cache_name(model_name, backend=EMBEDDING_BACKEND):
+    return f"{model_name}@int8" if backend == "onnx-int8" else model_name
@@ -1,9 +1,19 @@
 import os
+import math # for splitting the track count between shards
+import queue # shard results are handed back as they arrive
+import threading # for creating the shared client once
+import time # for the time to first streamed track
+from collections import deque # recent validity of each model's responses
+import httpx # HTTP client with a keep-alive connection pool
 from groq import Groq
 from dotenv import load_dotenv # reads variables from .env file and exports them in the os
-import json # for converting response to JSON
 from pydantic import BaseModel # for structured JSON response
-from debugging import save # import debugging json method
+from cache import normalise_track_key # for dropping tracks that more than one shard suggested
+from debugging import save, get_logger, fields, in_context # debugging artifacts and structured logging
+from tracing import span, metrics, expect, advance, finish # stage timings and request progress
+from deadline import remaining, DeadlineExceeded # per-request time budget
+
+log = get_logger("groq")
 
 class CandidateTrack(BaseModel): # class for storing track data as a dict
     artists: str
@@ -13,33 +23,49 @@ class CandidateTrack(BaseModel): # class for storing track data as a dict
 class CandidateTrackList(BaseModel): # class for storing track dictionaries in a list
     tracks: list[CandidateTrack]
 
-def get_groq_client(): # method that returns Groq API client
+POOL_SIZE = int(os.getenv("GROQ_POOL_SIZE", 10)) # keep-alive connections to Groq
+LLM_SHARDS = int(os.getenv("LLM_SHARDS", 1)) # concurrent smaller calls per request, 1 for a single call
+SHARD_EXTRA = int(os.getenv("LLM_SHARD_EXTRA", 2)) # extra tracks asked of each shard, to make up for duplicates between shards
+ROUND_CONCURRENCY = int(os.getenv("LLM_ROUND_CONCURRENCY", 4)) # calls in flight at once when a large playlist needs many rounds
+MAX_EXCLUDE = int(os.getenv("LLM_MAX_EXCLUDE", 300)) # most recent tracks listed as "already in the playlist" in each round's prompt
+MAX_EMPTY_ROUNDS = 3 # rounds in a row without a new track before we accept the model has run out of ideas
+
+_client = None # shared client for the life of the process
+_client_lock = threading.Lock()
+
+def get_groq_client(): # method that returns the shared Groq API client
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _create_groq_client()
+        return _client
+
+def _create_groq_client():
     # INITIALISES AND RETURNS A GROQ API CLIENT
-    print("\n[INFO] Setting up Groq client...")
+    log.info("Setting up Groq client...")
     try:
-        print("[INFO] Loading environmental varaiables...")
+        log.debug("Loading environmental variables...")
         load_dotenv() # load env variable from .env file
 
         api_key = os.getenv("GROQ_API_KEY") # get credential
         if not api_key:
-            print("[ERROR] GROQ_API_KEY not found in .env file")
+            log.error("GROQ_API_KEY not found in .env file")
             raise EnvironmentError("Missing GROQ_API_KEY in .env")
 
-        client = Groq(api_key=api_key,)
-        print("[INFO] Groq client initialised successfully.")
+        http_client = httpx.Client( # pooled connections stay warm between requests
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+        client = Groq(api_key=api_key, http_client=http_client) # base URL can be overridden with GROQ_BASE_URL
+        log.info("Groq client initialised successfully.", extra=fields(pool_size=POOL_SIZE))
         return client
     
     except Exception as e:
-        print(f"[ERROR] Failed to initialise Groq client: {e}")
+        log.error("Failed to initialise Groq client", extra=fields(error=e))
         raise
 
-# LLM for track dataset extraction
-def prompt_llm_for_dataset(client, user_input):
-    # SENDS A USER DESCRIPTION TO GROQ AND RETRIEVES 50 TRACKS
-    print("\n[STEP] Extracting dataset of tracks from user prompt...")
-    try:
-        # initial system prompt to set up LLM before user prompt
-        system_prompt = """You are a music recommendation expert.
+# initial system prompt to set up LLM before user prompt
+SYSTEM_PROMPT = """You are a music recommendation expert.
 
         Your task is to generate a list of real, well-known Spotify tracks that match the user's request.
         ALL tracks must exist on Spotify. Do NOT invent non-existent tracks. Do NOT return albums. Do NOT return duplicate tracks.
@@ -160,42 +186,526 @@ def prompt_llm_for_dataset(client, user_input):
         }
         """
 
-        print("[DEBUG] Sending tracks request to Groq API...")
-        response = client.chat.completions.create(
-            model="moonshotai/kimi-k2-instruct-0905", # openai/gpt-oss-120b llama-3.3-70b-versatile
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user", 
-                    "content": user_input
-                }
-            ],
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "candidate_tracks",
-                    "schema": CandidateTrackList.model_json_schema()
-                }
+MODEL = "moonshotai/kimi-k2-instruct-0905" # preferred model, first in the roster
+TEMPERATURE = 0.6 # controls randomness
+TRACK_COUNT = 35 # tracks the system prompt asks for, used as the progress target
+
+# models tried for each call, in order of preference; later ones take over when an earlier one fails, returns
+# malformed output or is slower than usual
+LLM_MODELS = [m.strip() for m in os.getenv("LLM_MODELS", f"{MODEL},openai/gpt-oss-120b,llama-3.3-70b-versatile").split(",") if m.strip()]
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1" # send the call to a second model when the first is slow
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", 0.9)) # a model is slow once it has taken longer than this share of its recent calls
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5)) # never hedge sooner than this, in seconds
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", 0.2)) # at most this share of calls get a hedge
+LLM_MIN_VALIDITY = float(os.getenv("LLM_MIN_VALIDITY", 0.5)) # models with fewer valid recent responses than this are tried last
+LLM_HEDGE_MIN_SAMPLES = 10 # timings of a model needed before it is hedged, until then only failures move on to the next model
+VALIDITY_WINDOW = 20 # recent responses per model that its validity is judged on
+
+class ModelStats: # process-wide outcomes of each model's calls, used to order the roster and report on the models
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0 # raced calls
+        self.hedges = 0 # calls that got a hedge
+        self.models = {} # model -> counts of attempts, valid, invalid and failed responses, wins and cancellations
+        self.recent = {} # model -> deque of True/False for its last VALIDITY_WINDOW finished responses
+
+    def add(self, model, **counts):
+        with self._lock:
+            m = self.models.setdefault(model, {"attempts": 0, "valid": 0, "invalid": 0, "errors": 0, "wins": 0, "cancelled": 0})
+            for name, n in counts.items():
+                m[name] += n
+            if counts.get("valid") or counts.get("invalid") or counts.get("errors"):
+                self.recent.setdefault(model, deque(maxlen=VALIDITY_WINDOW)).append(bool(counts.get("valid")))
+
+    def validity(self, model):
+        # RETURNS THE SHARE OF THE MODEL'S RECENT RESPONSES THAT WERE VALID, OR None BEFORE IT HAS ENOUGH OF THEM
+        with self._lock:
+            recent = list(self.recent.get(model, ()))
+        return sum(recent) / len(recent) if len(recent) >= VALIDITY_WINDOW // 4 else None
+
+    def may_hedge(self):
+        with self._lock:
+            if self.hedges >= LLM_HEDGE_MAX_RATIO * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def start_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def snapshot(self):
+        with self._lock:
+            models = {model: dict(m) for model, m in self.models.items()}
+            calls, hedges = self.calls, self.hedges
+        for model, m in models.items():
+            m["validity"] = self.validity(model)
+            for kind in ("first_track", "complete"):
+                p50, p95 = (metrics.quantile(f"llm_model_{kind}:{model}", q) for q in (0.5, 0.95))
+                if p50 is not None:
+                    m[f"{kind}_p50_s"], m[f"{kind}_p95_s"] = round(p50, 3), round(p95, 3)
+        return {"calls": calls, "hedges": hedges, "models": models}
+
+model_stats = ModelStats()
+
+# angles given to each shard, so concurrent calls for the same prompt suggest different tracks
+SHARD_FACETS = [
+    "the most popular, well-known tracks that fit",
+    "deeper cuts and album tracks from established artists",
+    "tracks released in the last five years",
+    "older tracks and classics from before 2010",
+    "tracks by lesser-known or up-and-coming artists",
+    "tracks from other genres or scenes that still fit the mood",
+]
+
+# method that builds the chat completion arguments shared by the normal and streaming calls
+def build_request(user_input, count=TRACK_COUNT):
+    system_prompt = SYSTEM_PROMPT
+    if count != TRACK_COUNT:
+        system_prompt = SYSTEM_PROMPT.replace(f"EXACTLY {TRACK_COUNT} tracks", f"EXACTLY {count} tracks")
+    return {
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": system_prompt
             },
-            temperature=0.6 # controls randomness
-        )
+            {
+                "role": "user",
+                "content": user_input
+            }
+        ],
+        "temperature": TEMPERATURE
+    }
 
-        print("[DEBUG] Raw LLM response received. Attempting to parse JSON output...")
-        tracks = json.loads(response.choices[0].message.content)
+# method that returns the request option that stops a call at the current request's LLM deadline
+def deadline_options():
+    left = remaining("llm")
+    return {} if left is None else {"timeout": max(0.1, left)} # None would mean no timeout at all, so leave it out
 
-        print("\n[RESULT] Dataset of tracks extracted successfully:")
-        tracks_json = json.dumps(tracks, indent=2)
-        print(tracks_json)
+# LLM for track dataset extraction
+def prompt_llm_for_dataset(client, user_input):
+    # SENDS A USER DESCRIPTION TO GROQ AND RETRIEVES 50 TRACKS
+    # every model in the roster may be tried; the call fails, rather than returning nothing, only if none of them
+    # returns a valid CandidateTrackList
+    log.info("Extracting dataset of tracks from user prompt...")
+    try:
+        log.debug("Sending tracks request to Groq API...")
+        expect("llm", TRACK_COUNT)
+        with span("llm", units=0): # progress moves when the tracks are parsed
+            tracks = {"tracks": list(raced_tracks(client, build_request(user_input), stream=False))}
+
+        log.info("Dataset of tracks extracted successfully", extra=fields(tracks=len(tracks["tracks"])))
+        advance("llm", len(tracks["tracks"]))
+        finish("llm")
 
         save(tracks, "initial_candidate_tracks.json") # save json file for debugging
         return tracks
-    
-    except json.JSONDecodeError as e:
-        print(f"[ERROR] Failed to parse JSON response: {e}")
-        print("[DEBUG] Raw output was:")
-        print(response.choices[0].message.content)
+
     except Exception as e:
-        print(f"[ERROR] Unexpected error in prompt_llm_for_dataset: {e}")
+        log.error("No model returned a valid track list", extra=fields(error=e))
+        raise
+
+class TrackStreamParser: # incrementally parses a streamed CandidateTrackList JSON and returns each track object once it is complete
+    def __init__(self):
+        self.buffer = [] # every character received so far
+        self.depth = 0 # current {} / [] nesting depth
+        self.in_string = False # inside a JSON string, where braces don't count
+        self.escaped = False # previous character was a backslash inside a string
+        self.object_start = None # buffer position where the current track object started
+        self.invalid = 0 # objects that weren't valid CandidateTracks
+
+    def feed(self, text):
+        # ADDS A CHUNK OF TEXT AND RETURNS A LIST OF TRACKS THAT WERE COMPLETED BY IT
+        completed = []
+        for ch in text:
+            self.buffer.append(ch)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+                if ch == "{" and self.depth == 3: # root object (1) -> "tracks" array (2) -> track object (3)
+                    self.object_start = len(self.buffer) - 1
+            elif ch in "}]":
+                if ch == "}" and self.depth == 3 and self.object_start is not None:
+                    raw = "".join(self.buffer[self.object_start:])
+                    self.object_start = None
+                    try:
+                        completed.append(CandidateTrack.model_validate_json(raw).model_dump()) # same dict shape as the non-streaming path
+                    except ValueError:
+                        self.invalid += 1
+                        log.warning("Skipping invalid track object from stream", extra=fields(raw=raw[:80]))
+                self.depth -= 1
+        return completed
+
+    def text(self):
+        return "".join(self.buffer)
+
+# LLM for track dataset extraction, streaming version
+def stream_candidate_tracks(client, user_input):
+    # SENDS A USER DESCRIPTION TO GROQ AND YIELDS EACH TRACK AS SOON AS THE MODEL HAS FINISHED WRITING IT
+    log.info("Streaming dataset of tracks from user prompt...")
+    tracks = []
+
+    log.debug("Sending streaming tracks request to Groq API...")
+    expect("llm", TRACK_COUNT)
+    start = time.perf_counter()
+    for track in raced_tracks(client, build_request(user_input)):
+        tracks.append(track)
+        advance("llm")
+        if len(tracks) == 1:
+            metrics.observe("llm_first_track", time.perf_counter() - start)
+        log.debug("Streamed track", extra=fields(n=len(tracks), track=track["track"], artists=track["artists"]))
+        yield track
+
+    metrics.observe("llm", time.perf_counter() - start)
+    finish("llm")
+    log.info("Streamed tracks", extra=fields(tracks=len(tracks)))
+    save({"tracks": tracks}, "initial_candidate_tracks.json") # save json file for debugging
+
+def _stream_tracks(client, request, cancel=None):
+    # SENDS ONE STREAMING REQUEST AND YIELDS EACH VALID TRACK OBJECT AS SOON AS IT IS COMPLETE
+    # setting cancel (a threading.Event) closes the stream at the next chunk; a response that is cut off raises
+    # ValueError after its complete tracks have been yielded
+    parser = TrackStreamParser()
+    found = 0
+    # json_schema response_format is not used here because structured outputs can't be streamed,
+    # the system prompt already asks for the schema and each object is validated by the parser instead
+    with client.chat.completions.create(**request, **deadline_options(), stream=True) as stream:
+        for chunk in stream:
+            if cancel is not None and cancel.is_set():
+                return
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if not content:
+                continue
+            for track in parser.feed(content):
+                found += 1
+                yield track
+
+    if not found:
+        log.error("Streamed response contained no valid tracks", extra=fields(raw=parser.text()[:500]))
+        raise ValueError("No valid tracks in streamed LLM response")
+    if parser.invalid:
+        log.warning("Streamed response had invalid tracks", extra=fields(valid=found, invalid=parser.invalid))
+    if parser.depth: # the JSON never closed, the model stopped part way through the list
+        raise ValueError(f"Streamed LLM response was cut off after {found} tracks")
+
+def _complete_tracks(client, request):
+    # SENDS ONE NON-STREAMING STRUCTURED OUTPUT REQUEST AND RETURNS ITS TRACKS
+    response = client.chat.completions.create(
+        **request,
+        **deadline_options(),
+        response_format={
+            "type": "json_schema",
+            "json_schema": {
+                "name": "candidate_tracks",
+                "schema": CandidateTrackList.model_json_schema()
+            }
+        }
+    )
+    return CandidateTrackList.model_validate_json(response.choices[0].message.content).model_dump()["tracks"]
+
+# method that returns the roster in the order to try it: the configured order, with models whose recent responses were
+# mostly invalid moved to the end, and the backups that answer fastest first
+def route_models(kind="first_track"):
+    def _unhealthy(model):
+        validity = model_stats.validity(model)
+        return validity is not None and validity < LLM_MIN_VALIDITY
+
+    def _p50(model):
+        p50 = metrics.quantile(f"llm_model_{kind}:{model}", 0.5, min_count=LLM_HEDGE_MIN_SAMPLES)
+        return math.inf if p50 is None else p50
+
+    order = sorted(LLM_MODELS, key=_unhealthy) # stable, so the preferred model stays first while it is healthy
+    return order[:1] + sorted(order[1:], key=lambda m: (_unhealthy(m), _p50(m)))
+
+# method that returns how long a model may take before the call is hedged on another, or None if it isn't hedged yet
+def model_hedge_delay(model, kind):
+    q = metrics.quantile(f"llm_model_{kind}:{model}", LLM_HEDGE_QUANTILE, min_count=LLM_HEDGE_MIN_SAMPLES)
+    return None if q is None else max(LLM_HEDGE_MIN_DELAY, q)
+
+# method that sends one LLM request to the model roster and yields the tracks of whichever model gives a valid answer first
+def raced_tracks(client, request, stream=True):
+    # THE PREFERRED MODEL IS ASKED FIRST; IF IT FAILS OR ITS OUTPUT DOESN'T MATCH THE SCHEMA THE NEXT MODEL IS ASKED STRAIGHT AWAY,
+    # AND IF IT IS SLOWER THAN ITS LLM_HEDGE_QUANTILE LATENCY ONE MORE MODEL IS ASKED ALONGSIDE IT
+    # streaming calls are won by the first valid track, non-streaming calls by the first valid CandidateTrackList;
+    # once a model has won the other attempts are cancelled and only the winner's tracks are yielded
+    # if the winner's stream is cut off, the next model carries on and only the tracks not yielded yet are passed on
+    kind = "first_track" if stream else "complete"
+    order = route_models(kind)
+    if len(order) > 1:
+        client = client.with_options(max_retries=0) # the next model is the retry, so don't wait on backoff for the same one
+    results = queue.Queue() # same protocol as the shards: (attempt, track), (attempt, exception) or (attempt, None) when done
+    attempts = [] # (model, cancel event) per attempt
+    model_stats.start_call()
+
+    def _attempt(n, model, cancel):
+        start = time.perf_counter()
+        error = None
+        found = 0
+        try:
+            model_request = {**request, "model": model}
+            tracks = _stream_tracks(client, model_request, cancel) if stream else _complete_tracks(client, model_request)
+            for track in tracks:
+                if not found and stream:
+                    metrics.observe(f"llm_model_first_track:{model}", time.perf_counter() - start)
+                found += 1
+                results.put((n, track))
+            if not found and not cancel.is_set():
+                raise ValueError("LLM response had no tracks")
+            if not stream:
+                metrics.observe(f"llm_model_complete:{model}", time.perf_counter() - start)
+        except Exception as e:
+            error = e
+        finally:
+            if cancel.is_set() and error is None and not found:
+                model_stats.add(model, cancelled=1)
+            elif error is None:
+                model_stats.add(model, valid=1)
+            elif isinstance(error, ValueError): # malformed output, pydantic's ValidationError is a ValueError too
+                model_stats.add(model, invalid=1)
+            else:
+                model_stats.add(model, errors=1)
+            results.put((n, error))
+
+    def _start(hedge=False):
+        model = order.pop(0)
+        cancel = threading.Event()
+        attempts.append((model, cancel))
+        model_stats.add(model, attempts=1)
+        threading.Thread(target=in_context(_attempt), args=(len(attempts) - 1, model, cancel), name=f"llm-{model}", daemon=True).start()
+        if hedge:
+            log.info("Hedging slow LLM call", extra=fields(model=model, slow_model=attempts[-2][0]))
+        return model
+
+    start = time.perf_counter()
+    model = _start()
+    delay = model_hedge_delay(model, kind) if LLM_HEDGE else None
+    hedged = False
+    running = 1
+    winner = None
+    errors = []
+    yielded = set() # normalised keys of the tracks passed on
+    try:
+        while running:
+            left = remaining("llm")
+            hedge_in = None if winner is not None or delay is None or not order else delay - (time.perf_counter() - start)
+            timeouts = [max(0.0, t) for t in (left, hedge_in) if t is not None]
+            try:
+                n, item = results.get(timeout=min(timeouts) if timeouts else None)
+            except queue.Empty:
+                if hedge_in is not None and hedge_in <= (left if left is not None else math.inf):
+                    delay, hedged = None, True # one hedge per call
+                    if model_stats.may_hedge():
+                        _start(hedge=True)
+                        running += 1
+                    continue
+                if not yielded:
+                    raise DeadlineExceeded("No LLM model answered within the request deadline")
+                log.warning("LLM deadline reached, continuing with the tracks so far", extra=fields(tracks=len(yielded)))
+                break
+            if item is None or isinstance(item, Exception): # attempt finished
+                running -= 1
+                if n == winner:
+                    if item is None or not order:
+                        break
+                    errors.append(item)
+                    log.warning("LLM response ended early, continuing with the next model", extra=fields(model=attempts[n][0], error=item))
+                    winner = None
+                    start = time.perf_counter()
+                    _start()
+                    running += 1
+                    continue
+                if item is not None and winner is None:
+                    errors.append(item)
+                    log.warning("LLM model failed, trying the next one", extra=fields(model=attempts[n][0], error=item))
+                    if not running and order: # nothing else in flight, move on to the next model straight away
+                        start = time.perf_counter()
+                        model = _start()
+                        delay = model_hedge_delay(model, kind) if LLM_HEDGE and not hedged else None
+                        running += 1
+                continue
+            if winner is None:
+                winner = n
+                model_stats.add(attempts[n][0], wins=1)
+                for m, (_, cancel) in enumerate(attempts):
+                    if m != n:
+                        cancel.set()
+            key = normalise_track_key(item["artists"], item["track"])
+            if n == winner and key not in yielded:
+                yielded.add(key)
+                yield item
+    finally:
+        for _, cancel in attempts: # the caller stopped reading, or another attempt won
+            cancel.set()
+
+    if not yielded:
+        raise errors[-1] if errors else ValueError("No LLM model returned valid tracks")
+
+# method that reports each model's validity, latency and how often it won, was hedged or was cancelled
+def get_llm_stats():
+    return model_stats.snapshot()
+
+# method that builds the request for one shard of a sharded call
+def shard_request(user_input, shard, shards):
+    facet = SHARD_FACETS[shard % len(SHARD_FACETS)]
+    count = math.ceil(TRACK_COUNT / shards) + SHARD_EXTRA
+    return build_request(f"{user_input}\n\nFor this list, focus on {facet}.", count=count)
+
+# LLM for track dataset extraction, split into concurrent smaller calls
+def stream_sharded_candidate_tracks(client, user_input, shards=None, stream=True):
+    # SENDS shards SMALLER REQUESTS AT ONCE, EACH FOR A SLICE OF THE LIST WITH ITS OWN FACET OF THE PROMPT,
+    # AND YIELDS EVERY NEW (NOT ALREADY SUGGESTED) TRACK AS SOON AS ANY SHARD PRODUCES IT, UP TO TRACK_COUNT TRACKS
+    # shorter outputs finish sooner, and one slow completion only holds up its own slice of the list
+    # a failed shard is logged and skipped; the call only fails if every shard does
+    shards = shards or LLM_SHARDS
+    log.info("Requesting tracks in shards", extra=fields(shards=shards, stream=stream))
+    results = queue.Queue() # (shard, track), (shard, exception) or (shard, None) when the shard is done
+    done = threading.Event() # set once we have TRACK_COUNT tracks (or stop reading), so the shards stop generating
+    start = time.perf_counter()
+
+    def _shard(i):
+        shard_start = time.perf_counter()
+        request = shard_request(user_input, i, shards)
+        error = None
+        try:
+            for track in raced_tracks(client, request, stream):
+                if done.is_set():
+                    break
+                results.put((i, track))
+        except Exception as e:
+            error = e
+        finally:
+            metrics.observe("llm_shard", time.perf_counter() - shard_start, error is not None)
+            results.put((i, error))
+
+    expect("llm", TRACK_COUNT)
+    for i in range(shards):
+        threading.Thread(target=in_context(_shard), args=(i,), name=f"llm-shard-{i}", daemon=True).start()
+
+    seen = set()
+    tracks = []
+    failed = 0
+    pending = shards
+    try:
+        while pending and len(tracks) < TRACK_COUNT: # shards ask for a few extra, the pool stays the size of an unsharded one
+            left = remaining("llm")
+            try:
+                i, item = results.get(timeout=None if left is None else max(0.0, left))
+            except queue.Empty: # out of time, the shards that haven't finished are abandoned
+                log.warning("LLM deadline reached, continuing without the unfinished shards", extra=fields(unfinished=pending, tracks=len(tracks)))
+                break
+            if item is None or isinstance(item, Exception): # shard finished
+                pending -= 1
+                if item is not None:
+                    failed += 1
+                    log.warning("LLM shard failed", extra=fields(shard=i, error=item))
+                continue
+            key = normalise_track_key(item["artists"], item["track"])
+            if key in seen:
+                log.debug("Skipping track suggested by another shard", extra=fields(shard=i, track=item["track"]))
+                continue
+            seen.add(key)
+            tracks.append(item)
+            advance("llm")
+            if len(tracks) == 1:
+                metrics.observe("llm_first_track", time.perf_counter() - start)
+            yield item
+    finally:
+        done.set()
+
+    if not tracks:
+        raise ValueError(f"All {shards} LLM shards failed")
+
+    metrics.observe("llm", time.perf_counter() - start)
+    finish("llm")
+    log.info("Sharded tracks", extra=fields(tracks=len(tracks), shards=shards, failed_shards=failed))
+    save({"tracks": tracks}, "initial_candidate_tracks.json") # save json file for debugging
+
+# method that builds the request for one round of a large playlist, listing tracks the model must not suggest again
+def round_request(user_input, round_number, exclude):
+    text = f"{user_input}\n\nFor this list, focus on {SHARD_FACETS[round_number % len(SHARD_FACETS)]}."
+    if exclude:
+        listed = "\n".join(f"- {artists} - {track}" for artists, track in exclude[-MAX_EXCLUDE:])
+        text += f"\n\nThese tracks are already in the playlist, do NOT suggest any of them again:\n{listed}"
+    return build_request(text)
+
+# LLM for track dataset extraction, repeated until there are enough tracks for a large playlist
+def stream_candidate_rounds(client, user_input, needed, missed=lambda: 0, stream=True, max_rounds=None):
+    # KEEPS ASKING FOR TRACK_COUNT MORE TRACKS, ROUND_CONCURRENCY CALLS AT A TIME, EACH ROUND TOLD WHICH TRACKS WE
+    # ALREADY HAVE, AND YIELDS EVERY NEW TRACK AS SOON AS IT ARRIVES, UNTIL needed TRACKS HAVE BEEN FOUND
+    # missed() returns how many of the yielded tracks Spotify couldn't find, so misses are made up with more rounds
+    # stops early when the model stops coming up with new tracks, at max_rounds, or at the request's LLM deadline
+    max_rounds = max_rounds or math.ceil(needed / TRACK_COUNT) * 3
+    log.info("Requesting tracks in rounds", extra=fields(needed=needed, concurrency=ROUND_CONCURRENCY))
+    results = queue.Queue() # same protocol as the shards: (round, track), (round, exception) or (round, None) when done
+    start = time.perf_counter()
+    seen = set()
+    tracks = []
+    new_per_round = {}
+    rounds = running = failed = empty_rounds = 0
+
+    def _round(i, request):
+        error = None
+        try:
+            for track in raced_tracks(client, request, stream):
+                results.put((i, track))
+        except Exception as e:
+            error = e
+        finally:
+            results.put((i, error))
+
+    while True:
+        # start another round while the rounds in flight, if each came back full, still wouldn't be enough
+        while (running < ROUND_CONCURRENCY and rounds < max_rounds and empty_rounds < MAX_EMPTY_ROUNDS
+               and len(tracks) - missed() + running * TRACK_COUNT < needed):
+            request = round_request(user_input, rounds, [(t["artists"], t["track"]) for t in tracks])
+            expect("llm", TRACK_COUNT)
+            threading.Thread(target=in_context(_round), args=(rounds, request), name=f"llm-round-{rounds}", daemon=True).start()
+            new_per_round[rounds] = 0
+            rounds += 1
+            running += 1
+        if not running:
+            break
+
+        left = remaining("llm")
+        try:
+            i, item = results.get(timeout=None if left is None else max(0.0, left))
+        except queue.Empty:
+            log.warning("LLM deadline reached, continuing with the tracks so far", extra=fields(tracks=len(tracks), rounds=rounds))
+            break
+        if item is None or isinstance(item, Exception): # round finished
+            running -= 1
+            if item is not None:
+                failed += 1
+                log.warning("LLM round failed", extra=fields(round=i, error=item))
+            empty_rounds = 0 if new_per_round.pop(i) else empty_rounds + 1
+            continue
+        key = normalise_track_key(item["artists"], item["track"])
+        if key in seen:
+            continue
+        seen.add(key)
+        tracks.append(item)
+        new_per_round[i] += 1
+        advance("llm")
+        if len(tracks) == 1:
+            metrics.observe("llm_first_track", time.perf_counter() - start)
+        yield item
+
+    if not tracks:
+        raise ValueError(f"No valid tracks in {rounds} LLM rounds")
+
+    metrics.observe("llm", time.perf_counter() - start)
+    finish("llm")
+    log.info("Round tracks", extra=fields(tracks=len(tracks), needed=needed, rounds=rounds, failed_rounds=failed))
@@ -2,10 +2,15 @@ from groq_client import *
 from spotify_client import *
 from semantic_ranker import *
 from ui import *
+from pipeline import generate_playlist, refine_playlist # search, fetch and ranking stream into each other; refinements re-rank the kept pool
+from tracing import Progress, start_metrics_server # real progress counts and Prometheus metrics
 import streamlit as st
 from concurrent.futures import ThreadPoolExecutor
 import time
 
+start_model_loading() # warm the embedding model in the background so the page renders without waiting for it
+start_metrics_server() # serves /metrics if METRICS_PORT is set
+
 if "code" in st.query_params:
     try:
         auth_manager = get_spotify_oauth()
@@ -17,40 +22,23 @@ if "code" in st.query_params:
     except Exception as e:
         st.error(f"Failed to connect Spotify account: {e}")
         
-# function that runs the playlist generation using the user input
-def generate_playlist(user_input):
-    # 1. set up clients
-    gr = get_groq_client() # start groq client
-    sp = get_spotify_client() # start spotify client
-
-    # 2. extract a dataset of tracks from an llm
-    dataset_of_tracks = prompt_llm_for_dataset(gr, user_input) # store as dictionary
-
-    # 3. retrieve ids for each track via spotify
-    dataset_of_tracks_with_ids = get_track_ids_parallel(sp, dataset_of_tracks) # store as dictionary
-
-    # 4. get more data via spotify
-    updated_tracks = update_dataset_of_tracks(sp, dataset_of_tracks_with_ids)
-
-    # 5. find most similar tracks using an embedding model
-    top_tracks = get_most_similar_tracks(user_input, updated_tracks) # store as list
-
-    return top_tracks
-
 # 1. set up ui
-prompt, submitted = setup_display() # get user prompt and submission
+prompt, submitted, fresh, size, mode = setup_display() # get user prompt, submission, cache opt-out, playlist size and retrieval mode
+show_model_status(model_status()) # let the user know if the ranking model is still warming up
 initialise_session_state() # initialised session state variables
 
 # 2. run main logic only when user submits a prompt
 if submitted and prompt.strip():
-    ui = ProgressUI() # create a UI Progress class
+    progress = Progress() # completed/total counts per stage, filled in by the pipeline
+    ui = ProgressUI(progress) # create a UI Progress class
     user_input = prompt.strip() # get user input
     
     # run generation in background, using another thread, so UI can keep updating
     with ThreadPoolExecutor(max_workers=1) as ex: # using a thread pool of 1 thread allows playlist generation to run without streamlit ui freezing
-        fut = ex.submit(generate_playlist, user_input) # start running playlist generation in the background, using a Future object
+        fut = ex.submit(generate_playlist, user_input, session_id=st.session_state.session_id, fresh=fresh, progress=progress, size=size,
+                        pool=st.session_state.pool, mode=mode) # start running playlist generation in the background, using a Future object
 
-        # animate progress while generating (targeting around 10 secs, capped at 95% until done)
+        # show progress while generating, from the stages' real completed/total counts
         while not fut.done(): # keep looping as long as playlist generation is not complete
             ui.update() # update ui
             time.sleep(0.1) # pause briefly for 100ms so we don't overload cpu
@@ -65,10 +53,22 @@ if submitted and prompt.strip():
 
 # 3. display tracks if available
 if st.session_state.generated:
+    # a refinement re-ranks this playlist's candidates in milliseconds, and only asks for more if none of them fit
+    refinement, refined = setup_refine()
+    if refined and refinement.strip():
+        start = time.perf_counter()
+        with st.spinner("Refining playlist..."):
+            st.session_state.ranked_tracks = refine_playlist(refinement.strip(), st.session_state.pool, session_id=st.session_state.session_id)
+        took = time.perf_counter() - start
+        if st.session_state.pool.last_action == "reranked":
+            st.caption(f"Re-ranked in {took * 1000:.0f} ms")
+        else:
+            st.caption(f"Found more tracks in {took:.1f} s")
+
     # 8. optional step for user to save playlist to their account
     if st.button("Save to your Spotify account"):
         with st.spinner("Saving playlist..."):
-            playlist_url = create_playlist(playlist_name="AI Playlist", description=prompt)
+            playlist_url = create_playlist(playlist_name="AI Playlist", description=st.session_state.pool.prompt or prompt, tracks=st.session_state.ranked_tracks) # this session's tracks
         st.success("Playlist saved!")
         st.markdown(f"[Open playlist in Spotify]({playlist_url})")
 
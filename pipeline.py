@@ -0,0 +1,475 @@
+import os # for configuration from environment variables
+import math # for sizing the candidate pool of large playlists
+import time # for timing runs for the semantic prompt cache
+import copy # cached results are copied so sessions can't change each other's tracks
+import queue # bounded queues between stages give us backpressure
+import threading # each stage runs on its own small pool of worker threads
+import contextvars # workers carry the request id of the run that started them
+import numpy as np
+import groq_client
+from groq_client import (
+    get_groq_client, prompt_llm_for_dataset, stream_candidate_tracks, stream_sharded_candidate_tracks, stream_candidate_rounds,
+)
+from cache import LRUCache, SingleFlight, MISSING, normalise_prompt
+from spotify_client import (
+    get_spotify_client, get_track_ids_parallel, update_dataset_of_tracks,
+    search_track, get_track_data, apply_track_data, FALLBACK_TRACK,
+)
+from spotify_scheduler import scheduled
+from semantic_ranker import (
+    rank_candidates, rank_vector, encode_texts, track_text, query_text, model_status, index_tracks, search_index,
+)
+from candidates import CandidateTable, SessionPool # columnar candidate pool with its embeddings, shared by caches without copying
+from ranking import TOP_K, MAX_PLAYLIST_SIZE # default and largest playlist size
+from prompt_cache import prompt_cache # near-duplicate prompts reuse an earlier candidate pool
+from debugging import save, get_logger, fields, new_request # debugging artifacts and structured logging
+from tracing import span, expect, finish, track_progress # stage timings and request progress
+from deadline import start_deadline, remaining, expired, DeadlineExceeded, REQUEST_DEADLINE, LARGE_PLAYLIST_DEADLINE # per-request time budget
+
+log = get_logger("pipeline")
+
+_DONE = object() # end-of-stream marker passed down the queues
+
+PIPELINE_VERSION = 1 # bump when a pipeline change should invalidate cached results
+CANDIDATE_FACTOR = groq_client.TRACK_COUNT / TOP_K # candidates per playlist track, the same ratio as a normal playlist (35 for 20)
+REFINE_BLEND = float(os.getenv("REFINE_BLEND", 0.5)) # weight of the previous query when a refined prompt is re-ranked, 0 for the refinement alone
+REFINE_MIN_RATIO = float(os.getenv("REFINE_MIN_RATIO", 0.9)) # a refinement whose picks score below this share of the original playlist's fetches more candidates
+REFINE_MAX_POOL = int(os.getenv("REFINE_MAX_POOL", 1000)) # most candidates a session keeps as refinements fetch more
+# where candidates come from: "llm" asks Groq, "catalog" only searches the local index of tracks earlier prompts resolved,
+# "hybrid" asks Groq and adds the closest local tracks before ranking
+RETRIEVAL_MODES = ("llm", "catalog", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "llm")
+LOCAL_CANDIDATE_FACTOR = float(os.getenv("LOCAL_CANDIDATE_FACTOR", 5)) # local candidates per playlist track in catalog mode, MMR picks from these
+
+# finished playlists by prompt, shared by every session, so a trending prompt only runs the pipeline once per TTL
+result_cache = LRUCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 500)),
+    ttl=int(os.getenv("RESULT_CACHE_TTL", 3600)),
+)
+in_flight = SingleFlight() # identical prompts submitted at the same time share one pipeline run
+
+class ResolveCounts: # how many candidates search found or missed so far, read by the LLM rounds of a large playlist
+    def __init__(self):
+        self.found = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+
+    def add(self, found):
+        with self._lock:
+            if found:
+                self.found += 1
+            else:
+                self.missed += 1
+
+    def lost(self):
+        # A FOUND TRACK WHOSE SPOTIFY DATA COULDN'T BE FETCHED IS DROPPED, SO IT COUNTS AS A MISS
+        with self._lock:
+            self.found -= 1
+            self.missed += 1
+
+class Stage: # one step of the streaming pipeline: a pool of worker threads reading from a bounded queue
+    def __init__(self, name, func, workers, outbox, batch_size=1):
+        self.name = name
+        self.func = func # takes a list of items (length 1 unless batch_size > 1), returns the items to pass on
+        self.outbox = outbox # next stage's inbox (or a plain list for the last stage)
+        self.batch_size = batch_size
+        self.inbox = queue.Queue(maxsize=workers * 2) # bounded, so a fast stage waits for a slow one instead of piling up work
+        self.errors = [] # first exception raised by a worker, re-raised by the pipeline
+        self.threads = [threading.Thread(target=contextvars.copy_context().run, args=(self._work,), name=f"{name}-{i}", daemon=True)
+                        for i in range(workers)] # each worker gets its own copy of the caller's context (request id for logging)
+        for t in self.threads:
+            t.start()
+
+    def _take_batch(self):
+        # WAITS FOR ONE ITEM, THEN GRABS WHATEVER ELSE IS ALREADY QUEUED UP TO batch_size
+        items = [self.inbox.get()]
+        while len(items) < self.batch_size and items[-1] is not _DONE:
+            try:
+                items.append(self.inbox.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _work(self):
+        while True:
+            items = self._take_batch()
+            done = items[-1] is _DONE
+            if done:
+                items.pop()
+                self.inbox.put(_DONE) # put the marker back so the other workers see it too
+            if items and not self.errors: # after an error we keep draining so nothing upstream blocks
+                try:
+                    for result in self.func(items):
+                        self.put_out(result)
+                except Exception as e:
+                    self.errors.append(e)
+            if done:
+                return
+
+    def put_out(self, item):
+        if isinstance(self.outbox, list):
+            self.outbox.append(item) # list.append is thread-safe
+        else:
+            self.outbox.put(item)
+
+    def close(self):
+        # SIGNALS END OF INPUT AND WAITS FOR EVERY WORKER TO FINISH
+        self.inbox.put(_DONE)
+        for t in self.threads:
+            t.join()
+
+def stream_resolve_tracks(sp, candidates, search_workers=10, fetch_workers=10, embed_batch_size=32, counts=None):
+    # RUNS SEARCH -> TRACK FETCH -> EMBED FOR EACH CANDIDATE AS SOON AS ITS PREVIOUS STEP IS DONE
+    # candidates can be any iterable (a list, or a generator that yields tracks as the LLM produces them)
+    # counts (a ResolveCounts) is updated as each search finishes
+    # returns (tracks, embeddings) in candidate order, for tracks that were found on Spotify
+    log.info("Streaming track resolution...")
+    counts = counts or ResolveCounts()
+
+    def _search(items): # stage 1: Spotify search for the track ID
+        for index, t in items:
+            if expired("search"): # out of time, rank what has been found so far
+                counts.add(False)
+                continue
+            try:
+                track_id = search_track(sp, t["artists"], t["track"])
+            except Exception as e: # one failed search doesn't lose the whole playlist
+                log.warning("Track search failed", extra=fields(track=t["track"], error=e))
+                counts.add(False)
+                continue
+            counts.add(track_id)
+            if track_id:
+                t["ID"] = track_id
+                expect("fetch")
+                yield index, t
+
+    def _fetch(items): # stage 2: Spotify Get Track for the metadata
+        # a track without its Spotify data has no link, URI or cover to show or save, so it is dropped (not ranked)
+        for index, t in items:
+            try:
+                tr = get_track_data(sp, t["ID"])
+            except DeadlineExceeded:
+                log.debug("Track fetch ran out of time, dropping the track", extra=fields(id=t["ID"]))
+                counts.lost()
+                continue
+            except Exception as e:
+                log.warning("Failed to get track data, dropping the track", extra=fields(id=t["ID"], error=e))
+                counts.lost()
+                continue
+            if not tr: # if for some reason the API track response doesn't exist, drop it
+                log.warning("Spotify returned None for track", extra=fields(id=t.get("ID")))
+                counts.lost()
+                continue
+            apply_track_data(t, tr)
+            expect("embed")
+            yield index, t
+
+    def _embed(items): # stage 3: embed whatever has arrived, as one batch
+        with span("embed", units=len(items)):
+            vectors = encode_texts([track_text(t) for _, t in items])
+        for (index, t), vector in zip(items, vectors):
+            yield index, t, vector
+
+    results = [] # (index, track, embedding), filled by the last stage
+    embed = Stage("embed", _embed, workers=1, outbox=results, batch_size=embed_batch_size) # the model is CPU-bound, so 1 worker with batching
+    fetch = Stage("fetch", _fetch, workers=fetch_workers, outbox=embed.inbox)
+    search = Stage("search", _search, workers=search_workers, outbox=fetch.inbox)
+
+    try:
+        count = 0
+        for index, t in enumerate(_until_deadline(candidates, "llm")): # feed candidates in; blocks while the search queue is full
+            expect("search")
+            search.inbox.put((index, t))
+            count += 1
+    finally:
+        for stage in (search, fetch, embed): # close stages in order so every item flows through
+            stage.close()
+    for stage in (search, fetch, embed):
+        if stage.errors:
+            raise stage.errors[0]
+    for stage in ("search", "fetch", "embed"):
+        finish(stage)
+
+    if not results: # we need to guarantee at least 1 track, same as get_track_ids_parallel
+        log.warning("No IDs were found at all. Using Blinding Lights as backup...")
+        t = dict(FALLBACK_TRACK)
+        tr = get_track_data(sp, t["ID"])
+        if tr:
+            apply_track_data(t, tr)
+        results.append((0, t, encode_texts([track_text(t)])[0]))
+
+    results.sort(key=lambda r: r[0]) # back into candidate order, so the output doesn't depend on which call finished first
+    log.info("Resolved tracks", extra=fields(found=len(results), total=count))
+    save({"tracks": [t for _, t, _ in results]}, "final_candidate_tracks.json") # save json file for debugging
+    return [t for _, t, _ in results], np.stack([v for _, _, v in results])
+
+def _until_deadline(candidates, stage):
+    # YIELDS FROM candidates UNTIL THE CURRENT REQUEST'S BUDGET FOR stage RUNS OUT, THEN STOPS WITH WHAT IT HAS
+    # the LLM is read on its own thread, so a stalled stream can't hold the request past its deadline;
+    # an LLM error after some tracks have arrived also just ends the list early
+    if isinstance(candidates, list): # the LLM has already answered
+        yield from candidates
+        return
+    handoff = queue.Queue()
+    stop = threading.Event()
+
+    def _read():
+        try:
+            for t in candidates:
+                if stop.is_set():
+                    break
+                handoff.put((t, None))
+        except Exception as e:
+            handoff.put((_DONE, e))
+            return
+        handoff.put((_DONE, None))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(_read,), name="llm-reader", daemon=True).start()
+    count = 0
+    try:
+        while True:
+            left = remaining(stage)
+            try:
+                t, error = handoff.get(timeout=None if left is None else max(0.0, left))
+            except queue.Empty:
+                log.warning("LLM deadline reached, continuing with the tracks so far", extra=fields(tracks=count))
+                return
+            if t is _DONE:
+                if error is not None:
+                    if not count:
+                        raise error
+                    log.warning("LLM failed part way, continuing with the tracks so far", extra=fields(tracks=count, error=error))
+                return
+            count += 1
+            yield t
+    finally:
+        stop.set()
+        finish(stage)
+
+# method that builds the result cache key for a prompt
+def result_key(user_input, size=TOP_K, mode=RETRIEVAL_MODE):
+    # the models and temperature are part of the key, so changing either doesn't serve stale playlists
+    models = ",".join(groq_client.LLM_MODELS)
+    return f"{normalise_prompt(user_input)}|{mode}|{models}|{groq_client.TEMPERATURE}|s{groq_client.LLM_SHARDS}|n{size}|v{PIPELINE_VERSION}"
+
+# method that returns the time budget for a playlist of size tracks: REQUEST_DEADLINE, scaled up for large playlists but
+# never past LARGE_PLAYLIST_DEADLINE, since the page waits on the run
+def request_deadline(size):
+    if not REQUEST_DEADLINE: # no limit
+        return 0
+    return min(REQUEST_DEADLINE * max(1.0, size / TOP_K), max(REQUEST_DEADLINE, LARGE_PLAYLIST_DEADLINE))
+
+# function that runs the playlist generation using the user input, reusing cached or in-flight results for the same prompt
+def generate_playlist(user_input, streaming=True, stream_llm=True, session_id="default", fresh=False, progress=None, size=None, pool=None,
+                      mode=None):
+    # fresh=True skips the cache and coalescing, for users who want a new random set from the LLM
+    # progress (a tracing.Progress) is updated with completed/total counts per stage as the run goes
+    # size is the number of tracks wanted; above TOP_K the LLM is asked in rounds until there are enough candidates
+    # pool (a candidates.SessionPool) is given the resolved candidates, so refine_playlist can re-rank them later
+    # mode is one of RETRIEVAL_MODES, RETRIEVAL_MODE by default
+    size = max(1, min(size or TOP_K, MAX_PLAYLIST_SIZE))
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+    new_request() # tags this run's log lines and debug artifacts
+    track_progress(progress)
+    start_deadline(request_deadline(size)) # split across the stages, and scaled up for large playlists
+    key = result_key(user_input, size, mode)
+    log.info("Generating playlist", extra=fields(prompt=user_input, session=session_id, fresh=fresh, size=size, mode=mode))
+
+    def _compute():
+        top_tracks, table = run_pipeline(user_input, streaming=streaming, stream_llm=stream_llm, session_id=session_id,
+                                         use_prompt_cache=not fresh, size=size, mode=mode, fresh=fresh)
+        result_cache.set(key, (top_tracks, table if size <= TOP_K else None)) # large pools are too big to keep for every prompt
+        return top_tracks, table
+
+    def _compute_once(): # the cache may have been filled while we were waiting to become the leader
+        cached = result_cache.get(key)
+        return _compute() if cached is MISSING else cached
+
+    if fresh:
+        log.info("Fresh playlist requested, skipping the result cache")
+        top_tracks, table = _compute()
+    else:
+        cached = result_cache.get(key)
+        if cached is not MISSING:
+            log.info("Result cache hit", extra=fields(prompt=user_input))
+            top_tracks, table = cached
+        else:
+            top_tracks, table = in_flight.do(key, _compute_once)
+
+    if pool is not None:
+        _keep_pool(pool, user_input, table, top_tracks, size)
+    return copy.deepcopy(top_tracks)
+
+def _keep_pool(pool, user_input, table, top_tracks, size):
+    # GIVES A SESSION'S POOL THE CANDIDATES AND QUERY OF THE PLAYLIST IT WAS JUST SHOWN
+    if table is None or not top_tracks: # nothing to re-rank, the next refinement runs the pipeline for the combined prompt
+        pool.prompt, pool.table, pool.size, pool.last_action = user_input, None, size, None
+        return
+    query_vector = encode_texts([query_text(user_input)])[0] # embedded while ranking, so this is a cache hit
+    pool.set(user_input, table, query_vector, size, float(np.mean([t["similarity_score"] for t in top_tracks])))
+    pool.last_action = None
+
+# function that re-ranks a session's candidate pool for a refined prompt ("same but more upbeat"), without Groq or Spotify
+def refine_playlist(refinement, pool, session_id="default", blend=REFINE_BLEND, progress=None):
+    # RETURNS THE REFINED TOP TRACKS AND MOVES pool (A SessionPool FILLED BY generate_playlist) ON TO THE REFINED QUERY
+    # only the refinement is embedded; if the pool's best matches score below REFINE_MIN_RATIO of the original playlist's,
+    # the pipeline runs for the combined prompt and its candidates are merged into the pool before re-ranking
+    if pool.prompt is None: # no playlist yet
+        return generate_playlist(refinement, session_id=session_id, progress=progress, pool=pool)
+    prompt = f"{pool.prompt}, {refinement}"
+    if pool.table is None: # the playlist's pool wasn't kept (e.g. a large playlist from the result cache)
+        top_tracks = generate_playlist(prompt, session_id=session_id, progress=progress, size=pool.size, pool=pool)
+        pool.last_action = "fetched"
+        return top_tracks
+    new_request()
+    with span("refine"):
+        vector = encode_texts([query_text(refinement)])[0]
+        query = (1 - blend) * vector / (np.linalg.norm(vector) or 1.0) + blend * pool.query_vector
+        query /= np.linalg.norm(query) or 1.0
+        top = rank_vector(query, pool.table, k=pool.size)
+        fit = float(np.mean(top.scores)) if len(top) else 0.0
+    log.info("Refined playlist", extra=fields(prompt=prompt, fit=round(fit, 3), baseline=round(pool.baseline, 3)))
+    table, pool.last_action = pool.table, "reranked"
+
+    if fit < REFINE_MIN_RATIO * pool.baseline: # the pool doesn't have what the refinement asks for
+        log.info("Refinement needs more candidates", extra=fields(prompt=prompt))
+        fetched = SessionPool()
+        generate_playlist(prompt, session_id=session_id, fresh=True, progress=progress, size=pool.size, pool=fetched) # cached pools for a similar prompt wouldn't add anything
+        if fetched.table is not None:
+            table, pool.last_action = pool.merge(fetched.table, REFINE_MAX_POOL), "fetched"
+            top = rank_vector(query, table, k=pool.size)
+
+    pool.set(prompt, table, query, pool.size, pool.baseline) # later refinements build on this one
+    return top.to_dicts()
+
+# function that runs the full LLM -> Spotify -> ranking pipeline, returns (top tracks, candidate table)
+def run_pipeline(user_input, streaming=True, stream_llm=True, session_id="default", use_prompt_cache=True, size=TOP_K, mode=RETRIEVAL_MODE,
+                 fresh=False):
+    start = time.perf_counter()
+    use_prompt_cache = use_prompt_cache and size <= TOP_K # a normal playlist's pool is too small for a large one, and a large pool too big to keep
+
+    # catalog mode answers from the local index alone, unless it doesn't hold enough tracks yet;
+    # a fresh playlist asks the LLM for a new set instead, the local ranking would be the same every time
+    if mode == "catalog" and not fresh:
+        local = _run_local(user_input, size)
+        if local is not None:
+            return local
+
+    # 0. a near-duplicate of an earlier prompt can skip Groq and Spotify and just re-rank that prompt's candidates
+    query_vector = None
+    if use_prompt_cache and model_status() == "ready": # don't hold the LLM call up waiting for the model to load
+        query_vector = encode_texts([query_text(user_input)])[0]
+        hit = prompt_cache.lookup(query_vector)
+        if hit:
+            similar_prompt, similarity, table = hit
+            log.info("Semantic prompt cache hit", extra=fields(prompt=user_input, similar_prompt=similar_prompt, similarity=round(similarity, 3)))
+            for stage in ("llm", "search", "fetch", "embed"): # skipped, the pool was already resolved
+                finish(stage)
+            top_tracks = rank_candidates(user_input, table, k=size).to_dicts()
+            prompt_cache.record_hit_run(time.perf_counter() - start)
+            return top_tracks, table
+
+    table, top_tracks = _run_full_pipeline(user_input, streaming, stream_llm, session_id, size, hybrid=mode == "hybrid")
+    index_tracks(table) # later prompts can find these tracks locally
+
+    prompt_cache.record_full_run(time.perf_counter() - start)
+    if query_vector is not None:
+        prompt_cache.add(user_input, query_vector, table)
+    return top_tracks, table
+
+# function that answers a prompt from the local index of resolved tracks, without Groq or Spotify
+def _run_local(user_input, size=TOP_K):
+    # RETURNS (top tracks, candidate table), OR None IF THE INDEX CAN'T FILL THE PLAYLIST YET
+    query_vector = encode_texts([query_text(user_input)])[0]
+    table = search_index(query_vector, math.ceil(size * LOCAL_CANDIDATE_FACTOR))
+    if table is None or len(table) < size:
+        log.info("Local index can't fill the playlist yet, asking the LLM", extra=fields(found=0 if table is None else len(table), size=size))
+        return None
+    for stage in ("llm", "search", "fetch", "embed"): # skipped, every indexed track is already resolved and embedded
+        finish(stage)
+    expect("rank")
+    top = rank_vector(query_vector, table, k=size)
+    top_tracks = top.to_dicts()
+    log.info("Answered from the local index", extra=fields(prompt=user_input, candidates=len(table)))
+    save(top_tracks, "ranked_tracks.json") # save json file for debugging
+    return top_tracks, table
+
+def _with_local_hits(user_input, table, size):
+    # RETURNS THE LLM'S CANDIDATE TABLE WITH THE CLOSEST INDEXED TRACKS IT DIDN'T SUGGEST ADDED ON, AS MANY AS THE LLM WAS ASKED FOR
+    if table.embeddings is None:
+        descriptions = table.texts(track_text)
+        expect("embed", len(descriptions))
+        with span("embed", units=len(descriptions)):
+            table = table.with_embeddings(encode_texts(descriptions))
+    hits = search_index(encode_texts([query_text(user_input)])[0], math.ceil(size * CANDIDATE_FACTOR))
+    if hits is None or not len(hits):
+        return table
+    merged = table.merge(hits, len(table) + len(hits))
+    log.info("Added local candidates", extra=fields(llm=len(table), local=len(merged) - len(table)))
+    return merged
+
+def _run_full_pipeline(user_input, streaming, stream_llm, session_id, size=TOP_K, hybrid=False):
+    # RETURNS (candidate pool as a CandidateTable with its embeddings, top tracks)
+    # hybrid=True adds the closest tracks from the local index to the LLM's candidates before ranking
+    # 1. set up clients
+    gr = get_groq_client() # start groq client
+    sp = scheduled(get_spotify_client(), session_id) # start spotify client, rate limited and shared fairly with other sessions
+
+    if size > TOP_K: # large playlist: LLM rounds feed the same streaming stages until enough candidates are found
+        counts = ResolveCounts()
+        needed = math.ceil(size * CANDIDATE_FACTOR)
+        candidates = stream_candidate_rounds(gr, user_input, needed, missed=lambda: counts.missed, stream=stream_llm)
+        table = CandidateTable.from_tracks(*stream_resolve_tracks(sp, candidates, counts=counts))
+        log.info("Large playlist pool", extra=fields(size=size, candidates=len(table), missed=counts.missed))
+        if hybrid:
+            table = _with_local_hits(user_input, table, size)
+        return table, _ranked(user_input, table, k=size)
+
+    if streaming:
+        # 2. extract a dataset of tracks from an llm, streamed so each track can be searched while the rest are generated
+        if groq_client.LLM_SHARDS > 1: # several smaller calls at once, merged as each one returns
+            candidates = stream_sharded_candidate_tracks(gr, user_input, stream=stream_llm)
+        elif stream_llm:
+            candidates = stream_candidate_tracks(gr, user_input)
+        else:
+            candidates = prompt_llm_for_dataset(gr, user_input)["tracks"]
+
+        # 3-4. search, fetch and embed every track as soon as it's ready, without waiting for the slowest call
+        table = CandidateTable.from_tracks(*stream_resolve_tracks(sp, candidates)) # columns plus embeddings, ranking never changes it
+        if hybrid:
+            table = _with_local_hits(user_input, table, size)
+
+        # 5. rank using the embeddings computed in the pipeline
+        return table, _ranked(user_input, table, k=size)
+
+    # 2. extract a dataset of tracks from an llm
+    if groq_client.LLM_SHARDS > 1:
+        dataset_of_tracks = {"tracks": list(stream_sharded_candidate_tracks(gr, user_input, stream=False))}
+    else:
+        dataset_of_tracks = prompt_llm_for_dataset(gr, user_input) # store as dictionary
+
+    # 3. retrieve ids for each track via spotify
+    dataset_of_tracks_with_ids = get_track_ids_parallel(sp, dataset_of_tracks) # store as dictionary
+
+    # 4. get more data via spotify
+    updated_tracks = update_dataset_of_tracks(sp, dataset_of_tracks_with_ids)
+    if not updated_tracks.get("tracks"):
+        raise ValueError("No tracks provided for ranking.")
+    table = CandidateTable.from_tracks(updated_tracks["tracks"])
+    if hybrid:
+        table = _with_local_hits(user_input, table, size)
+
+    # 5. find most similar tracks using an embedding model (embeds the pool and keeps the embeddings on the table)
+    top = rank_candidates(user_input, table, k=size)
+    top_tracks = top.to_dicts()
+    save(top_tracks, "ranked_tracks.json") # save json file for debugging
+
+    return top.table, top_tracks
+
+def _ranked(user_input, table, k=TOP_K):
+    # RETURNS THE TOP k OF A CANDIDATE TABLE AS TRACK DICTS, THE ONLY TRACKS THAT ARE EVER BUILT AS DICTS
+    ranked_tracks = rank_candidates(user_input, table, k=k).to_dicts()
+    save(ranked_tracks, "ranked_tracks.json") # save json file for debugging
+    return ranked_tracks
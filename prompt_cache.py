@@ -0,0 +1,91 @@
+import os # for configuration from environment variables
+import time # for LRU bookkeeping
+import threading # shared by every streamlit session
+import numpy as np
+
+class SemanticPromptCache: # nearest-neighbour cache from prompt embeddings to resolved candidate pools
+    def __init__(self, max_entries, threshold):
+        self.max_entries = max_entries # bound on stored prompts, least recently used are evicted
+        self.threshold = threshold # cosine similarity a new prompt needs to reuse a stored pool
+        self._prompts = [] # prompt text per row, for logging
+        self._vectors = None # (n, dim) matrix of unit-length prompt embeddings
+        self._pools = [] # CandidateTable per row, shared with callers without copying since tables are never changed
+        self._last_used = [] # time each row was last added or hit
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0 # estimated latency saved by hits
+        self._full_run_seconds = None # moving average of a full pipeline run, used to estimate savings
+
+    def lookup(self, vector):
+        # RETURNS (prompt, similarity, candidate table) FOR THE CLOSEST STORED PROMPT ABOVE THE THRESHOLD, OR None
+        vector = _unit(vector)
+        with self._lock:
+            if self._vectors is None or not len(self._prompts):
+                self.misses += 1
+                return None
+            scores = self._vectors @ vector # cosine similarity to every stored prompt
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[best] = time.time()
+            return self._prompts[best], float(scores[best]), self._pools[best]
+
+    def add(self, prompt, vector, table):
+        # STORES A PROMPT AND ITS RESOLVED CANDIDATE POOL (A CandidateTable WITH EMBEDDINGS), EVICTING THE LEAST RECENTLY USED PROMPT IF FULL
+        vector = _unit(vector)
+        with self._lock:
+            if len(self._prompts) >= self.max_entries:
+                oldest = int(np.argmin(self._last_used))
+                for rows in (self._prompts, self._pools, self._last_used):
+                    del rows[oldest]
+                self._vectors = np.delete(self._vectors, oldest, axis=0)
+                self.evictions += 1
+            self._prompts.append(prompt)
+            self._pools.append(table)
+            self._last_used.append(time.time())
+            self._vectors = vector[None, :] if self._vectors is None else np.vstack([self._vectors, vector])
+
+    def record_full_run(self, seconds):
+        # UPDATES THE AVERAGE TIME OF A RUN THAT MISSED THE CACHE
+        with self._lock:
+            if self._full_run_seconds is None:
+                self._full_run_seconds = seconds
+            else:
+                self._full_run_seconds = 0.8 * self._full_run_seconds + 0.2 * seconds
+
+    def record_hit_run(self, seconds):
+        # ADDS THE TIME SAVED BY A RUN THAT HIT THE CACHE
+        with self._lock:
+            if self._full_run_seconds is not None:
+                self.saved_seconds += max(0.0, self._full_run_seconds - seconds)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_s": round(self.saved_seconds, 2),
+            "avg_full_run_s": round(self._full_run_seconds or 0.0, 2),
+            "size": len(self._prompts),
+            "evictions": self.evictions,
+        }
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+# one cache for the whole process
+prompt_cache = SemanticPromptCache(
+    max_entries=int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", 1000)),
+    threshold=float(os.getenv("PROMPT_CACHE_THRESHOLD", 0.9)),
+)
+
+# method that reports the semantic prompt cache hit rate and latency saved
+def get_prompt_cache_stats():
+    return prompt_cache.stats()
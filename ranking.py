@@ -0,0 +1,70 @@
+import os # for configuration from environment variables
+import numpy as np
+
+TOP_K = int(os.getenv("RANK_TOP_K", 20)) # number of tracks in the playlist
+MAX_PLAYLIST_SIZE = int(os.getenv("MAX_PLAYLIST_SIZE", 500)) # largest playlist a user can ask for, about what one LARGE_PLAYLIST_DEADLINE can resolve
+DIVERSITY = float(os.getenv("RANK_DIVERSITY", 0.2)) # MMR weight: 0 ranks on similarity alone, 1 only on being different from what's picked
+DUPLICATE_THRESHOLD = float(os.getenv("RANK_DUPLICATE_THRESHOLD", 0.95)) # candidates this close to a picked track are dropped (remixes, re-releases)
+MAX_PER_ARTIST = int(os.getenv("RANK_MAX_PER_ARTIST", 0)) # most tracks by one artist, 0 for no limit
+SHORTLIST_FACTOR = 10 # MMR only looks at the k * SHORTLIST_FACTOR most similar candidates, so cost doesn't grow with the pool
+
+def normalise_rows(matrix):
+    # RETURNS THE MATRIX WITH EVERY ROW SCALED TO UNIT LENGTH, SO A DOT PRODUCT IS A COSINE SIMILARITY
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def top_k(scores, k):
+    # RETURNS THE INDICES OF THE k HIGHEST SCORES, HIGHEST FIRST, WITHOUT SORTING THE WHOLE ARRAY
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k] # O(n) partial selection
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")] # only the k winners get sorted
+
+def mmr_select(scores, vectors, k, diversity=DIVERSITY, duplicate_threshold=DUPLICATE_THRESHOLD, artist_ids=None, max_per_artist=MAX_PER_ARTIST):
+    # RETURNS UP TO k INDICES PICKED BY MAXIMAL MARGINAL RELEVANCE:
+    # each step takes the candidate with the best (1 - diversity) * similarity to the prompt - diversity * similarity to the closest track already picked
+    # scores are cosine similarities to the prompt, vectors are unit-length candidate embeddings (one row per score)
+    # artist_ids (one int per candidate) with max_per_artist > 0 also caps how often one artist appears
+    # suppressed candidates are only used, most similar first, if there aren't k others
+    shortlist = top_k(scores, k * SHORTLIST_FACTOR)
+    if diversity <= 0 and duplicate_threshold >= 1 and not max_per_artist:
+        return shortlist[:k] # nothing to re-rank
+
+    relevance = scores[shortlist]
+    shortlist_vectors = vectors[shortlist]
+    closest = np.full(len(shortlist), -np.inf, dtype=np.float32) # similarity of each candidate to its nearest picked track
+    available = np.ones(len(shortlist), dtype=bool)
+    artists = None if artist_ids is None or not max_per_artist else np.asarray(artist_ids)[shortlist]
+    artist_counts = {}
+
+    picked = []
+    while len(picked) < k and available.any():
+        penalty = np.where(np.isfinite(closest), closest, 0) # nothing picked yet means no penalty
+        mmr = np.where(available, (1 - diversity) * relevance - diversity * penalty, -np.inf)
+        best = int(np.argmax(mmr))
+        picked.append(shortlist[best])
+        available[best] = False
+
+        closest = np.maximum(closest, shortlist_vectors @ shortlist_vectors[best]) # one matrix-vector product per pick
+        available &= closest < duplicate_threshold # near-duplicates of the new pick can't be picked later
+        if artists is not None:
+            artist_counts[artists[best]] = artist_counts.get(artists[best], 0) + 1
+            if artist_counts[artists[best]] >= max_per_artist:
+                available &= artists != artists[best]
+
+    if len(picked) < k: # ran out of distinct candidates, so top up with the suppressed ones rather than return a short playlist
+        chosen = set(picked)
+        picked += [i for i in shortlist if i not in chosen][:k - len(picked)]
+    return np.asarray(picked, dtype=np.int64)
+
+def rank(query_vector, vectors, k=TOP_K, diversity=DIVERSITY, duplicate_threshold=DUPLICATE_THRESHOLD, artist_ids=None, max_per_artist=MAX_PER_ARTIST):
+    # RETURNS (indices, similarities) OF THE k TRACKS TO KEEP, IN PLAYLIST ORDER
+    vectors = normalise_rows(vectors)
+    scores = vectors @ normalise_rows(query_vector) # cosine similarity of every candidate to the prompt
+    indices = mmr_select(scores, vectors, k, diversity, duplicate_threshold, artist_ids, max_per_artist)
+    return indices, scores[indices]
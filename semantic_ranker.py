@@ -1,65 +1,199 @@
-from sentence_transformers import SentenceTransformer, util
-import json
-from debugging import save # import debugging json method
-
-try:
-    # 1. load a pretrained Sentence Transformer model
-    print("[INFO] Loading text embedding model...")
-    model = SentenceTransformer("BAAI/bge-small-en-v1.5") # all-MiniLM-L6-v2     all-mpnet-base-v2
-except Exception as e:
-    print(f"Failed to load embedding model: {e}")
-    raise
-
-# method that gets most similar songs
-def get_most_similar_tracks(user_input, tracks_list):
-    # RETURNS A LIST OF MOST SEMANTIC SIMILAR TRACKS
-    print("\n[STEP] RETURNING LIST OF SIMILAR TRACKS")
+import os
+import threading # model loads on a background thread so the page can render straight away
+from debugging import save, get_logger, fields # debugging artifacts and structured logging
+from cache import CACHE_DIR
+from embedding_cache import EmbeddingCache # content-addressed cache so only unseen texts get encoded
+from embedding_service import EmbeddingService, RemoteEmbeddingClient # batches encode calls from every session
+from ranking import rank, TOP_K, DIVERSITY # partial top-k selection and diversity re-ranking
+from candidates import CandidateTable # columnar candidate pool, ranked into views without copying tracks
+from encoders import load_encoder, cache_name, EMBEDDING_BACKEND # torch, ONNX or int8 ONNX model behind one encode call
+from vector_index import VectorIndex, VECTOR_INDEX_ENABLED # persistent nearest-neighbour index of every resolved track
+from tracing import span, expect # stage timings and request progress
 
+log = get_logger("ranker")
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5") # all-MiniLM-L6-v2     all-mpnet-base-v2
+
+# embedding cache shared by every session (and every process using the same cache folder)
+embedding_cache = EmbeddingCache(os.path.join(CACHE_DIR, "embeddings"), cache_name(MODEL_NAME)) # int8 vectors are kept apart from fp32 ones
+
+# local index of every track the pipeline has resolved and embedded, so prompts can be answered without the LLM
+track_index = VectorIndex(os.path.join(CACHE_DIR, "index"), cache_name(MODEL_NAME)) if VECTOR_INDEX_ENABLED else None
+
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET") # if set, encode through a shared service in another process instead of a local model
+MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH", 64)) # most texts per model call
+MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5)) # how long a request waits for others to join its batch
+
+# model state, shared by every streamlit session in the process
+_model = None # the encoder (a SentenceTransformer or an OnnxEncoder), once loaded
+_model_error = None # the exception if loading failed
+_model_ready = threading.Event() # set when loading has finished (successfully or not)
+_model_thread = None # background loader thread
+_model_lock = threading.Lock()
+
+def _load_model():
+    # LOADS THE EMBEDDING MODEL (RUNS ON THE BACKGROUND THREAD)
+    global _model, _model_error
     try:
-        # 2. add context to user input
-        user_input = f"Songs that match the vibe of {user_input}"
+        # 1. load a pretrained Sentence Transformer model
+        log.info("Loading text embedding model...", extra=fields(model=MODEL_NAME, backend=EMBEDDING_BACKEND))
+        _model = load_encoder(MODEL_NAME) # EMBEDDING_BACKEND picks the runtime, EMBEDDING_THREADS caps its intra-op threads
+        log.info("Text embedding model ready.")
+    except Exception as e:
+        log.error("Failed to load embedding model", extra=fields(error=e))
+        _model_error = e
+    finally:
+        _model_ready.set()
+
+# method that starts loading the model in the background (safe to call on every streamlit rerun)
+def start_model_loading():
+    global _model_thread, _model_error
+    if EMBEDDING_SOCKET: # the model lives in the shared embedding service
+        return
+    with _model_lock:
+        if _model_thread is not None and _model_error is not None: # last attempt failed, so try again
+            _model_thread = None
+            _model_error = None
+            _model_ready.clear()
+        if _model_thread is None:
+            _model_thread = threading.Thread(target=_load_model, name="embedding-model-loader", daemon=True)
+            _model_thread.start()
+
+# method that reports the model state for the UI: "idle", "loading", "ready" or "failed"
+def model_status():
+    if EMBEDDING_SOCKET:
+        return "ready" if os.path.exists(EMBEDDING_SOCKET) else "failed"
+    if _model_thread is None:
+        return "idle"
+    if not _model_ready.is_set():
+        return "loading"
+    return "failed" if _model_error is not None else "ready"
+
+# method that returns the loaded model, waiting for the background load if needed
+def get_model(timeout=None):
+    start_model_loading() # no-op if it's already loading or loaded
+    if not _model_ready.wait(timeout):
+        raise TimeoutError(f"Embedding model was not ready after {timeout} seconds")
+    if _model_error is not None:
+        raise RuntimeError(f"Embedding model failed to load: {_model_error}") from _model_error
+    return _model
+
+# method that formats the text embedded for a track
+def track_text(track):
+    return f"{track['track']} by {track['artists']} - {track['description']}"
+
+# method that adds context to the user input before it's embedded
+def query_text(user_input):
+    return f"Songs that match the vibe of {user_input}"
+
+_encoder = None # shared micro-batching encoder, created on first use
+
+# method that runs one batch through the model, waiting for the background load if needed
+def _encode_batch(texts):
+    model = get_model()
+    with span("encode"):
+        return model.encode(texts, convert_to_numpy=True, batch_size=MAX_BATCH_SIZE)
 
-        # 3. extract descriptions to a list
-        print("[INFO] Extracting track descriptions...")
-        if not tracks_list.get("tracks"):
+# method that returns the encoder used for texts that aren't cached: a batching service, in this process or another one
+def get_encoder():
+    global _encoder
+    with _model_lock:
+        if _encoder is None:
+            if EMBEDDING_SOCKET:
+                _encoder = RemoteEmbeddingClient(EMBEDDING_SOCKET)
+            else:
+                _encoder = EmbeddingService(
+                    _encode_batch,
+                    max_batch_size=MAX_BATCH_SIZE,
+                    max_wait_ms=MAX_WAIT_MS
+                )
+        return _encoder
+
+# method that embeds a list of texts, only encoding the ones not already cached
+def encode_texts(texts):
+    return embedding_cache.encode(get_encoder(), texts)
+
+# method that returns an id per track for its lead artist, so the ranker can cap how often one artist appears
+def artist_ids(artists_column):
+    ids = {}
+    result = []
+    for artists in artists_column:
+        artists = artists or ""
+        lead = artists[0] if isinstance(artists, list) and artists else str(artists).split(",")[0]
+        result.append(ids.setdefault(lead.strip().lower(), len(ids)))
+    return result
+
+# method that ranks a candidate table against the user input, embedding the candidates first if the table has no embeddings
+def rank_candidates(user_input, table, k=TOP_K, diversity=DIVERSITY):
+    # RETURNS A CandidateView OF THE k PICKED ROWS IN PLAYLIST ORDER, WITH THEIR SIMILARITY SCORES
+    # k is the playlist length, diversity (0-1) trades similarity to the prompt for variety between the picked tracks
+    log.info("Returning list of similar tracks...")
+
+    try:
+        # 2. add context to user input
+        user_input = query_text(user_input)
+        if not len(table):
             raise ValueError("No tracks provided for ranking.")
 
-        descriptions = []
-        for track in tracks_list["tracks"]:
-            check = f"{track["track"]} by {track["artists"]} - {track["description"]}" # format descriptions
-            descriptions.append(check)
-        # print(descriptions)
-
-        # 4. encode user input and descriptions
-        print("[INFO] Encoding user input and track descriptions...")
-        embeddings = model.encode([user_input] + descriptions, convert_to_tensor=True) # add user_input and descriptions together to make 1 list
-        # print(embeddings)
-
-        # 5. compute cosine similarity
-        print("[INFO] Computing cosine similarity...")
-        similarities = util.cos_sim(embeddings[0], embeddings[1:]) # find the similarity between user input (embeddings[0]) and every description (embeddings[1:])
-        # print(similarities)
-
-        # 6. get indices of top tracks
-        print("[INFO] Retrieving top indices of top tracks...")
-        top_indices = similarities[0].argsort(descending=True) # get the similarities only (similarities[0]) and return the indices that would sort the tensor in desc order (argsort(desc=true))
-        # print(top_indices)
-
-        # 7. build ranked list
-        print("[INFO] Building ranked list of tracks based on semantic similarity...")
-        ranked_tracks = []
-        for i in top_indices: # for each index in the top_indices list, which is sorted by similarity
-            track = tracks_list["tracks"][i] # get the track at that index
-            score = float(similarities[0][i]) # convert the tensor to a float
-            track["similarity_score"] = score # store similarity score
-            ranked_tracks.append(track) # and add it to the ranked tracks list
-        
-        n = 20 # number of tracks to return
-        print("\n[RESULT] Successfully ranked tracks:")
-        print(json.dumps(ranked_tracks[:n], indent=2))
-        save(ranked_tracks[:n], "ranked_tracks.json") # save json file for debugging
-        return ranked_tracks[:n]
-    
+        # 3-4. encode user input, and the track descriptions if they weren't embedded earlier in the pipeline
+        log.debug("Encoding user input and track descriptions...")
+        if table.embeddings is None:
+            descriptions = table.texts(track_text) # format descriptions
+            expect("embed", len(descriptions))
+            with span("embed", units=len(descriptions)):
+                embeddings = encode_texts([user_input] + descriptions) # add user_input and descriptions together to make 1 list, only unseen texts are encoded
+            query_vector, table = embeddings[0], table.with_embeddings(embeddings[1:])
+        else:
+            query_vector = encode_texts([user_input])[0]
+
+        # 5-7. compute cosine similarity and pick the top k, skipping near-duplicates
+        log.debug("Ranking tracks by semantic similarity...")
+        expect("rank")
+        ranked = rank_vector(query_vector, table, k=k, diversity=diversity)
+        log.info("Successfully ranked tracks", extra=fields(candidates=len(table), picked=len(ranked)))
+        return ranked
+
     except Exception as e:
-        print(f"[ERROR] Unexpected error in get_most_similar_tracks: {e}")
+        log.error("Unexpected error in rank_candidates", extra=fields(error=e))
         raise
+
+# method that ranks a candidate table against an already embedded query
+def rank_vector(query_vector, table, k=TOP_K, diversity=DIVERSITY):
+    # RETURNS A CandidateView OF THE k PICKED ROWS IN PLAYLIST ORDER; THE RANKED LIST IS A VIEW OF THE PICKED ROWS,
+    # TRACKS ARE ONLY BUILT AS DICTS WHEN THEY'RE SHOWN
+    with span("rank"):
+        top_indices, similarities = rank(query_vector, table.embeddings, k=k, diversity=diversity,
+                                         artist_ids=artist_ids(table.columns["artists"])) # partial top-k, then MMR over the shortlist
+    return table.take(top_indices, similarities)
+
+# method that adds a candidate pool's resolved tracks to the local index, returns how many were new
+def index_tracks(table):
+    if track_index is None:
+        return 0
+    try:
+        with span("index"):
+            return track_index.add(table)
+    except Exception as e: # the index is an optimisation, a failed add never fails the request
+        log.warning("Failed to index tracks", extra=fields(error=e))
+        return 0
+
+# method that returns the k indexed tracks closest to an embedded query, as a CandidateTable with their embeddings
+def search_index(query_vector, k):
+    if track_index is None:
+        return None
+    with span("retrieve"):
+        return track_index.lookup(query_vector, k)
+
+# method that reports the size of the local index and how it has been searched
+def get_index_stats():
+    return track_index.stats() if track_index else {}
+
+# method that gets most similar songs, track_embeddings can be passed in if they were already computed (one row per track)
+def get_most_similar_tracks(user_input, tracks_list, track_embeddings=None, k=TOP_K, diversity=DIVERSITY):
+    # RETURNS A LIST OF MOST SEMANTIC SIMILAR TRACKS (NEW DICTS WITH A similarity_score, THE INPUT TRACKS ARE LEFT AS THEY ARE)
+    if not tracks_list.get("tracks"):
+        raise ValueError("No tracks provided for ranking.")
+    table = CandidateTable.from_tracks(tracks_list["tracks"], track_embeddings)
+    ranked_tracks = rank_candidates(user_input, table, k=k, diversity=diversity).to_dicts()
+    save(ranked_tracks, "ranked_tracks.json") # save json file for debugging
+    return ranked_tracks
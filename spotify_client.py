@@ -1,52 +1,171 @@
 import spotipy # library for spotify commands
 from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth # import modules for authentication
+from spotipy.cache_handler import CacheHandler, MemoryCacheHandler # keep tokens in memory, not in a shared .cache file
 import os # for getting exported env variables
 from dotenv import load_dotenv # reads variables from .env file and exports them in the os
-import json
-from debugging import save # import debugging json method
+from debugging import save, get_logger, fields, in_context # debugging artifacts and structured logging
+from tracing import traced, span, expect, advance # stage timings and request progress
 import webbrowser # for opening playlist in a new tab
-from concurrent.futures import ThreadPoolExecutor, as_completed # for parellisation
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout # for parellisation
 import streamlit as st
+import time # for proactive token refresh
+import threading # for creating the shared clients once
+import requests # for the HTTP session handed to spotipy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from spotify_scheduler import scheduled # every Spotify call goes through one process-wide scheduler
+from cache import PersistentCache, TieredCache, MISSING, CACHE_DIR, normalise_track_key # on-disk cache for Spotify lookups
+from catalog import catalog, get_catalog_stats # local catalog of resolved tracks, searched before Spotify
+from deadline import hedged, remaining, DeadlineExceeded # per-request time budget, hedged Spotify calls
+
+log = get_logger("spotify")
+
+# track used when no candidate could be found on Spotify: The Weeknd's Blinding Lights, the biggest song on Spotify
+FALLBACK_TRACK = {
+    "artists": "The Weeknd",
+    "track": "Blinding Lights",
+    "description": "",
+    "ID": "0VjIjW4GlUZAMYd2vXMi3b"
+}
+
+# search cache shared by every streamlit session in this process, so repeated LLM suggestions skip sp.search
+search_cache = PersistentCache(
+    path=os.path.join(CACHE_DIR, "search_cache.sqlite3"),
+    ttl=int(os.getenv("SEARCH_CACHE_TTL", 7 * 24 * 3600)), # found IDs stay valid for a week
+    negative_ttl=int(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", 24 * 3600)), # "no result" misses are retried after a day
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 50000)),
+)
+
+# track metadata cache keyed by Spotify ID: in-memory LRU for hot tracks, backed by an on-disk store
+track_cache = TieredCache(
+    store=PersistentCache(
+        path=os.path.join(CACHE_DIR, "track_cache.sqlite3"),
+        ttl=int(os.getenv("TRACK_CACHE_TTL", 30 * 24 * 3600)), # names, covers and URIs almost never change
+        max_entries=int(os.getenv("TRACK_CACHE_MAX_ENTRIES", 200000)),
+    ),
+    memory_entries=int(os.getenv("TRACK_CACHE_MEMORY_ENTRIES", 5000)),
+)
+
+PLAYLIST_CHUNK = 100 # most items Spotify accepts in one add request
+PLAYLIST_WRITE_CONCURRENCY = int(os.getenv("PLAYLIST_WRITE_CONCURRENCY", 4)) # add requests in flight at once for large playlists
+PLAYLIST_WRITE_ATTEMPTS = 3 # read-back and repair passes before giving up on a playlist write
+
+TOKEN_REFRESH_MARGIN = 300 # refresh access tokens this many seconds before they expire, so no request waits for a new one
+POOL_SIZE = int(os.getenv("SPOTIFY_POOL_SIZE", os.getenv("SPOTIFY_MAX_CONCURRENCY", 20))) # keep-alive connections, sized to the scheduler's max in-flight calls
+
+_clients = {} # shared client instances for the life of the process
+_clients_lock = threading.RLock() # re-entrant, so a client being created can fetch the shared session
+
+class NoCacheHandler(CacheHandler): # user tokens live in each streamlit session, never in a cache shared between users
+    def get_cached_token(self):
+        return None
+
+    def save_token_to_cache(self, token_info):
+        pass
+
+# method that builds the HTTP session used by spotipy
+def build_requests_session(pool_size=POOL_SIZE):
+    # 429 and 5xx are not retried here, the scheduler retries them after Spotify's Retry-After instead of blocking a slot
+    retry = Retry(total=2, connect=2, read=False, status_forcelist=(), respect_retry_after_header=False)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry) # reuse warm TCP/TLS connections
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# method that returns the process-wide HTTP session for Spotify
+def get_requests_session():
+    with _clients_lock:
+        if "session" not in _clients:
+            _clients["session"] = build_requests_session()
+        return _clients["session"]
+
+# method that keeps the app's access token fresh in the background (runs on its own thread)
+def _keep_token_fresh(auth_manager):
+    while True:
+        token_info = auth_manager.cache_handler.get_cached_token()
+        if token_info:
+            remaining = token_info["expires_at"] - time.time()
+            wait = remaining - min(TOKEN_REFRESH_MARGIN, remaining / 2)
+            if wait > 1:
+                time.sleep(wait)
+                continue
+        try:
+            auth_manager.get_access_token(as_dict=False, check_cache=False) # request and cache a new token before the old one runs out
+            log.info("Refreshed Spotify access token.")
+        except Exception as e:
+            log.warning("Failed to refresh Spotify access token", extra=fields(error=e))
+            time.sleep(30)
 
 def get_spotify_client():
+    # RETURNS THE SHARED SPOTIFY WEB API CLIENT, CREATING IT ON FIRST USE
+    with _clients_lock:
+        if "spotify" not in _clients:
+            _clients["spotify"] = _create_spotify_client()
+        return _clients["spotify"]
+
+def _create_spotify_client():
     # INITIALISES AND RETURNS A SPOTIFY WEB API CLIENT
-    print("\n[INFO] Setting up Spotify client...")
+    log.info("Setting up Spotify client...")
     try:
-        print("[INFO] Loading environmental varaiables...")
+        log.debug("Loading environmental variables...")
         load_dotenv() # load env variables from .env file
 
         client_id = os.getenv("CLIENT_ID") # get credentials
         client_secret = os.getenv("CLIENT_SECRET")
         if not client_id:
-            print("[ERROR] CLIENT_ID not found in .env file")
+            log.error("CLIENT_ID not found in .env file")
             raise EnvironmentError("Missing CLIENT_ID in .env")
         if not client_secret:
-            print("[ERROR] CLIENT_SECRET not found in .env file")
+            log.error("CLIENT_SECRET not found in .env file")
             raise EnvironmentError("Missing CLIENT_SECRET in .env")
         
-        auth_manager = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret) # authenticate and get token
-        print("[INFO] Spotify Web client initialised successfully.")
+        session = get_requests_session()
+        auth_manager = SpotifyClientCredentials(
+            client_id=client_id,
+            client_secret=client_secret,
+            requests_session=session,
+            cache_handler=MemoryCacheHandler() # token is reused by every request in this process
+        ) # authenticate and get token
+        auth_manager.OAUTH_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", auth_manager.OAUTH_TOKEN_URL) # can point at a local stand-in
+        threading.Thread(target=_keep_token_fresh, args=(auth_manager,), name="spotify-token-refresh", daemon=True).start()
+        log.info("Spotify Web client initialised successfully.")
 
         # token_info = auth_manager.get_access_token() # print contents of token
         # print(token_info)
 
-        return spotipy.Spotify(auth_manager=auth_manager)
+        sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
+        sp.prefix = os.getenv("SPOTIFY_API_URL", sp.prefix)
+        return sp
     
     except Exception as e:
-        print(f"[ERROR] Failed to initialise Spotify client: {e}")
+        log.error("Failed to initialise Spotify client", extra=fields(error=e))
         raise
 
 # method that searches for a track in Spotify and returns its ID
+@traced("search")
 def search_track(sp, artists, song):
     # SEARCHES FOR A SEED TRACK AND RETRIEVES ITS IDS
-    print(f"\n[STEP] SEARCHING SPOTIFY FOR TRACK: {song} BY {artists}")
+
+    if catalog is not None: # tracks we've resolved before, under this or a similar spelling
+        match = catalog.resolve(artists, song)
+        if match:
+            log.debug("Catalog hit", extra=fields(track=song, artists=artists, id=match[0], confidence=round(match[1], 3)))
+            return match[0]
+
+    key = normalise_track_key(artists, song) # same key for "Song (feat. X)" and "song", etc.
+    cached = search_cache.get(key)
+    if cached is not MISSING: # answered from cache, including cached "no result" misses
+        log.debug("Search cache hit", extra=fields(track=song, artists=artists, id=cached))
+        return cached
 
     try:
         # sp = get_spotify_client() # start client
         # print(sp.available_markets()) # get country codes, Ireland: IE, UK: GB, America: US
 
-        print(f"[INFO] Searching for: {song} by {artists}...")
-        results = sp.search(
+        log.debug("Searching Spotify", extra=fields(track=song, artists=artists))
+        results = hedged( # a slow search gets a second copy, and gives up when the request runs out of time
+            "search", sp.search,
             q = f"{artists} {song}",
             limit = 1, # we only need 1 track per search (retrieves the first suggestion)
             type = "track", # we only want tracks from the search, no albums, audiobooks etc
@@ -55,126 +174,204 @@ def search_track(sp, artists, song):
 
         items = results.get("tracks", {}).get("items", []) # retreive the the list of items from the search
         if items:
-            print(f"[INFO] Found {len(items)} result(s). Extracting track ID...")
             track_id = items[0].get("id") # get the first ID from the search and return it
             if track_id:
-                print(f"\n[RESULT] Track search completed successfully, obtained ID: {track_id}")
+                log.debug("Track search completed successfully", extra=fields(track=song, id=track_id))
+                search_cache.set(key, track_id)
+                data = slim_track(items[0]) # search returns full track objects, so the Get Track call can be skipped
+                track_cache.set_many({track_id: data})
+                if catalog is not None:
+                    catalog.add(track_id, data, aliases=[(artists, song)])
                 return track_id
 
-        print("[WARN] No results found for this search query.")
+        log.debug("No results found for this search query", extra=fields(track=song, artists=artists))
+        search_cache.set(key, None) # negative cache, so we don't search for it again on the next request
         return None # otherwise return null
     
+    except DeadlineExceeded: # not cached, it may well be found next time
+        log.warning("Search ran out of time", extra=fields(track=song, artists=artists))
+        return None
     except spotipy.exceptions.SpotifyException as e:
-        print(f"[ERROR] Spotify API error: {e}")
+        log.error("Spotify API error in search_track", extra=fields(error=e))
     except Exception as e:
-        print(f"[ERROR] Unexpected error in search_tracks: {e}")
+        log.error("Unexpected error in search_track", extra=fields(error=e))
         raise
 
+# method that keeps only the fields of a Get Track response that update_dataset_of_tracks uses
+def slim_track(tr):
+    images = tr["album"]["images"]
+    return {
+        "name": tr["name"],
+        "artists": ", ".join([a["name"] for a in tr["artists"]]), # all contributing artists
+        "spotify_url": tr["external_urls"]["spotify"],
+        "uri": tr["uri"],
+        "album_cover": images[0]["url"] if images else None, # 0 = 640 pixels, 1=300 pixels, 2 = 64 pixels
+        "album_name": tr["album"]["name"],
+    }
+
 # method that gets all data of tracks from a list of ids
 def get_tracks_data(sp, track_ids):
     try:
         # sp = get_spotify_client() # start Spotify client
-        print("[INFO] Calling Spotify Get Track API...")
+        log.debug("Calling Spotify Get Track API...")
         # data = sp.tracks(tracks=track_ids, market="GB") # call Spotify Get Track API and save the output NOTE: no longer needed because of migration 9/3/25
         # return data
         # NOTE: the below logic replicates the deprecated batch Several Tracks call (9/3/25) using threads
         # RETRIEVES TRACK DATA IN PARALLEL
         if not track_ids: # safety check for if no ids were passed in
-            print("[WARN] No track IDs provided.")
+            log.warning("No track IDs provided.")
             return {"tracks": []}
-        
-        def _get_one(index, track_id): # helper function that gets data 1 Spotify track
-            tr = sp.track(track_id, market="US") # call Spotify Get Track
-            return index, tr # returning index to store original placement
-        
-        tracks = [None] * len(track_ids) # placeholder list to be filled
 
-        with ThreadPoolExecutor(max_workers=10) as ex: # create a pool of 10 worker threads
+        cached = track_cache.get_many(track_ids) # slim track data we already have, so only unseen IDs go to Spotify
+        if catalog is not None: # resolved before, the catalog keeps the metadata
+            for track_id in dict.fromkeys(track_ids):
+                data = catalog.get(track_id) if track_id not in cached else None
+                if data:
+                    cached[track_id] = data
+        missing_ids = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in cached]
+        log.info("Track cache lookup", extra=fields(cached=len(track_ids) - len(missing_ids), to_fetch=len(missing_ids)))
+        expect("fetch", len(track_ids))
+        advance("fetch", len(track_ids) - len(missing_ids))
+
+        def _get_one(track_id): # helper function that gets data 1 Spotify track
+            with span("fetch"):
+                tr = hedged("fetch", sp.track, track_id, market="US") # call Spotify Get Track
+            return track_id, tr # returning id so the result can be matched back up
+
+        fetched = {}
+        if missing_ids:
+            ex = ThreadPoolExecutor(max_workers=10) # create a pool of 10 worker threads
             futures = [ # submit all API calls to run concurrently
-                ex.submit(_get_one, i, track_id)
-                for i, track_id in enumerate(track_ids)
+                ex.submit(in_context(_get_one), track_id) # keep the request id in the worker's log lines
+                for track_id in missing_ids
             ]
-            
-            for f in as_completed(futures): # loop over results as each thread finishes
-                index, tr = f.result() # get index and track response from thread result
-                tracks[index] = tr # store track response in correct position
-                print(f"[INFO] Retrieved data for track {index}!")
-
-        print("\n[RESULT] Successfully retrieved tracks metadata\n")
+            try:
+                for f in as_completed(futures, timeout=remaining("fetch")): # loop over results as each thread finishes
+                    try:
+                        track_id, tr = f.result() # get id and track response from thread result
+                    except Exception as e: # one failed track doesn't lose the others, it is dropped later
+                        log.warning("Failed to get track data", extra=fields(error=e))
+                        continue
+                    if tr:
+                        fetched[track_id] = slim_track(tr)
+                    log.debug("Retrieved data for track", extra=fields(id=track_id))
+            except FuturesTimeout: # out of time, the stragglers are dropped later
+                log.warning("Track fetch deadline reached", extra=fields(unfinished=sum(not f.done() for f in futures)))
+            finally:
+                ex.shutdown(wait=False, cancel_futures=True) # don't wait for stragglers, and drop calls not started yet
+            track_cache.set_many(fetched) # remember them for the next request
+
+        cached.update(fetched)
+        tracks = [cached.get(track_id) for track_id in track_ids] # put results back in the original order
+
+        log.info("Successfully retrieved tracks metadata", extra=fields(tracks=len(tracks)))
         return {"tracks": tracks} # return results in the same structure as old Spotify Get Several Tracks response
 
     except spotipy.exceptions.SpotifyException as e:
-        print(f"[ERROR] Spotify API error: {e}")
+        log.error("Spotify API error in get_tracks_data", extra=fields(error=e))
     except Exception as e:
-        print(f"[ERROR] Unexpected error in get_track_data: {e}")
+        log.error("Unexpected error in get_tracks_data", extra=fields(error=e))
         raise
 
+# method that gets the slim data of 1 track, using the track cache
+@traced("fetch")
+def get_track_data(sp, track_id):
+    cached = track_cache.get_many([track_id])
+    if track_id in cached:
+        return cached[track_id]
+    data = catalog.get(track_id) if catalog is not None else None # resolved before, the catalog keeps the metadata
+    if data:
+        track_cache.set_many({track_id: data})
+        return data
+    tr = hedged("fetch", sp.track, track_id, market="US") # call Spotify Get Track
+    if not tr:
+        return None
+    data = slim_track(tr)
+    track_cache.set_many({track_id: data})
+    return data
+
+# method that copies slim Spotify data onto an LLM track dictionary
+def apply_track_data(t, tr):
+    t["track"] = tr["name"] # get track name and update in case it's inaccurate
+    t["artists"] = tr["artists"] # get all contribuiting artists and update in case it's inaccurate
+    t["spotify_url"] = tr["spotify_url"] # get spotify link to play song
+    t["uri"] = tr["uri"] # get spotify uri for playlist creation
+    t["album_cover"] = tr["album_cover"] # 640 pixel cover
+    t["album_name"] = tr["album_name"] # get album name
+    return t
+
 # method that adds details from Spotify to LLM track dictionary 
 def update_dataset_of_tracks(sp, tracks_list):
     # RETRIEVES TRACK DATA VIA SPOTIFY
-    print("\n[STEP] RETRIEVE NECESSARY TRACK DATA")
+    log.info("Retrieving necessary track data...")
     try:
         ids = [] # extract ids into a list
         for t in tracks_list["tracks"]:
             ids.append(t["ID"])
 
         if not ids:
-            print("[WARN] No track IDs found.")
+            log.warning("No track IDs found.")
             return tracks_list
 
         tracks_resp = get_tracks_data(sp, ids) # call Spotify's Get Several Tracks API with list of all IDs and save output
 
+        resolved = []
         for t, tr in zip(tracks_list["tracks"], tracks_resp["tracks"]): # loop through both tracks and API response lists
-            if not tr: # if for some reason the API track response doesn't exist, skip
-                print(f"[WARN] Spotify returned None for ID={t.get('ID')}")
+            if not tr: # if for some reason the API track response doesn't exist, drop it (no link, URI or cover to show)
+                log.warning("Spotify returned None for track", extra=fields(id=t.get("ID")))
                 continue
 
-            print("[INFO] Updating Track data from Spotify...")
-            t["track"] = tr["name"] # get track name and update in case it's inaccurate
-            t["artists"] = ", ".join([a["name"] for a in tr["artists"]]) # get all contribuiting artists and update in case it's inaccurate
-            t["spotify_url"] = tr["external_urls"]["spotify"] # get spotify link to play song
-            t["uri"] = tr["uri"] # get spotify uri for playlist creation
-            t["album_cover"] = tr["album"]["images"][0]["url"] # 0 = 640 pixels, 1=300 pixels, 2 = 64 pixels
-            t["album_name"] = tr["album"]["name"] # get album name
-            print(f"[INFO] Updated {t['artists']} - {t['track']}")
+            resolved.append(apply_track_data(t, tr))
+            log.debug("Updated track data from Spotify", extra=fields(track=t["track"], artists=t["artists"]))
+        tracks_list["tracks"] = resolved
 
-        print("\n[RESULT] Sucessfully updated track set")
+        log.info("Successfully updated track set", extra=fields(tracks=len(tracks_list["tracks"])))
         save(tracks_list, "final_candidate_tracks.json") # save json file for debugging
         return tracks_list
     except Exception as e:
-        print(f"[ERROR] Unexpected error in update_dataset_of_tracks: {e}")
+        log.error("Unexpected error in update_dataset_of_tracks", extra=fields(error=e))
         raise
 
 def get_spotify_oauth():
+    # RETURNS THE SHARED SPOTIFY OAUTH MANAGER, CREATING IT ON FIRST USE
+    with _clients_lock:
+        if "oauth" not in _clients:
+            _clients["oauth"] = _create_spotify_oauth()
+        return _clients["oauth"]
+
+def _create_spotify_oauth():
     # INITIALISES AND RETURNS A SPOTIFY WEB API CLIENT
-    print("\n[INFO] Setting up Spotify user client...")
+    log.info("Setting up Spotify user client...")
     try:
-        print("[INFO] Loading environmental varaiables...")
+        log.debug("Loading environmental variables...")
         load_dotenv() # load env variables from .env file
 
         client_id = os.getenv("CLIENT_ID") # get credentials
         client_secret = os.getenv("CLIENT_SECRET")
         if not client_id:
-            print("[ERROR] CLIENT_ID not found in .env file")
+            log.error("CLIENT_ID not found in .env file")
             raise EnvironmentError("Missing CLIENT_ID in .env")
         if not client_secret:
-            print("[ERROR] CLIENT_SECRET not found in .env file")
+            log.error("CLIENT_SECRET not found in .env file")
             raise EnvironmentError("Missing CLIENT_SECRET in .env")
         
         auth_manager = SpotifyOAuth(
             client_id=client_id,
             client_secret=client_secret,
             redirect_uri="https://ai-playlist-generator.streamlit.app", # https://ai-playlist-generator.streamlit.app/callback
-            scope="playlist-modify-private,playlist-modify-public,"
+            scope="playlist-modify-private,playlist-modify-public,",
+            requests_session=get_requests_session(),
+            cache_handler=NoCacheHandler() # the manager is shared, so tokens must stay in each user's session
         ) # authenticate and get token
-        print("[INFO] Spotify Web client initialised successfully for user.")
+        auth_manager.OAUTH_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", auth_manager.OAUTH_TOKEN_URL)
+        log.info("Spotify Web client initialised successfully for user.")
 
         # token_info = auth_manager.get_access_token() # print contents of token
         # print(token_info)
 
         return auth_manager
     except Exception as e:
-        print(f"[ERROR] Failed to initialise Spotify client for user: {e}")
+        log.error("Failed to initialise Spotify OAuth manager", extra=fields(error=e))
         raise
 
 # intialise client with additional settings for user to login to their account
@@ -185,24 +382,28 @@ def get_spotify_client_for_user():
         # Step 3: Token already retrieved in this session
         if "spotify_token" in st.session_state:
             token_info = st.session_state["spotify_token"]
-            # Refresh if expired
-            if auth_manager.is_token_expired(token_info):
+            # Refresh if expired, or about to expire
+            if token_info["expires_at"] - time.time() < TOKEN_REFRESH_MARGIN:
                 token_info = auth_manager.refresh_access_token(token_info["refresh_token"])
                 st.session_state["spotify_token"] = token_info
-            return spotipy.Spotify(auth=token_info["access_token"])
+            sp = spotipy.Spotify(auth=token_info["access_token"], requests_session=get_requests_session()) # pooled connections
+            sp.prefix = os.getenv("SPOTIFY_API_URL", sp.prefix)
+            return scheduled(sp, st.session_state.get("session_id", "default")) # user calls share the app's rate limit
     
         # Step 1: No token yet — redirect user to Spotify login
         auth_url = auth_manager.get_authorize_url()
         st.markdown(f"[Click here to log in to Spotify]({auth_url})")
         st.stop()  # halt execution until user returns with code
     except Exception as e:
-        print(f"[ERROR] Failed to initialise Spotify client for user: {e}")
+        log.error("Failed to initialise Spotify client for user", extra=fields(error=e))
         raise
 
 # method for playlist creation
-def create_playlist(playlist_name, description):
-    # CREATES PLAYLIST FOR USER
-    print("\n[STEP] CREATING PLAYLIST FOR USER")
+def create_playlist(playlist_name, description, tracks=None):
+    # CREATES PLAYLIST FOR USER, FROM tracks OR THIS SESSION'S RANKED TRACKS
+    log.info("Creating playlist for user...")
+    if tracks is None:
+        tracks = st.session_state.get("ranked_tracks", []) # this session's playlist, never another user's
     sp = get_spotify_client_for_user() # start client
 
     # user_id = sp.current_user()["id"] # get user id # NOTE: no longer needed because of migration 9/3/25
@@ -216,35 +417,115 @@ def create_playlist(playlist_name, description):
     )
     playlist_id = playlist["id"] # get playlist id
     playlist_url = playlist["external_urls"]["spotify"] # get playlist url
-    print(f"[INFO] Created playlist: {playlist_id} - {playlist_name}")
+    log.info("Created playlist", extra=fields(id=playlist_id, name=playlist_name))
 
     # Adding tracks to the playlist created
-    # Opening and reading the JSON file
-    with open('ranked_tracks.json', 'r') as f:
-        # Parsing the JSON file into a Python dictionary
-        data = json.load(f)
-
     uris = []
-    for d in data:
-        uris.append(d["uri"])
+    for d in tracks:
+        if d.get("uri"): # tracks Spotify couldn't fill in have no uri
+            uris.append(d["uri"])
 
-    sp.playlist_add_items(
-        playlist_id = playlist_id,
-        items = uris
-    )
+    added = write_playlist_items(sp, playlist_id, uris) # 100 per request, so large playlists work too
 
-    print("\n[RESULT] Sucessfully added tracks to playlist")
+    log.info("Successfully added tracks to playlist", extra=fields(tracks=added))
 
     return playlist_url # open playlist in a new tab
 
-# method that gets track IDs concurrently and adds to JSON list of songs
+# method that adds tracks to a new, empty playlist in chunks of 100, safely even if an add request is retried
+def write_playlist_items(sp, playlist_id, uris, concurrency=PLAYLIST_WRITE_CONCURRENCY):
+    # ADDS EVERY URI ONCE, IN ORDER, AND RETURNS HOW MANY ARE IN THE PLAYLIST
+    # chunks are sent concurrently, so they can land in any order, and a request that timed out or was retried after
+    # a 5xx may or may not have been applied; instead of trusting each response, the playlist is read back and
+    # repaired: repeated chunks are removed, lost chunks are added again, and chunks are moved back into order
+    uris = list(dict.fromkeys(uris)) # two candidates can resolve to the same track
+    chunks = [uris[i:i + PLAYLIST_CHUNK] for i in range(0, len(uris), PLAYLIST_CHUNK)]
+    if not chunks:
+        return 0
+
+    def _add(chunk):
+        try:
+            sp.playlist_add_items(playlist_id=playlist_id, items=chunk)
+        except Exception as e: # the read-back decides whether it needs sending again
+            log.warning("Playlist add request failed", extra=fields(items=len(chunk), error=e))
+
+    pending = chunks
+    for attempt in range(PLAYLIST_WRITE_ATTEMPTS):
+        if len(pending) == 1 or concurrency <= 1:
+            for chunk in pending:
+                _add(chunk)
+        else:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(pending))) as ex:
+                for f in [ex.submit(in_context(_add), chunk) for chunk in pending]: # each worker call needs its own context copy
+                    f.result()
+        pending = _repair_playlist(sp, playlist_id, chunks)
+        if not pending:
+            return len(uris)
+        log.warning("Playlist is missing chunks, adding them again", extra=fields(missing=len(pending), attempt=attempt + 1))
+    raise RuntimeError(f"Playlist {playlist_id} is still missing {len(pending)} chunks after {PLAYLIST_WRITE_ATTEMPTS} attempts")
+
+def _read_playlist_uris(sp, playlist_id):
+    # RETURNS EVERY URI IN A PLAYLIST, IN ORDER, READING THE PAGES CONCURRENTLY
+    def _page(offset):
+        return sp.playlist_items(playlist_id, limit=PLAYLIST_CHUNK, offset=offset, fields="items(track(uri)),total")
+
+    first = _page(0)
+    pages = [first]
+    offsets = range(PLAYLIST_CHUNK, first["total"], PLAYLIST_CHUNK)
+    if offsets:
+        with ThreadPoolExecutor(max_workers=PLAYLIST_WRITE_CONCURRENCY) as ex:
+            pages += [f.result() for f in [ex.submit(in_context(_page), offset) for offset in offsets]]
+    return [item["track"]["uri"] for page in pages for item in page["items"] if item.get("track")]
+
+def _repair_playlist(sp, playlist_id, chunks):
+    # READS THE PLAYLIST BACK, REMOVES REPEATED CHUNKS AND PUTS THE OTHERS IN ORDER; RETURNS THE CHUNKS THAT ARE MISSING
+    current = _read_playlist_uris(sp, playlist_id)
+    first_uri = {chunk[0]: n for n, chunk in enumerate(chunks)}
+    blocks = [] # (chunk number, position) of every whole chunk in the playlist, in playlist order
+    position = 0
+    while position < len(current):
+        n = first_uri.get(current[position])
+        if n is None or current[position:position + len(chunks[n])] != chunks[n]:
+            raise RuntimeError(f"Playlist {playlist_id} has unexpected items at position {position}") # edited by someone else
+        blocks.append((n, position))
+        position += len(chunks[n])
+
+    order, repeats = [], [] # chunk numbers in playlist order, and (chunk, position) of second copies
+    for n, position in blocks:
+        if n in order:
+            repeats.append((n, position))
+        else:
+            order.append(n)
+    for n, position in reversed(repeats): # last first, so the positions of the earlier ones stay valid
+        sp.playlist_remove_specific_occurrences_of_items(
+            playlist_id, [{"uri": uri, "positions": [position + i]} for i, uri in enumerate(chunks[n])])
+    if repeats:
+        log.warning("Removed repeated playlist chunks", extra=fields(chunks=len(repeats)))
+
+    missing = [chunks[n] for n in range(len(chunks)) if n not in order]
+    if missing: # they'll be appended, then this runs again and puts everything in order
+        return missing
+
+    moves = 0
+    for target in range(len(chunks)): # move each chunk, as one block, to where it belongs
+        current_index = order.index(target)
+        if current_index == target:
+            continue
+        sp.playlist_reorder_items(playlist_id, range_start=sum(len(chunks[n]) for n in order[:current_index]),
+                                  insert_before=sum(len(chunks[n]) for n in order[:target]), range_length=len(chunks[target]))
+        order.insert(target, order.pop(current_index))
+        moves += 1
+    if moves:
+        log.info("Put playlist chunks back in order", extra=fields(moves=moves))
+    return []
+
 def get_track_ids_parallel(sp, tracks):
     # Parallel version of get_track_ids()
     # RETRIEVES LIST OF TRACK IDS
-    print("\n[STEP] RETRIEVING TRACK IDS")
+    log.info("Retrieving track IDs...")
 
     try:
         valid_tracks = [] # we'll be adding to this list since we only want track have IDs for
+        expect("search", len(tracks["tracks"]))
 
         def _search_one(t): # helper function that searches for 1 Spotify track
             artists = t["artists"] # get the artists from dictionary
@@ -253,42 +534,54 @@ def get_track_ids_parallel(sp, tracks):
             return t, track_id # return both the original track dictionary and retrieved ID, that way we can attach the ID later
 
         # create a pool of worker threads, max_workers is how many run at once - in this case, 10
-        with ThreadPoolExecutor(max_workers=10) as ex:
-            # submit all track searches to run in parallel
-            futures = [] # initial list of Future objects
-            for t in tracks["tracks"]:
-                future = ex.submit(_search_one, t) # start the function in a new thread, which returns a Future object
-                futures.append(future) # collect returned Future object and store in a list
-
-            # iterate over results as soon as each thread finishes
-            for f in as_completed(futures):
+        ex = ThreadPoolExecutor(max_workers=10)
+        # submit all track searches to run in parallel
+        futures = [] # initial list of Future objects
+        for t in tracks["tracks"]:
+            future = ex.submit(in_context(_search_one), t) # start the function in a new thread, which returns a Future object
+            futures.append(future) # collect returned Future object and store in a list
+
+        try:
+            # iterate over results as soon as each thread finishes, until the request's search budget runs out
+            for f in as_completed(futures, timeout=remaining("search")):
                 # as_completed(...) yields futures in the order they finish, not the order they started
-                t, track_id = f.result() # unpack the tupled result
+                try:
+                    t, track_id = f.result() # unpack the tupled result
+                except Exception as e: # one failed search doesn't lose the others
+                    log.warning("Track search failed", extra=fields(error=e))
+                    continue
                 if track_id: # if the id exists
-                    print("[INFO] Adding ID to JSON...")
                     t["ID"] = track_id
                     valid_tracks.append(t)
                 else:
-                    print("[INFO] ID was not found so no ID was added.")
+                    log.debug("ID was not found so no ID was added", extra=fields(track=t["track"]))
+        except FuturesTimeout: # out of time, rank whatever was found
+            log.warning("Track search deadline reached", extra=fields(unfinished=sum(not f.done() for f in futures)))
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True) # don't wait for stragglers, and drop searches not started yet
 
         # we need to guarantee at least 1 ID, so if there's none we will use The Weeknd's Blinding Lights' ID, since it is the biggest song on Spotify
         if not valid_tracks:
-            print("[INFO] No IDs were found at all. Using Blinding Lights as backup...")
-            valid_tracks.append({
-                "artists": "The Weeknd",
-                "track": "Blinding Lights",
-                "description": "",
-                "ID": "0VjIjW4GlUZAMYd2vXMi3b"
-            })
-
-        print(f"\n[RESULT] Retrieved IDs for {len(valid_tracks)} out of {len(tracks["tracks"])} tracks:")
+            log.warning("No IDs were found at all. Using Blinding Lights as backup...")
+            valid_tracks.append(dict(FALLBACK_TRACK))
+
+        log.info("Retrieved track IDs", extra=fields(found=len(valid_tracks), total=len(tracks["tracks"])))
         # format returning tracks
         valid_tracks_formatted = {
             "tracks": valid_tracks
         }
-        print(json.dumps(valid_tracks_formatted,indent=2))
+        log.debug("Search cache stats", extra=fields(**get_search_cache_stats()))
+        log.debug("Catalog stats", extra=fields(**get_catalog_stats()))
         save(valid_tracks_formatted, "candidate_tracks_with_ids.json") # save json file for debugging
         return valid_tracks_formatted
     except Exception as e:
-        print(f"[ERROR] Unexpected error in get_track_ids_parallel: {e}")
+        log.error("Unexpected error in get_track_ids_parallel", extra=fields(error=e))
         raise
+
+# method that reports how many Spotify searches the cache has saved
+def get_search_cache_stats():
+    return search_cache.stats() # hits are Spotify round-trips we didn't make
+
+# method that reports how many Spotify Get Track calls the cache has saved
+def get_track_cache_stats():
+    return track_cache.stats()
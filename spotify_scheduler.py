@@ -0,0 +1,192 @@
+import os # for configuration from environment variables
+import time # for the token bucket and pauses
+import threading # the dispatcher runs on a background thread
+from collections import OrderedDict, deque # per-session queues, served round-robin
+import spotipy # for SpotifyException
+from debugging import get_logger, fields
+from deadline import cancelled, DeadlineExceeded # callers that gave up on a call
+
+log = get_logger("scheduler")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504} # responses that mean "back off and try again"
+
+class SpotifyScheduler: # process-wide gatekeeper for every Spotify call: token bucket, adaptive concurrency, Retry-After and fair sharing
+    def __init__(self, rate, burst, max_concurrency, min_concurrency=1, max_retries=3):
+        self.rate = rate # tokens (requests) added per second, sized to our quota
+        self.burst = burst # bucket size, how many requests can go out back to back
+        self.max_concurrency = max_concurrency # ceiling for in-flight requests
+        self.min_concurrency = min_concurrency # floor when backing off
+        self.max_retries = max_retries # retries for 429/5xx before giving up
+
+        self.concurrency = max_concurrency # current adaptive limit (halved on throttling, +1 after a window of successes)
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0 # monotonic time before which nothing is sent (from Retry-After)
+        self.in_flight = 0
+        self._successes = 0 # successes since the last concurrency change
+        self._last_backoff = 0.0 # so a burst of 429s from requests already in flight only halves the limit once
+        self._queues = OrderedDict() # session id -> deque of waiting tickets, rotated for round-robin
+        self._cond = threading.Condition()
+        self._dispatcher = None
+
+        # counters for metrics()
+        self.completed = 0
+        self.dropped = 0 # calls whose caller gave up while they were queued, so they were never sent
+        self.throttle_events = 0 # 429 responses
+        self.server_errors = 0 # 5xx responses
+        self.retries = 0
+
+    def _start(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="spotify-scheduler", daemon=True)
+            self._dispatcher.start()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _dispatch_loop(self):
+        # GRANTS WAITING REQUESTS ONE AT A TIME, WHEN THERE IS A FREE SLOT, A TOKEN AND NO Retry-After PAUSE
+        with self._cond:
+            while True:
+                if not self._queues or self.in_flight >= self.concurrency:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                if now < self.paused_until: # Spotify told us to wait
+                    self._cond.wait(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens < 1: # wait for the next token
+                    self._cond.wait((1 - self.tokens) / self.rate)
+                    continue
+
+                session_id, tickets = next(iter(self._queues.items())) # session at the front of the rotation
+                ticket = tickets.popleft()
+                del self._queues[session_id]
+                if tickets: # move the session to the back, so every session gets a turn
+                    self._queues[session_id] = tickets
+                self.tokens -= 1
+                self.in_flight += 1
+                ticket.set()
+
+    def _acquire(self, session_id):
+        ticket = threading.Event()
+        with self._cond:
+            self._start()
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._cond.notify_all()
+        ticket.wait()
+
+    def _release(self, status=None, retry_after=None, sent=True):
+        with self._cond:
+            self.in_flight -= 1
+            if not sent: # give the token back, nothing went to Spotify
+                self.tokens = min(self.burst, self.tokens + 1)
+                self.dropped += 1
+            elif status in RETRY_STATUSES: # multiplicative decrease
+                if status == 429:
+                    self.throttle_events += 1
+                else:
+                    self.server_errors += 1
+                now = time.monotonic()
+                if now - self._last_backoff > 1.0:
+                    self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                    self._last_backoff = now
+                self._successes = 0
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                log.warning("Spotify backed us off", extra=fields(status=status, concurrency=self.concurrency,
+                                                                  pause_s=round(retry_after or 0, 1)))
+            else: # additive increase after a full window of successes
+                self.completed += 1
+                self._successes += 1
+                if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+    def call(self, session_id, fn, *args, **kwargs):
+        # RUNS fn(*args, **kwargs) WHEN THE SCHEDULER ALLOWS IT, RETRYING 429/5xx AFTER THE SERVER'S Retry-After
+        attempt = 0
+        while True:
+            self._acquire(session_id)
+            if cancelled(): # the request moved on (deadline, or a hedge answered first) while this call was queued
+                self._release(sent=False)
+                raise DeadlineExceeded("Call dropped before it was sent")
+            try:
+                result = fn(*args, **kwargs)
+            except spotipy.exceptions.SpotifyException as e:
+                if e.http_status not in RETRY_STATUSES:
+                    self._release()
+                    raise
+                retry_after = _retry_after(e, attempt)
+                self._release(e.http_status, retry_after)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                with self._cond:
+                    self.retries += 1
+                continue
+            except BaseException:
+                self._release()
+                raise
+            self._release()
+            return result
+
+    def metrics(self):
+        # RETURNS A SNAPSHOT OF THE SCHEDULER STATE
+        with self._cond:
+            return {
+                "queue_depth": sum(len(q) for q in self._queues.values()),
+                "waiting_sessions": len(self._queues),
+                "in_flight": self.in_flight,
+                "concurrency_limit": self.concurrency,
+                "tokens": round(self.tokens, 2),
+                "paused_for_s": round(max(0.0, self.paused_until - time.monotonic()), 2),
+                "completed": self.completed,
+                "throttle_events": self.throttle_events,
+                "server_errors": self.server_errors,
+                "retries": self.retries,
+                "dropped": self.dropped,
+            }
+
+def _retry_after(e, attempt):
+    # RETURNS HOW LONG TO WAIT BEFORE RETRYING: THE Retry-After HEADER IF GIVEN, OTHERWISE EXPONENTIAL BACKOFF
+    headers = e.headers or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return min(10.0, 0.5 * 2 ** attempt)
+
+class ScheduledSpotify: # wraps a spotipy client so every API method goes through the scheduler
+    def __init__(self, sp, scheduler, session_id):
+        self._sp = sp
+        self._scheduler = scheduler
+        self._session_id = session_id # used for fair sharing between streamlit sessions
+
+    def __getattr__(self, name):
+        attr = getattr(self._sp, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        def scheduled(*args, **kwargs):
+            return self._scheduler.call(self._session_id, attr, *args, **kwargs)
+        return scheduled
+
+# one scheduler for the whole process, shared by every session
+scheduler = SpotifyScheduler(
+    rate=float(os.getenv("SPOTIFY_RATE_LIMIT", 15)), # requests per second
+    burst=int(os.getenv("SPOTIFY_BURST", 30)),
+    max_concurrency=int(os.getenv("SPOTIFY_MAX_CONCURRENCY", 20)),
+)
+
+# method that routes a spotipy client's calls through the process-wide scheduler
+def scheduled(sp, session_id="default"):
+    if isinstance(sp, ScheduledSpotify):
+        return sp
+    return ScheduledSpotify(sp, scheduler, session_id)
+
+# method that returns queue depth, in-flight count and throttle events
+def get_scheduler_metrics():
+    return scheduler.metrics()
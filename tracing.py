@@ -0,0 +1,209 @@
+import os # for configuration from environment variables
+import time # for span timings
+import threading # metrics are shared by every session
+import functools # for the traced decorator
+import contextvars # carries the current request's progress into every stage
+from collections import deque # bounded window of recent timings per stage
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # optional /metrics endpoint
+import numpy as np
+
+from debugging import get_logger, fields
+
+log = get_logger("tracing")
+
+WINDOW = int(os.getenv("METRICS_WINDOW", 10000)) # percentiles are over the most recent WINDOW spans of each stage
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1") # interface the metrics server listens on, 0.0.0.0 to let other hosts scrape
+QUANTILES = (0.5, 0.95, 0.99)
+
+class StageMetrics: # duration window, totals and error count for one stage
+    def __init__(self):
+        self.durations = deque(maxlen=WINDOW)
+        self.count = 0
+        self.total = 0.0 # seconds
+        self.errors = 0
+
+class Metrics: # process-wide span timings, exportable as Prometheus text
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            m = self._stages.setdefault(stage, StageMetrics())
+            m.durations.append(seconds)
+            m.count += 1
+            m.total += seconds
+            m.errors += error
+
+    def quantile(self, stage, q, min_count=1):
+        # RETURNS ONE QUANTILE OF A STAGE'S RECENT TIMINGS, OR None WITH FEWER THAN min_count OF THEM
+        with self._lock:
+            m = self._stages.get(stage)
+            durations = list(m.durations) if m else []
+        if len(durations) < min_count:
+            return None
+        return float(np.quantile(durations, q))
+
+    def summary(self):
+        # RETURNS {stage: {"count", "errors", "p50", "p95", "p99"}} WITH TIMINGS IN SECONDS
+        with self._lock:
+            stages = {name: (list(m.durations), m.count, m.total, m.errors) for name, m in self._stages.items()}
+        result = {}
+        for name, (durations, count, total, errors) in stages.items():
+            values = np.quantile(durations, QUANTILES) if durations else [0.0] * len(QUANTILES)
+            result[name] = {"count": count, "sum": total, "errors": errors,
+                            **{f"p{int(q * 100)}": float(v) for q, v in zip(QUANTILES, values)}}
+        return result
+
+    def prometheus_text(self):
+        # RETURNS EVERY STAGE AS A PROMETHEUS SUMMARY PLUS CALL AND ERROR COUNTERS, IN THE TEXT EXPOSITION FORMAT
+        summary = self.summary()
+        lines = [
+            "# HELP playlist_stage_duration_seconds Time spent in each pipeline stage.",
+            "# TYPE playlist_stage_duration_seconds summary",
+        ]
+        for stage, s in sorted(summary.items()):
+            for q in QUANTILES:
+                lines.append(f'playlist_stage_duration_seconds{{stage="{stage}",quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'playlist_stage_duration_seconds_sum{{stage="{stage}"}} {s["sum"]:.6f}')
+            lines.append(f'playlist_stage_duration_seconds_count{{stage="{stage}"}} {s["count"]}')
+        lines += ["# HELP playlist_stage_errors_total Spans that ended with an exception.",
+                  "# TYPE playlist_stage_errors_total counter"]
+        for stage, s in sorted(summary.items()):
+            lines.append(f'playlist_stage_errors_total{{stage="{stage}"}} {s["errors"]}')
+        return "\n".join(lines) + "\n"
+
+class Progress: # completed/total units per stage for one request, read by the UI thread
+    STAGES = { # stage -> (status text, share of the progress bar)
+        "llm": ("Generating track ideas", 0.45),
+        "search": ("Finding tracks on Spotify", 0.25),
+        "fetch": ("Getting track details", 0.15),
+        "embed": ("Reading track descriptions", 0.10),
+        "rank": ("Ranking best matches", 0.05),
+    }
+
+    def __init__(self):
+        self._counts = {stage: [0, 0] for stage in self.STAGES} # stage -> [completed, total]
+        self._finished = set()
+        self._lock = threading.Lock()
+
+    def expect(self, stage, n=1):
+        with self._lock:
+            self._counts[stage][1] += n
+
+    def advance(self, stage, n=1):
+        with self._lock:
+            self._counts[stage][0] += n
+
+    def finish(self, stage):
+        # MARKS A STAGE AS COMPLETE, E.G. WHEN THE LLM RETURNS FEWER TRACKS THAN ASKED FOR
+        with self._lock:
+            self._finished.add(stage)
+
+    def snapshot(self):
+        # RETURNS {stage: (completed, total, finished)}
+        with self._lock:
+            return {stage: (c, t, stage in self._finished) for stage, (c, t) in self._counts.items()}
+
+    def fraction(self):
+        # RETURNS THE WEIGHTED SHARE OF WORK DONE, BETWEEN 0 AND 1
+        done = 0.0
+        for stage, (completed, total, finished) in self.snapshot().items():
+            weight = self.STAGES[stage][1]
+            if finished:
+                done += weight
+            elif total:
+                done += weight * min(1.0, completed / total)
+        return done
+
+    def status(self):
+        # RETURNS A STATUS LINE FOR THE FIRST STAGE THAT ISN'T DONE, E.G. "Finding tracks on Spotify (12/30)"
+        for stage, (completed, total, finished) in self.snapshot().items():
+            if finished or (total and completed >= total and stage != "llm"):
+                continue
+            text = self.STAGES[stage][0]
+            return f"{text} ({completed}/{total})" if total else text
+        return "Finishing up"
+
+metrics = Metrics() # one registry for the whole process
+current_progress = contextvars.ContextVar("progress", default=None) # progress of the request this thread is working on
+
+# method that makes progress the target of every span in the current context
+def track_progress(progress):
+    current_progress.set(progress)
+
+# methods that update the current request's progress, if it has one
+def expect(stage, n=1):
+    progress = current_progress.get()
+    if progress is not None:
+        progress.expect(stage, n)
+
+def advance(stage, n=1):
+    progress = current_progress.get()
+    if progress is not None:
+        progress.advance(stage, n)
+
+def finish(stage):
+    progress = current_progress.get()
+    if progress is not None:
+        progress.finish(stage)
+
+@contextmanager
+def span(stage, units=1):
+    # TIMES THE BLOCK UNDER stage, THEN ADVANCES THE CURRENT REQUEST'S PROGRESS BY units
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe(stage, seconds, error)
+        if stage in Progress.STAGES and units:
+            advance(stage, units)
+        log.debug("Span finished", extra=fields(stage=stage, ms=round(seconds * 1000, 2), error=error))
+
+# decorator that runs the whole function inside a span
+def traced(stage):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# method that returns p50/p95/p99 and counts for every stage
+def get_stage_metrics():
+    return metrics.summary()
+
+_server = None
+_server_lock = threading.Lock()
+
+# method that serves /metrics on METRICS_HOST:METRICS_PORT for Prometheus to scrape (safe to call on every streamlit rerun)
+def start_metrics_server(port=None, host=METRICS_HOST):
+    global _server
+    port = port or os.getenv("METRICS_PORT")
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = metrics.prometheus_text().encode("utf-8") if self.path == "/metrics" else b""
+                    self.send_response(200 if self.path == "/metrics" else 404)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args): # keep scrapes out of the logs
+                    pass
+
+            _server = ThreadingHTTPServer((host, int(port)), Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            log.info("Serving metrics", extra=fields(host=host, port=port))
+        return _server
@@ -1,6 +1,11 @@
 import streamlit as st
 import json
-import time
+import uuid
+from ranking import TOP_K, MAX_PLAYLIST_SIZE # default and largest playlist size
+from candidates import SessionPool # the session's candidates, kept for refinements
+from pipeline import RETRIEVAL_MODES, RETRIEVAL_MODE # where candidates come from
+
+MODE_LABELS = {"llm": "Ask the AI", "catalog": "Tracks we already know (instant)", "hybrid": "Both"}
 
 def setup_display():
     # method that sets up the initial display for the UI
@@ -15,9 +20,34 @@ def setup_display():
             "Tell us what you want!",
             placeholder="E.g., chill indie songs for late night coding"
         )
+        fresh = st.checkbox("Surprise me", help="Skip cached playlists and ask the AI for a brand new set of tracks") # opt out of the shared result cache
+        size = st.number_input("Number of tracks", min_value=5, max_value=MAX_PLAYLIST_SIZE, value=TOP_K, step=5,
+                               help="Large playlists take longer, the AI is asked for more tracks in several rounds") # target playlist size
+        mode = st.selectbox("Find tracks by", RETRIEVAL_MODES, index=RETRIEVAL_MODES.index(RETRIEVAL_MODE), format_func=MODE_LABELS.get,
+                            help="Tracks we already know come from earlier playlists, so no AI call is needed") # retrieval mode
         submitted = st.form_submit_button("Generate Playlist") # create a generate playlist (submit) button
     
-    return prompt, submitted # return both the user input and the submission
+    return prompt, submitted, fresh, int(size), mode # return the user input, the submission, whether to skip the cache, the size and the mode
+
+def setup_refine():
+    # method that shows a box for tweaking the current playlist, which re-ranks its candidates instead of starting again
+
+    with st.form(key="refine_form"):
+        refinement = st.text_input(
+            "Not quite right? Tweak it",
+            placeholder="E.g., same but more upbeat"
+        )
+        refined = st.form_submit_button("Refine Playlist")
+
+    return refinement, refined # return the refinement and whether it was submitted
+
+def show_model_status(status):
+    # method that tells the user whether the ranking model is still loading
+
+    if status == "loading":
+        st.caption("Warming up the ranking model in the background...")
+    elif status == "failed":
+        st.warning("The ranking model failed to load, it will be retried on the next playlist.")
 
 def display_tracks(session_state_tracks):
     # method that displays tracks after user inputs a prompt
@@ -29,7 +59,8 @@ def display_tracks(session_state_tracks):
         with cols[i % 4]: # within the current column index; i % 4 gives 0-3, which gives 4 tracks per row
             with st.container(border=True): # within the column border (creates a visual card container with a border)
                 # display the necessary track information
-                st.image(track["album_cover"],width="stretch") # expands image to fill the container width
+                if track.get("album_cover"): # albums without artwork have no cover
+                    st.image(track["album_cover"],width="stretch") # expands image to fill the container width
                 st.write(f"{track['track']}")
                 st.caption(track["artists"])
                 st.markdown(f"[Listen in Spotify]({track['spotify_url']})")
@@ -40,29 +71,22 @@ def initialise_session_state():
         st.session_state.generated = False # playlist has not been generated so set boolean to False
     if "ranked_tracks" not in st.session_state:
         st.session_state.ranked_tracks = [] # playlist has not been generated so set session ranked tracks to empty list
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex # identifies this session to the Spotify scheduler for fair sharing
+    if "pool" not in st.session_state:
+        st.session_state.pool = SessionPool() # candidates and query of the current playlist, so refinements can re-rank them
 
 class ProgressUI: # controller for progress bar and status text updates while a background task runs
-    def __init__(self): # UI elements for progress and timer
+    def __init__(self, progress): # UI elements for progress, driven by the pipeline's real stage counts
+        self.progress = progress # tracing.Progress, updated by the background thread
         self.status = st.empty() # creates an empty placeholder in UI that will be replaced with status messages
         self.progress_bar = st.progress(0) # creates a progress bar inititalised at 0%, to be updated as the playlist generates
-        self.start = time.time() # stores the current time so we can calculate how long generation takes
         self.status.markdown("**Starting...**") # display the initial status message to user
 
-    def update(self): # update progress and status message based on elapsed time
-        elapsed = time.time() - self.start # calculate how many seconds have passes since generation started
-
-        pct = min(0.95, elapsed / 10.0) # assuming generation takes about 10 seconds, get a value between 0 and 1, capping at 0.95 so we don't hit 1.0 before it's actually done
+    def update(self): # update progress and status message from completed/total counts per stage
+        pct = min(0.99, self.progress.fraction()) # capping at 0.99 so we don't hit 1.0 before it's actually done
         self.progress_bar.progress(int(pct * 100)) # convert decimal to percentage and update progress bar
-
-        # change status text at rough milestones
-        if elapsed < 1:
-            self.status.markdown("**Starting...**") # display the initial status message to user
-        elif elapsed < 6.5:
-            self.status.markdown("**Generating track ideas...**")
-        elif elapsed < 8.5:
-            self.status.markdown("**Finding tracks on Spotify...**")
-        else:
-            self.status.markdown("**Ranking best matches...**")
+        self.status.markdown(f"**{self.progress.status()}...**") # e.g. "Finding tracks on Spotify (12/30)..."
 
     def done(self):
         self.progress_bar.progress(100) # set progress to 100%
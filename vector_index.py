@@ -0,0 +1,319 @@
+import os # for file paths and sizes
+import re # for folder names
+import sys # for the command line entry point
+import json # for the metadata file and stored tracks
+import math # for sizing the inverted lists
+import fcntl # for locking the files between processes
+import sqlite3 # track data for every indexed row
+import argparse # for the maintenance commands
+import threading # for sharing one index between streamlit sessions
+import numpy as np # vectors are stored as a float32 matrix
+
+from cache import CACHE_DIR # shared cache folder
+from candidates import CandidateTable, FIELDS # indexed rows come back as a candidate table with their embeddings
+from ranking import normalise_rows, top_k # unit-length rows and partial top-k selection
+from debugging import get_logger, fields
+
+log = get_logger("vector_index")
+
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "1") == "1" # index every resolved, embedded track for local retrieval
+NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", 8)) # inverted lists scanned per query, more is slower but misses fewer neighbours
+MIN_TRAIN_ROWS = int(os.getenv("VECTOR_INDEX_MIN_TRAIN", 2000)) # below this every query is an exact scan, which is fast enough
+RETRAIN_FACTOR = 4 # the lists are retrained once the index has grown this many times over since they were trained
+TRAIN_SAMPLES_PER_LIST = 40 # rows sampled per list to train the centroids
+KMEANS_ITERATIONS = 10
+REBUILD_MIN_TAIL = 1000 # rows added since the lists were built are scanned separately until there are this many...
+REBUILD_TAIL_RATIO = 0.05 # ...or this share of the index, then the lists are rebuilt
+CHUNK_ROWS = 65536 # rows scored or assigned at a time, so memory doesn't grow with the index
+SQL_CHUNK = 500 # values per IN (...) query, well under SQLite's variable limit
+INDEX_VERSION = 1 # bump when the file layout changes
+
+def list_count(rows):
+    # RETURNS THE NUMBER OF INVERTED LISTS FOR AN INDEX OF rows VECTORS (ABOUT sqrt(rows), SO A LIST AND THE CENTROIDS COST THE SAME TO SCAN)
+    return max(1, int(math.sqrt(rows)))
+
+def train_centroids(sample, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    # RETURNS nlist UNIT-LENGTH CENTROIDS FROM SPHERICAL K-MEANS OVER THE (UNIT-LENGTH) SAMPLE ROWS
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)] # restart empty lists on random rows
+        centroids = normalise_rows(sums)
+    return centroids
+
+def assign_lists(vectors, centroids):
+    # RETURNS THE NEAREST CENTROID OF EVERY ROW AS int32, CHUNK BY CHUNK
+    result = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), CHUNK_ROWS):
+        result[start:start + CHUNK_ROWS] = np.argmax(np.asarray(vectors[start:start + CHUNK_ROWS]) @ centroids.T, axis=1)
+    return result
+
+class VectorIndex: # persistent approximate nearest-neighbour index (IVF) over every resolved track, memory-mapped and appended to in place
+    # layout of the index folder (one folder per model, like the embedding cache):
+    #   vectors.f32     - unit-length embeddings one after another as raw float32, row i starts at byte i * dim * 4
+    #   lists.i32       - the inverted list (nearest centroid) of every row as int32, -1 until the lists are trained
+    #   centroids.npy   - one unit-length centroid per list
+    #   tracks.sqlite3  - row -> track ID and track data; a row only counts once it is committed here
+    #   meta.json       - model name, dimension, list count and how many rows the lists were trained on
+    #   .lock           - file lock so several processes can add safely
+    # queries scan the nprobe lists whose centroids are closest to the query; rows added since the lists were built are kept
+    # in a small tail that is scanned too, and the lists are retrained in the background as the index grows
+    def __init__(self, folder, model_name):
+        self.model_name = model_name
+        self.folder = os.path.join(folder, re.sub(r"[^\w.-]", "_", model_name)) # e.g. .cache/index/BAAI_bge-small-en-v1.5
+        os.makedirs(self.folder, exist_ok=True)
+        self.vectors_path = os.path.join(self.folder, "vectors.f32")
+        self.lists_path = os.path.join(self.folder, "lists.i32")
+        self.centroids_path = os.path.join(self.folder, "centroids.npy")
+        self.meta_path = os.path.join(self.folder, "meta.json")
+        self.lock_path = os.path.join(self.folder, ".lock")
+
+        self.dim = None # embedding size, known after the first add
+        self.trained_rows = 0 # rows the current centroids were trained on, 0 if the lists aren't trained
+        self.searches = 0 # queries answered
+        self.exact_searches = 0 # queries answered by scanning every row
+        self.scanned = 0 # rows scored over every query
+        self._centroids = None # (nlist, dim) float32
+        self._vectors = None # memory map over vectors.f32
+        self._lists = None # memory map over lists.i32
+        self._rows = 0 # complete rows in both files
+        self._lists_inode = None # changes when the lists are retrained, which means we need to reload
+        self._order = None # row numbers sorted by list, for the first _built rows
+        self._bounds = None # _order[_bounds[l]:_bounds[l + 1]] are the rows of list l
+        self._built = 0 # rows covered by _order, later rows are the tail
+        self._training = False
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(os.path.join(self.folder, "tracks.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tracks (row INTEGER PRIMARY KEY, id TEXT UNIQUE, data TEXT)")
+        self._conn.commit()
+
+    def _file_lock(self, exclusive):
+        # RETURNS AN OPEN LOCK FILE HOLDING A SHARED OR EXCLUSIVE LOCK (CLOSE IT TO RELEASE)
+        f = open(self.lock_path, "a")
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return f
+
+    def _refresh(self):
+        # PICKS UP ROWS ADDED BY OTHER PROCESSES (OR RELOADS THE LISTS AFTER A RETRAIN) AND REBUILDS THE LISTS WHEN THE TAIL IS LONG
+        if not os.path.exists(self.meta_path):
+            return
+        inode = os.stat(self.lists_path).st_ino if os.path.exists(self.lists_path) else None
+        if inode != self._lists_inode or self.dim is None:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim, self.trained_rows = meta["dim"], meta["trained_rows"]
+            self._centroids = np.load(self.centroids_path) if self.trained_rows else None
+            self._lists_inode = inode
+            self._vectors = self._lists = self._order = None
+            self._rows = self._built = 0
+
+        rows = min(os.path.getsize(self.vectors_path) // (self.dim * 4) if os.path.exists(self.vectors_path) else 0,
+                   os.path.getsize(self.lists_path) // 4 if os.path.exists(self.lists_path) else 0)
+        if rows != self._rows and rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            self._lists = np.memmap(self.lists_path, dtype=np.int32, mode="r", shape=(rows,))
+        self._rows = rows
+        if self._centroids is not None and (self._order is None or rows - self._built > max(REBUILD_MIN_TAIL, REBUILD_TAIL_RATIO * rows)):
+            lists = np.asarray(self._lists[:rows])
+            self._order = np.argsort(lists, kind="stable").astype(np.int64) # rows of each list stay in file order, for the memory map
+            self._bounds = np.searchsorted(lists[self._order], np.arange(len(self._centroids) + 1))
+            self._built = rows
+
+    def _select(self, sql, values):
+        # RETURNS THE ROWS OF sql (WITH ONE {} FOR THE IN LIST) FOR EVERY VALUE, SQL_CHUNK VALUES PER QUERY
+        result = []
+        for start in range(0, len(values), SQL_CHUNK):
+            chunk = values[start:start + SQL_CHUNK]
+            result.extend(self._conn.execute(sql.format(",".join("?" * len(chunk))), chunk))
+        return result
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._rows
+
+    def add(self, table):
+        # ADDS THE ROWS OF A CandidateTable THAT ARE RESOLVED (A TRACK ID AND SPOTIFY DATA) AND EMBEDDED BUT NOT INDEXED YET,
+        # RETURNS HOW MANY WERE ADDED
+        if table.embeddings is None or not len(table):
+            return 0
+        columns = table.columns
+        picked = {} # track id -> row of table, the first of any repeats
+        for i, track_id in enumerate(columns["ID"]):
+            if track_id and columns["description"][i] and columns["spotify_url"][i]:
+                picked.setdefault(track_id, i)
+        if not picked:
+            return 0
+
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh() # another process may have added the same tracks, or retrained the lists
+            indexed = {track_id for track_id, in self._select("SELECT id FROM tracks WHERE id IN ({})", list(picked))}
+            new = [(track_id, i) for track_id, i in picked.items() if track_id not in indexed]
+            if not new:
+                return 0
+            vectors = normalise_rows(table.embeddings[[i for _, i in new]])
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"version": INDEX_VERSION, "model": self.model_name, "dim": self.dim, "nlist": 0, "trained_rows": 0}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Index holds {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            start = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM tracks").fetchone()[0]
+            for path, width in ((self.vectors_path, self.dim * 4), (self.lists_path, 4)): # drop any half-written rows of a crashed add
+                if os.path.exists(path) and os.path.getsize(path) != start * width:
+                    os.truncate(path, start * width)
+            lists = assign_lists(vectors, self._centroids) if self._centroids is not None else np.full(len(new), -1, dtype=np.int32)
+            with open(self.vectors_path, "ab") as f: # vectors and lists first, so a committed row never points at missing data
+                f.write(vectors.tobytes())
+            with open(self.lists_path, "ab") as f:
+                f.write(lists.tobytes())
+            self._conn.executemany("INSERT INTO tracks (row, id, data) VALUES (?, ?, ?)", [
+                (start + n, track_id, json.dumps({field: columns[field][i] for field in FIELDS if columns[field][i] is not None}, ensure_ascii=False))
+                for n, (track_id, i) in enumerate(new)
+            ])
+            self._conn.commit()
+            self._lists_inode = os.stat(self.lists_path).st_ino # our own append, not a retrain
+            self._refresh()
+            rows = self._rows
+
+        log.debug("Indexed tracks", extra=fields(added=len(new), rows=rows))
+        if self.needs_training(rows):
+            self.train_in_background()
+        return len(new)
+
+    def needs_training(self, rows):
+        return rows >= MIN_TRAIN_ROWS and (not self.trained_rows or rows >= RETRAIN_FACTOR * self.trained_rows)
+
+    def train_in_background(self):
+        # RETRAINS THE LISTS ON A BACKGROUND THREAD, SO THE REQUEST THAT GREW THE INDEX DOESN'T WAIT FOR IT
+        with self._lock:
+            if self._training:
+                return
+            self._training = True
+
+        def _train():
+            try:
+                self.train()
+            except Exception as e:
+                log.error("Failed to train the vector index", extra=fields(error=e))
+            finally:
+                self._training = False
+
+        threading.Thread(target=_train, name="vector-index-train", daemon=True).start()
+
+    def train(self, nlist=None):
+        # TRAINS THE CENTROIDS ON A SAMPLE OF THE ROWS AND REASSIGNS EVERY ROW TO ITS LIST, RETURNS THE NUMBER OF LISTS
+        # the slow part runs on a snapshot without holding the file lock; only rows added meanwhile are assigned under it
+        with self._lock:
+            self._refresh()
+            rows, vectors = self._rows, self._vectors
+        if not rows:
+            return 0
+        nlist = min(nlist or list_count(rows), rows)
+        log.info("Training vector index", extra=fields(rows=rows, lists=nlist))
+        rng = np.random.default_rng(0)
+        sample = np.asarray(vectors[np.sort(rng.choice(rows, min(rows, nlist * TRAIN_SAMPLES_PER_LIST), replace=False))])
+        centroids = train_centroids(sample, nlist)
+        lists = assign_lists(vectors, centroids)
+
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            if self._rows > rows: # added while we were training
+                lists = np.concatenate([lists, assign_lists(self._vectors[rows:self._rows], centroids)])
+            np.save(self.centroids_path + ".tmp.npy", centroids)
+            with open(self.lists_path + ".tmp", "wb") as f:
+                f.write(lists.tobytes())
+            with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "model": self.model_name, "dim": self.dim, "nlist": nlist, "trained_rows": len(lists)}, f)
+            os.replace(self.centroids_path + ".tmp.npy", self.centroids_path)
+            os.replace(self.meta_path + ".tmp", self.meta_path)
+            os.replace(self.lists_path + ".tmp", self.lists_path) # last: other processes notice the new inode and reload all three
+            self._lists_inode = None
+            self._refresh()
+        log.info("Trained vector index", extra=fields(rows=len(lists), lists=nlist))
+        return nlist
+
+    def search(self, query, k, nprobe=NPROBE, exact=False):
+        # RETURNS (rows, cosine similarities) OF THE k INDEXED VECTORS CLOSEST TO query, HIGHEST FIRST
+        # exact=True (or an untrained index) scores every row instead of the nprobe closest lists
+        query = normalise_rows(query)
+        with self._lock:
+            self._refresh()
+            rows, vectors, lists, centroids = self._rows, self._vectors, self._lists, self._centroids
+            order, bounds, built = self._order, self._bounds, self._built
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        if exact or centroids is None or nprobe >= len(centroids):
+            found, scores = [], []
+            for start in range(0, rows, CHUNK_ROWS):
+                chunk_scores = np.asarray(vectors[start:start + CHUNK_ROWS]) @ query
+                best = top_k(chunk_scores, k)
+                found.append(best + start)
+                scores.append(chunk_scores[best])
+            candidates, scores = np.concatenate(found), np.concatenate(scores)
+            self.exact_searches += 1
+            scanned = rows
+        else:
+            probe = top_k(centroids @ query, nprobe)
+            parts = [order[bounds[l]:bounds[l + 1]] for l in probe]
+            if rows > built: # rows added since the lists were built
+                tail = np.arange(built, rows)
+                parts.append(tail[np.isin(lists[built:rows], probe)])
+            candidates = np.sort(np.concatenate(parts)) # in file order, so the memory map is read front to back
+            scores = np.asarray(vectors[candidates]) @ query
+            scanned = len(candidates)
+        self.searches += 1
+        self.scanned += scanned
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def lookup(self, query, k, nprobe=NPROBE):
+        # RETURNS THE k INDEXED TRACKS CLOSEST TO query AS A CandidateTable WITH THEIR EMBEDDINGS, CLOSEST FIRST
+        rows, _ = self.search(query, k, nprobe)
+        if not len(rows):
+            return CandidateTable.from_tracks([], np.zeros((0, self.dim or 0), dtype=np.float32))
+        with self._lock:
+            data = dict(self._select("SELECT row, data FROM tracks WHERE row IN ({})", [int(r) for r in rows]))
+            vectors = self._vectors
+        rows = [int(r) for r in rows if int(r) in data] # a row whose add never committed is skipped
+        return CandidateTable.from_tracks([json.loads(data[r]) for r in rows], np.asarray(vectors[rows]))
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "rows": self._rows,
+                "lists": 0 if self._centroids is None else len(self._centroids),
+                "trained_rows": self.trained_rows,
+                "tail": self._rows - self._built if self._centroids is not None else self._rows,
+                "searches": self.searches,
+                "exact_searches": self.exact_searches,
+                "mean_scanned": self.scanned / self.searches if self.searches else 0.0,
+            }
+
+def main(argv=None):
+    # COMMAND LINE: python vector_index.py train / python vector_index.py stats
+    parser = argparse.ArgumentParser(description="Maintain the local vector index of resolved tracks.")
+    parser.add_argument("command", choices=["train", "stats"])
+    parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    parser.add_argument("--folder", default=os.path.join(CACHE_DIR, "index"))
+    parser.add_argument("--lists", type=int, default=None, help="inverted lists to train, about sqrt(rows) by default")
+    args = parser.parse_args(argv)
+
+    index = VectorIndex(args.folder, args.model)
+    if args.command == "train":
+        print(f"[RESULT] Trained {index.train(args.lists)} lists over {len(index)} rows")
+    else:
+        print(json.dumps(index.stats(), indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())